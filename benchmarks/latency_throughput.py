@@ -0,0 +1,350 @@
+"""Measures the latency and the throughput of calls made through a Thing.
+
+A Server is started for each scenario, with representative shared objects, and
+clients call them from their own threads. Each scenario changes one thing, out of:
+the transport, the size of the payload, the number of clients, the number of
+shared objects, and whether the methods take the lock of the object. In the
+locking scenarios, each call takes the lock and then releases it, in two round trips.
+
+The results are printed as a table, and can be written to a JSON file. Given the
+file of an earlier run, e.g. of another commit, the change of each result is shown.
+
+Usage:
+    python benchmarks/latency_throughput.py --output results.json
+    python benchmarks/latency_throughput.py --compare results.json --quick
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import zmq
+
+from caniusethat.shareable import (
+    Server,
+    acquire_lock,
+    release_lock,
+    you_can_use_this,
+)
+from caniusethat.thing import Thing
+
+TRANSPORTS = ["inproc", "ipc", "tcp"]
+PAYLOAD_SIZES = [16, 1024, 64 * 1024, 1024**2, 16 * 1024**2, 256 * 1024**2]
+CLIENT_COUNTS = [1, 4, 16]
+OBJECT_COUNTS = [1, 10, 100]
+# The large payloads get fewer calls, so that each scenario moves about this much.
+BYTES_PER_SCENARIO = 1024**3
+MIN_CALLS = 10
+TCP_PORT = 6560
+# How long the clients wait for each other before the measured calls, in seconds.
+START_TIMEOUT = 60
+
+
+class Echo:
+    @you_can_use_this
+    def echo(self, data: Any) -> Any:
+        """Returns the data unchanged."""
+        return data
+
+
+class LockedEcho:
+    @you_can_use_this
+    @acquire_lock
+    def lock_and_echo(self, data: Any) -> Any:
+        """Takes the lock of the object, returning the data unchanged."""
+        return data
+
+    @you_can_use_this
+    @release_lock
+    def unlock(self) -> None:
+        """Releases the lock of the object."""
+
+
+class Scenario(NamedTuple):
+    transport: str = "tcp"
+    payload_size: int = 16
+    clients: int = 1
+    objects: int = 1
+    locking: bool = False
+
+    @property
+    def key(self) -> str:
+        return (
+            f"{self.transport}/{self.payload_size}B/{self.clients}c/"
+            f"{self.objects}o/{'locking' if self.locking else 'plain'}"
+        )
+
+
+def make_address(transport: str, index: int) -> str:
+    """Returns a new address for each scenario, as ZeroMQ closes sockets in the
+    background, and the address of the last one can still be in use."""
+    if transport == "inproc":
+        return f"inproc://caniusethat_benchmark_{index}"
+    if transport == "ipc":
+        return (
+            f"ipc://{tempfile.gettempdir()}/caniusethat_benchmark_{os.getpid()}_{index}"
+        )
+    return f"tcp://127.0.0.1:{TCP_PORT + index}"
+
+
+def percentile(sorted_values: List[float], quantile: float) -> float:
+    """Returns the nearest-rank percentile of sorted values."""
+    if not sorted_values:
+        return 0.0
+    index = min(
+        len(sorted_values) - 1, max(0, round(quantile * len(sorted_values)) - 1)
+    )
+    return sorted_values[index]
+
+
+def client(
+    address: str,
+    names: List[str],
+    scenario: Scenario,
+    calls: int,
+    warmup: int,
+    start: threading.Barrier,
+    latencies: List[float],
+    errors: List[int],
+) -> None:
+    """Calls the objects in turn, recording the latency of each round trip.
+
+    If it fails before the measured calls, the barrier is broken, so that the
+    other clients and the scenario do not wait for it forever."""
+    payload = b"x" * scenario.payload_size
+    try:
+        # One connection per client, that calls all the objects.
+        thing = Thing(names[0], address)
+    except BaseException:
+        start.abort()
+        raise
+    call = thing._make_rpc_and_validate_response
+    try:
+        for index in range(warmup + calls):
+            if index == warmup:
+                start.wait(START_TIMEOUT)
+            name = names[index % len(names)]
+            started = time.perf_counter()
+            try:
+                if scenario.locking:
+                    call(name, "lock_and_echo", payload)
+                    call(name, "unlock")
+                else:
+                    call(name, "echo", payload)
+            except RuntimeError:
+                # e.g. THING_IS_LOCKED, when the clients share a locking object.
+                if index >= warmup:
+                    errors.append(1)
+                continue
+            if index >= warmup:
+                latencies.append(time.perf_counter() - started)
+    except BaseException:
+        start.abort()
+        raise
+    finally:
+        thing.close_this_thing()
+
+
+def run_scenario(
+    scenario: Scenario, address: str, calls: int, warmup: int
+) -> Dict[str, Any]:
+    server = Server(address)
+    server.start()
+    names = [f"obj_{index}" for index in range(scenario.objects)]
+    for name in names:
+        server.add_object(name, LockedEcho() if scenario.locking else Echo())
+    time.sleep(0.5)
+
+    latencies: List[float] = []
+    errors: List[int] = []
+    calls_per_client = max(1, calls // scenario.clients)
+    start = threading.Barrier(scenario.clients + 1)
+    threads = [
+        threading.Thread(
+            target=client,
+            args=(
+                address,
+                # Each client starts from a different object.
+                names[index % len(names) :] + names[: index % len(names)],
+                scenario,
+                calls_per_client,
+                warmup,
+                start,
+                latencies,
+                errors,
+            ),
+        )
+        for index in range(scenario.clients)
+    ]
+    try:
+        for thread in threads:
+            thread.start()
+        try:
+            start.wait(START_TIMEOUT)
+        except threading.BrokenBarrierError:
+            raise RuntimeError(
+                f"A client of {scenario.key} failed before the measured calls."
+            ) from None
+        started = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+    finally:
+        server.stop()
+        server.join()
+
+    latencies.sort()
+    total_calls = len(latencies) + len(errors)
+    return {
+        "key": scenario.key,
+        **scenario._asdict(),
+        "calls": total_calls,
+        "errors": len(errors),
+        "seconds": elapsed,
+        "calls_per_second": total_calls / elapsed if elapsed else 0.0,
+        "p50_us": percentile(latencies, 0.5) * 1e6,
+        "p99_us": percentile(latencies, 0.99) * 1e6,
+    }
+
+
+def scenarios(max_payload: int, groups: Optional[List[str]]) -> List[Scenario]:
+    """Returns the scenarios of the groups, each one once, as they can overlap."""
+    transports = [
+        transport
+        for transport in TRANSPORTS
+        if transport != "ipc" or sys.platform != "win32"
+    ]
+    all_groups = {
+        "transport": [Scenario(transport=transport) for transport in transports],
+        "payload": [
+            Scenario(payload_size=size) for size in PAYLOAD_SIZES if size <= max_payload
+        ],
+        "clients": [Scenario(clients=clients) for clients in CLIENT_COUNTS],
+        "objects": [Scenario(clients=4, objects=objects) for objects in OBJECT_COUNTS],
+        "locking": [Scenario(locking=locking) for locking in [False, True]],
+    }
+    unique: Dict[str, Scenario] = {}
+    for group, group_scenarios in all_groups.items():
+        if groups is None or group in groups:
+            for scenario in group_scenarios:
+                unique.setdefault(scenario.key, scenario)
+    return list(unique.values())
+
+
+def calls_for(scenario: Scenario, calls: int) -> int:
+    return max(MIN_CALLS, min(calls, BYTES_PER_SCENARIO // scenario.payload_size))
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            check=True,
+            text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_baseline(path: str) -> Dict[str, Dict[str, Any]]:
+    with open(path) as baseline_file:
+        return {result["key"]: result for result in json.load(baseline_file)["results"]}
+
+
+def change(new: float, old: Optional[float]) -> str:
+    if not old:
+        return ""
+    return f"{(new - old) / old * 100:+.0f}%"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--calls", type=int, default=2000, help="calls measured in each scenario"
+    )
+    parser.add_argument(
+        "--warmup", type=int, default=20, help="calls made by each client beforehand"
+    )
+    parser.add_argument(
+        "--max-payload",
+        type=int,
+        default=PAYLOAD_SIZES[-1],
+        help="largest payload size, in bytes",
+    )
+    parser.add_argument(
+        "--quick",
+        action="store_true",
+        help="fewer calls and payloads up to 1 MiB, for a smoke test",
+    )
+    parser.add_argument(
+        "--group",
+        action="append",
+        choices=["transport", "payload", "clients", "objects", "locking"],
+        help="only run the scenarios of this group, can be repeated",
+    )
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="JSON file of an earlier run to compare to")
+    args = parser.parse_args()
+    # Keep the output to the results.
+    for name in ["caniusethat.shareable", "caniusethat.thing"]:
+        logging.getLogger(name).setLevel(logging.WARNING)
+    if args.quick:
+        args.calls = min(args.calls, 200)
+        args.max_payload = min(args.max_payload, 1024**2)
+
+    baseline = load_baseline(args.compare) if args.compare else {}
+    results = []
+    header: Tuple[str, ...] = ("scenario", "calls/s", "p50 (us)", "p99 (us)", "errors")
+    if baseline:
+        header += ("calls/s", "p50", "p99")
+    print(f"{header[0]:>40}  " + "  ".join(f"{column:>12}" for column in header[1:]))
+    for index, scenario in enumerate(scenarios(args.max_payload, args.group)):
+        result = run_scenario(
+            scenario,
+            make_address(scenario.transport, index),
+            calls_for(scenario, args.calls),
+            args.warmup,
+        )
+        results.append(result)
+        row = [
+            f"{scenario.key:>40}",
+            f"{result['calls_per_second']:>12.0f}",
+            f"{result['p50_us']:>12.1f}",
+            f"{result['p99_us']:>12.1f}",
+            f"{result['errors']:>12}",
+        ]
+        old = baseline.get(scenario.key)
+        if old is not None:
+            row += [
+                f"{change(result[metric], old[metric]):>12}"
+                for metric in ("calls_per_second", "p50_us", "p99_us")
+            ]
+        print("  ".join(row))
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(
+                {
+                    "commit": git_commit(),
+                    "date": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                    "python": platform.python_version(),
+                    "pyzmq": zmq.__version__,
+                    "platform": platform.platform(),
+                    "results": results,
+                },
+                output_file,
+                indent=2,
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Measures the time the server takes to route a call, as objects get more methods.
+
+The calls are handed straight to the routing code of a server that is not running,
+so that the time of the network, of the workers and of the replies is left out.
+
+Usage:
+    python benchmarks/routing_overhead.py --calls 100000
+"""
+import argparse
+import time
+from typing import Any, List
+
+import zmq
+
+from caniusethat.rpc_utils import prepare_rpc_frames
+from caniusethat.shareable import Server, you_can_use_this
+
+SERVER_ADDRESS = "inproc://caniusethat_routing_benchmark"
+METHOD_COUNTS = [1, 10, 100, 1000]
+
+
+def make_object(method_count: int) -> Any:
+    """Builds an object with `method_count` shared methods."""
+
+    def method(self, value: int) -> int:
+        return value
+
+    methods = {
+        f"method_{index}": you_can_use_this(method) for index in range(method_count)
+    }
+    return type(f"ClassWith{method_count}Methods", (), methods)()
+
+
+def as_received(frames: List[Any]) -> List[zmq.Frame]:
+    return [zmq.Frame(frame) for frame in frames]
+
+
+def measure(server: Server, name: str, method: str, calls: int) -> float:
+    """Returns the average time in microseconds to route a call."""
+    frames = as_received(prepare_rpc_frames(name, method, (1,), {}))
+    queue = server._call_queues[name]
+    address = b"\x00client"
+
+    start = time.perf_counter()
+    for _ in range(calls):
+        server._process_incoming_rpc(address, frames)
+    elapsed = time.perf_counter() - start
+
+    # No worker takes the calls, drop them.
+    queue.pending.clear()
+    return elapsed / calls * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=100_000)
+    args = parser.parse_args()
+
+    server = Server(SERVER_ADDRESS)
+    for method_count in METHOD_COUNTS:
+        server.add_object(f"obj_{method_count}", make_object(method_count))
+    # Set the server up in this thread, without starting its loop.
+    server._task_setup()
+
+    try:
+        print("methods  first method (us)  last method (us)")
+        for method_count in METHOD_COUNTS:
+            name = f"obj_{method_count}"
+            first = measure(server, name, "method_0", args.calls)
+            last = measure(server, name, f"method_{method_count - 1}", args.calls)
+            print(f"{method_count:>7}  {first:>17.2f}  {last:>16.2f}")
+    finally:
+        server._task_cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,5 @@
-from enum import Enum, auto
-from typing import Any, Dict, List, NamedTuple, Tuple
+from enum import Enum, IntFlag, auto
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
 
 
 class SharedMethodDescriptor(NamedTuple):
@@ -32,6 +32,21 @@ class SharedObjectDescriptor(NamedTuple):
         methods: A list of SharedMethodDescriptor objects.
         locking_methods: A list of methods that acquire the object lock.
         unlocking_methods: A list of methods that release the object lock.
+        concurrent_methods: A list of methods that can run at the same time as others.
+        cacheable_methods: The time to live, in seconds or None, and the maximum
+            number of cached results of each method whose results can be cached.
+        coalescing_methods: A list of methods whose identical calls share one run.
+        lock_access: The lock group, or None for the whole object, and whether the
+            access is shared, of each method that declares them.
+        workers: The number of workers that run the calls to the object,
+            0 if the object uses the shared workers of the server.
+        separate_process: Whether the workers run in a child process.
+        max_queue: The maximum number of calls that wait for a worker or for the
+            lock, after which the calls fail with SERVER_BUSY, or None for no limit.
+        fair_scheduling: Whether the waiting calls of each client run in turn,
+            instead of in order of arrival.
+        rate_limit: The number of calls per second that each client can make,
+            after which they fail with RATE_LIMITED, or None for no limit.
     """
 
     name: str
@@ -39,22 +54,65 @@ class SharedObjectDescriptor(NamedTuple):
     shared_methods: List[SharedMethodDescriptor]
     locking_methods: List[str]
     unlocking_methods: List[str]
+    concurrent_methods: List[str]
+    cacheable_methods: Dict[str, Tuple[Optional[float], int]]
+    coalescing_methods: List[str]
+    lock_access: Dict[str, Tuple[Optional[str], bool]]
+    workers: int = 1
+    separate_process: bool = False
+    max_queue: Optional[int] = None
+    fair_scheduling: bool = False
+    rate_limit: Optional[float] = None
+
+
+class RemoteProcedureFlag(IntFlag):
+    """Options of a remote procedure call, carried in its header.
+
+    NONE: No option is set.
+    NO_ARGUMENTS: The call has no arguments, so its payload frame is empty.
+    TRACED: The client asks the server to send back the hops of the call.
+    """
+
+    NONE = 0
+    NO_ARGUMENTS = auto()
+    TRACED = auto()
+
 
+class RemoteProcedureHeader(NamedTuple):
+    """The routing information of a remote procedure call.
 
-class RemoteProcedureCall(NamedTuple):
-    """A description of a remote procedure call.
+    The header travels in its own frame, ahead of the frame holding the arguments,
+    so that the server can validate and route the call without deserializing them.
 
     Attributes:
         name: The name of the remote object.
-        method_name: The name of the method to call.
-        args: The positional arguments to pass to the method.
-        kwargs: The keyword arguments to pass to the method.
+        method: The name of the method to call.
+        flags: A combination of RemoteProcedureFlag options.
+        serializer: The name of the serializer of the arguments and of the response.
+        request_id: A number chosen by the client to match the reply to the call.
+            The reply starts with the header of its call.
+        hops: The timestamps of the hops of a traced call in the server, sent back
+            in the header of the reply, see `caniusethat.tracing`.
+        lock_timeout: How long, in seconds, the call can wait for the lock of the
+            object to be released, instead of failing with THING_IS_LOCKED.
+        timeout: How long, in seconds, the client waits for the reply. The server
+            drops the call, failing with DEADLINE_EXCEEDED, if it cannot start it
+            in time.
+        client_id: A unique name chosen by a client that sends calls again. The
+            server answers a call with the same client and request ID as one it
+            already ran with the reply of the first one, and the client keeps its
+            locks when it connects again.
     """
 
     name: str
     method: str
-    args: Tuple[Any, ...] = ()
-    kwargs: Dict[str, Any] = {}
+    flags: int = RemoteProcedureFlag.NONE
+    serializer: str = "pickle"
+    request_id: int = 0
+    hops: Optional[Dict[str, float]] = None
+    lock_timeout: Optional[float] = None
+    timeout: Optional[float] = None
+    client_id: Optional[str] = None
 
 
 class RemoteProcedureError(Enum):
@@ -66,6 +124,9 @@ class RemoteProcedureError(Enum):
     METHOD_EXCEPTION: The remote method raised an exception when called.
     INVALID_RPC: The RPC was invalid.
     THING_IS_LOCKED: The remote object is locked by another process.
+    DEADLINE_EXCEEDED: The call was dropped, as its timeout passed before it started.
+    SERVER_BUSY: Too many calls to the remote object are waiting already.
+    RATE_LIMITED: The client made more calls to the remote object than it can.
     """
 
     NO_ERROR = auto()
@@ -74,6 +135,9 @@ class RemoteProcedureError(Enum):
     METHOD_EXCEPTION = auto()
     INVALID_RPC = auto()
     THING_IS_LOCKED = auto()
+    DEADLINE_EXCEEDED = auto()
+    SERVER_BUSY = auto()
+    RATE_LIMITED = auto()
 
 
 class RemoteProcedureResponse(NamedTuple):
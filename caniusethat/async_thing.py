@@ -0,0 +1,310 @@
+import asyncio
+import itertools
+import types
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import zmq
+import zmq.asyncio
+
+from caniusethat._logging import getLogger
+from caniusethat._types import RemoteProcedureFlag, SharedMethodDescriptor
+from caniusethat.rpc_utils import (
+    prepare_rpc_frames,
+    reply_request_id,
+    validate_rpc_response,
+)
+from caniusethat.serializers import DEFAULT_SERIALIZER, choose_serializer
+from caniusethat.thing import (
+    HEARTBEATS_PER_LOCK_TTL,
+    _check_method_name,
+    _finish_trace,
+    _validate_object_description,
+)
+from caniusethat.tracing import Tracer, start_trace
+
+_logger = getLogger(__name__)
+
+
+class AsyncThing:
+    """A representation of a remote object, or `thing`, for `asyncio` applications.
+
+    The methods of the remote object are coroutines. All the calls share one
+    socket, so they can be awaited together, e.g. with `asyncio.gather`.
+
+    Attributes:
+        name: The unique name of the remote object.
+        server_address: The address of the server that is hosting the remote object.
+        serializers: The serializers to use for the calls, in order of preference.
+        timeout: The time in seconds after which a call raises `asyncio.TimeoutError`,
+            or None to wait forever. The server does not start the calls that
+            nobody waits for anymore.
+        tracer: Records the hops of a sample of the calls, see `caniusethat.tracing`.
+        lock_timeout: How long, in seconds, a call to an object locked by another
+            client waits for the lock to be released, in order of arrival, before
+            failing with THING_IS_LOCKED. If None, it fails at once.
+
+    If the locks of the server expire, see `Server`, a heartbeat renews the locks
+    held by the `AsyncThing` in the background, until it is closed. After three
+    heartbeats without a reply, the socket is made again, and the calls waiting
+    for a reply fail with `ConnectionError`.
+
+    Example:
+        >>> from caniusethat.async_thing import AsyncThing
+        >>> async with AsyncThing("remote_calculator", "tcp://127.0.0.1:6555") as my_thing:
+        ...     await asyncio.gather(my_thing.add(2, 3), my_thing.add(4, 5))
+        [5, 9]
+    """
+
+    _RESERVED_NAMES = [
+        "available_methods",
+        "call",
+        "call_with_timeout",
+        "close_this_thing",
+        "connect",
+    ]
+    _LINGER_TIME = 1000  # ms
+    # The connection is lost after this many heartbeats without a reply.
+    _HEARTBEAT_LIVENESS = 3
+
+    def __init__(
+        self,
+        name: str,
+        server_address: str,
+        serializers: Sequence[str] = (DEFAULT_SERIALIZER,),
+        timeout: Optional[float] = None,
+        tracer: Optional[Tracer] = None,
+        lock_timeout: Optional[float] = None,
+    ) -> None:
+        self.name = name
+        self.server_address = server_address
+        self.serializers = list(serializers)
+        self.timeout = timeout
+        self.tracer = tracer
+        self.lock_timeout = lock_timeout
+        self._serializer = DEFAULT_SERIALIZER
+        self._methods: List[SharedMethodDescriptor] = []
+        self._pending: Dict[
+            int, Tuple[asyncio.Future, str, Optional[Dict[str, Any]]]
+        ] = {}
+        self._request_ids = itertools.count(1)
+        self._socket: Optional[zmq.asyncio.Socket] = None
+        self._receiver: Optional[asyncio.Task] = None
+        self._heartbeat: Optional[asyncio.Task] = None
+
+    async def __aenter__(self) -> "AsyncThing":
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close_this_thing()
+
+    async def connect(self) -> None:
+        """Connects to the server and adds the methods of the remote object."""
+        _logger.info(f"Connecting to 👀 caniusethat server at {self.server_address}...")
+        self._open_socket()
+
+        try:
+            if self.serializers != [DEFAULT_SERIALIZER]:
+                supported = await self._call("_server", "get_serializers")
+                self._serializer = choose_serializer(self.serializers, supported)
+            self._methods = _validate_object_description(
+                await self._call("_server", "get_object_methods", self.name)
+            )
+            for name, signature, docstring in self._methods:
+                _check_method_name(name, self._RESERVED_NAMES)
+                _logger.debug(f"Adding method {name}({signature})")
+                method_fn = self._make_method_fn(name)
+                method_fn.__name__ = name
+                method_fn.__signature__ = signature  # type: ignore
+                method_fn.__doc__ = signature + "\n" + docstring
+                setattr(self, name, types.MethodType(method_fn, self))
+            lock_ttl = await self._call("_server", "renew_locks")
+            if lock_ttl is not None:
+                self._heartbeat = asyncio.ensure_future(
+                    self._send_heartbeats(lock_ttl / HEARTBEATS_PER_LOCK_TTL)
+                )
+        except BaseException:
+            self._close_socket()
+            raise
+
+    def _make_method_fn(self, name: str) -> Callable:
+        async def method_fn(_self, *args, **kwargs):
+            return await _self._call(_self.name, name, *args, **kwargs)
+
+        return method_fn
+
+    async def call(self, method: str, *args, **kwargs) -> Any:
+        """Calls a method of the remote object.
+
+        Args:
+            method: The name of the method to call.
+            *args: The positional arguments to pass to the method.
+            **kwargs: The keyword arguments to pass to the method.
+
+        Returns:
+            The result of the call. It raises a `RuntimeError` if the remote
+            procedure failed, or `asyncio.TimeoutError` after `timeout` seconds."""
+        return await self._call(self.name, method, *args, **kwargs)
+
+    async def call_with_timeout(
+        self, timeout: Optional[float], method: str, *args, **kwargs
+    ) -> Any:
+        """Calls a method of the remote object, with another timeout than the
+        `timeout` of the `AsyncThing`.
+
+        Args:
+            timeout: How long to wait for the reply, in seconds, or None to wait
+                forever. The server does not start the call after that.
+            method: The name of the method to call.
+            *args: The positional arguments to pass to the method.
+            **kwargs: The keyword arguments to pass to the method.
+
+        Returns:
+            The result of the call. It raises a `RuntimeError` if the remote
+            procedure failed, or `asyncio.TimeoutError` after `timeout` seconds."""
+        return await self._call_with_timeout(timeout, self.name, method, args, kwargs)
+
+    async def _call(self, name: str, method: str, *args, **kwargs) -> Any:
+        return await self._call_with_timeout(self.timeout, name, method, args, kwargs)
+
+    async def _call_with_timeout(
+        self, timeout: Optional[float], name: str, method: str, args, kwargs
+    ) -> Any:
+        if self._socket is None:
+            raise RuntimeError("Connection to 👀 caniusethat server is closed.")
+
+        request_id = next(self._request_ids)
+        flags = RemoteProcedureFlag.NONE
+        trace = None
+        if self.tracer is not None and self.tracer.sample():
+            flags = RemoteProcedureFlag.TRACED
+            trace = start_trace(name, method, request_id, "thing_send")
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = (future, self._serializer, trace)
+        try:
+            frames = prepare_rpc_frames(
+                name,
+                method,
+                args,
+                kwargs,
+                self._serializer,
+                request_id,
+                flags,
+                self.lock_timeout,
+                timeout,
+            )
+            await self._socket.send_multipart([b"", *frames], copy=False)
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            # On timeout or cancellation the reply, if it ever comes, is dropped.
+            self._pending.pop(request_id, None)
+
+    async def _receive_replies(self) -> None:
+        assert self._socket is not None
+        while True:
+            _, *reply = await self._socket.recv_multipart(copy=False)
+            try:
+                request_id = reply_request_id(reply)
+            except Exception:
+                _logger.warning("Received a reply that does not match any call.")
+                continue
+
+            entry = self._pending.get(request_id)
+            if entry is None or entry[0].done():
+                continue
+            future, serializer, trace = entry
+            if trace is not None and self.tracer is not None:
+                try:
+                    _finish_trace(self.tracer, trace, reply)
+                except Exception:
+                    _logger.exception("Could not record the trace of a call.")
+            try:
+                future.set_result(validate_rpc_response(reply, serializer))
+            except Exception as e:
+                future.set_exception(e)
+
+    async def _send_heartbeats(self, interval: float) -> None:
+        """Renews the leases of the locks held on the server every `interval` seconds,
+        making the socket again if the server stops replying."""
+        missed = 0
+        while self._socket is not None:
+            await asyncio.sleep(interval)
+            try:
+                await self._call_with_timeout(
+                    interval, "_server", "renew_locks", (), {}
+                )
+                missed = 0
+            except asyncio.TimeoutError:
+                _logger.warning("The server did not reply to a heartbeat in time.")
+                missed += 1
+                if missed >= self._HEARTBEAT_LIVENESS:
+                    self._reconnect()
+                    missed = 0
+            except zmq.ZMQError:
+                if self._socket is None:
+                    return
+                _logger.exception("Could not send a heartbeat, reconnecting.")
+                self._reconnect()
+                missed = 0
+            except Exception:
+                if self._socket is None:
+                    return
+                _logger.exception("The server did not accept a heartbeat.")
+
+    def _open_socket(self) -> None:
+        context = zmq.asyncio.Context.shadow(zmq.Context.instance())
+        self._socket = context.socket(zmq.DEALER)
+        self._socket.connect(self.server_address)
+        self._receiver = asyncio.ensure_future(self._receive_replies())
+
+    def _reconnect(self) -> None:
+        """Makes the socket again, failing the calls that wait for a reply."""
+        _logger.warning(
+            f"Lost the connection to 👀 caniusethat server at {self.server_address}, "
+            "reconnecting..."
+        )
+        if self._receiver is not None:
+            self._receiver.cancel()
+        if self._socket is not None:
+            self._socket.close(linger=0)
+        self._fail_pending(
+            ConnectionError("Lost the connection to 👀 caniusethat server.")
+        )
+        self._open_socket()
+
+    def _fail_pending(self, error: Exception) -> None:
+        for future, _, _ in self._pending.values():
+            if not future.done():
+                future.set_exception(error)
+        self._pending.clear()
+
+    def available_methods(self) -> List[SharedMethodDescriptor]:
+        """Returns a list of the available methods of this object."""
+        return self._methods
+
+    def _close_socket(self) -> None:
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+            self._heartbeat = None
+        if self._receiver is not None:
+            self._receiver.cancel()
+            self._receiver = None
+        if self._socket is not None:
+            self._socket.close(linger=self._LINGER_TIME)
+            self._socket = None
+        self._fail_pending(
+            RuntimeError("Connection to 👀 caniusethat server was closed.")
+        )
+
+    async def close_this_thing(self) -> None:
+        """Closes the connection to the remote object and server, releasing
+        any locks if any are still held."""
+        if self._socket is not None:
+            _logger.info("Closing connection to 👀 caniusethat server")
+            try:
+                await self._call("_server", "release_lock_if_any", self.name)
+            except Exception:
+                _logger.exception(
+                    "There was an error when trying to remove locks on the Thing."
+                )
+            self._close_socket()
@@ -1,17 +1,33 @@
 import argparse
-import pickle
-from typing import List
+import json
+import threading
+import time
+from typing import Any, Dict, List, Sequence
 
 import zmq
 
 from caniusethat._logging import getLogger
-from caniusethat._types import RemoteProcedureCall, SharedMethodDescriptor
-from caniusethat.rpc_utils import validate_rpc_response
+from caniusethat._types import SharedMethodDescriptor
+from caniusethat.metrics import format_prometheus, histogram_quantile
+from caniusethat.rpc_utils import prepare_rpc_frames, validate_rpc_response
+from caniusethat.serializers import (
+    DEFAULT_SERIALIZER,
+    available_serializers,
+    choose_serializer,
+)
+from caniusethat.thing import Thing
 
 _logger = getLogger("caniusethat.cli")
 
 
-def _send_receive(server_address: str, name: str, method: str, *args, **kwargs):
+def _send_receive(
+    server_address: str,
+    name: str,
+    method: str,
+    *args,
+    serializer: str = DEFAULT_SERIALIZER,
+    **kwargs,
+):
     ctx = zmq.Context.instance()
     socket: zmq.Socket = ctx.socket(zmq.REQ)
     _logger.info(f"Connecting to 👀 caniusethat server at {server_address}...")
@@ -19,19 +35,36 @@ def _send_receive(server_address: str, name: str, method: str, *args, **kwargs):
     poller = zmq.Poller()
     poller.register(socket, zmq.POLLIN)
 
-    rpc_pickle = pickle.dumps(RemoteProcedureCall(name, method, args, kwargs))
-    socket.send(rpc_pickle)
+    socket.send_multipart(
+        prepare_rpc_frames(name, method, args, kwargs, serializer), copy=False
+    )
 
     socks = dict(poller.poll(timeout=1000))
     if socks.get(socket) == zmq.POLLIN:
-        response = socket.recv()
-        return validate_rpc_response(response)
+        response = socket.recv_multipart(copy=False)
+        socket.close(linger=0)
+        return validate_rpc_response(response, serializer)
     else:
+        socket.close(linger=0)
         raise TimeoutError("Server did not respond.")
 
 
+def _negotiate_serializer(server_address: str, serializers: Sequence[str]) -> str:
+    if list(serializers) == [DEFAULT_SERIALIZER]:
+        return DEFAULT_SERIALIZER
+    supported = _send_receive(server_address, "_server", "get_serializers")
+    return choose_serializer(serializers, supported)
+
+
+def _server_call(args, method: str, *method_args):
+    serializer = _negotiate_serializer(args.server_address, args.serializer)
+    return _send_receive(
+        args.server_address, "_server", method, *method_args, serializer=serializer
+    )
+
+
 def list_server_objects(args) -> None:
-    object_list = _send_receive(args.server_address, "_server", "get_object_list")
+    object_list = _server_call(args, "get_object_list")
     print("Available objects:")
     for obj_name in object_list:
         print(f"- {obj_name}")
@@ -39,8 +72,8 @@ def list_server_objects(args) -> None:
 
 def list_objects_methods(args) -> None:
     try:
-        method_list: List[SharedMethodDescriptor] = _send_receive(
-            args.server_address, "_server", "get_object_methods", args.object_name
+        method_list: List[SharedMethodDescriptor] = _server_call(
+            args, "get_object_methods", args.object_name
         )
     except RuntimeError:
         _logger.exception(f"Could not find object {args.object_name}.")
@@ -53,17 +86,225 @@ def list_objects_methods(args) -> None:
 
 def unlock(args) -> None:
     try:
-        _send_receive(
-            args.server_address, "_server", "force_release_lock", args.object_name
-        )
+        _server_call(args, "force_release_lock", args.object_name)
     except RuntimeError:
         _logger.exception(f"Could not release lock for object {args.object_name}")
     else:
         _logger.info(f"Released lock for object {args.object_name} (if any).")
 
 
+def print_stats(args) -> None:
+    stats = _server_call(args, "get_stats")
+    print(f"Uptime: {stats['uptime']:.0f} s")
+    print(
+        f"{'method':<32} {'calls':>8} {'errors':>8} {'locked':>8} {'busy':>8} "
+        f"{'queue p50':>10} {'queue p99':>10} {'run p50':>10} {'run p99':>10}"
+    )
+    for obj_name, methods in sorted(stats["methods"].items()):
+        queue = stats["queues"][obj_name]
+        print(
+            f"{obj_name} ({queue['pending']} pending, {queue['waiting_for_lock']} "
+            f"waiting for the lock, {queue['running']} running, "
+            f"at most {queue['peak']} waiting"
+            + ("" if queue["limit"] is None else f" of {queue['limit']}")
+            + ")"
+        )
+        for method_name, method in sorted(methods.items()):
+            latencies = [
+                histogram_quantile(method[histogram], quantile) * 1000
+                for histogram in ("queue_time", "run_time")
+                for quantile in (0.5, 0.99)
+            ]
+            print(
+                f"  {method_name:<30} {method['calls']:>8} {method['errors']:>8} "
+                f"{method['locked_rejections']:>8} {method['busy_rejections']:>8} "
+                + " ".join(f"{latency:>8.2f}ms" for latency in latencies)
+            )
+    if args.prometheus_file is not None:
+        with open(args.prometheus_file, "w") as prometheus_file:
+            prometheus_file.write(format_prometheus(stats))
+        _logger.info(f"Wrote the stats to {args.prometheus_file}.")
+
+
+def _positive_int(value: str) -> int:
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"{value} is not a positive integer")
+    return number
+
+
+def _positive_float(value: str) -> float:
+    number = float(value)
+    if not number > 0:
+        raise argparse.ArgumentTypeError(f"{value} is not a positive number")
+    return number
+
+
+def _non_negative_int(value: str) -> int:
+    number = int(value)
+    if number < 0:
+        raise argparse.ArgumentTypeError(f"{value} is not a non-negative integer")
+    return number
+
+
+def _percentile(sorted_values: List[float], quantile: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = round(quantile * len(sorted_values)) - 1
+    return sorted_values[min(len(sorted_values) - 1, max(0, index))]
+
+
+def _bench_client(
+    args, call_args: List[Any], call_kwargs: Dict[str, Any], results: Dict[str, Any]
+) -> None:
+    """Calls the method until the end of the benchmark, at the rate of one client."""
+    try:
+        thing = Thing(
+            args.object_name,
+            args.server_address,
+            args.serializer,
+            timeout=args.timeout,
+        )
+    except BaseException:
+        results["ready"].abort()
+        raise
+    interval = args.concurrency / args.rate if args.rate else 0.0
+    latencies: List[float] = []
+    errors = locked = 0
+    try:
+        results["ready"].wait()
+        start = results["start"]
+        next_call = start
+        while True:
+            now = time.perf_counter()
+            if now - start >= args.duration:
+                break
+            if next_call > now:
+                time.sleep(next_call - now)
+            next_call += interval
+            started = time.perf_counter()
+            try:
+                thing.call_with_timeout(
+                    args.timeout, args.method, *call_args, **call_kwargs
+                )
+            except Exception as e:
+                errors += 1
+                if "THING_IS_LOCKED" in str(e):
+                    locked += 1
+            else:
+                latencies.append(time.perf_counter() - started)
+    finally:
+        thing.close_this_thing()
+        with results["lock"]:
+            results["latencies"].extend(latencies)
+            results["errors"] += errors
+            results["locked"] += locked
+
+
+def bench(args) -> None:
+    try:
+        method_list: List[SharedMethodDescriptor] = _server_call(
+            args, "get_object_methods", args.object_name
+        )
+    except RuntimeError:
+        _logger.exception(f"Could not find object {args.object_name}.")
+        return
+    if args.method not in [method.name for method in method_list]:
+        _logger.error(
+            f"Object {args.object_name} has no method {args.method}, available "
+            f"methods: {', '.join(method.name for method in method_list)}."
+        )
+        return
+
+    try:
+        call_args = json.loads(args.args)
+        call_kwargs = json.loads(args.kwargs)
+        if not isinstance(call_args, list) or not isinstance(call_kwargs, dict):
+            raise ValueError("--args must be a list and --kwargs an object.")
+    except ValueError:
+        _logger.exception("Could not read the arguments of the calls.")
+        return
+    if args.payload_size is not None:
+        call_args.append(b"x" * args.payload_size)
+
+    results: Dict[str, Any] = {
+        "lock": threading.Lock(),
+        "latencies": [],
+        "errors": 0,
+        "locked": 0,
+    }
+    # The clients connect first, then start together.
+    results["ready"] = threading.Barrier(
+        args.concurrency + 1,
+        action=lambda: results.update(start=time.perf_counter()),
+    )
+    clients = [
+        threading.Thread(
+            target=_bench_client, args=(args, call_args, call_kwargs, results)
+        )
+        for _ in range(args.concurrency)
+    ]
+    for client in clients:
+        client.start()
+    try:
+        results["ready"].wait()
+    except threading.BrokenBarrierError:
+        _logger.error("A client could not connect to the server.")
+        return
+    finally:
+        for client in clients:
+            client.join()
+    elapsed = time.perf_counter() - results["start"]
+
+    latencies = sorted(results["latencies"])
+    report = {
+        "object": args.object_name,
+        "method": args.method,
+        "concurrency": args.concurrency,
+        "duration": elapsed,
+        "calls": len(latencies) + results["errors"],
+        "errors": results["errors"],
+        "locked_rejections": results["locked"],
+        "calls_per_second": (len(latencies) + results["errors"]) / elapsed,
+        "latency_ms": {
+            name: _percentile(latencies, quantile) * 1000
+            for name, quantile in [
+                ("p50", 0.5),
+                ("p90", 0.9),
+                ("p99", 0.99),
+                ("max", 1.0),
+            ]
+        },
+    }
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"Called {args.object_name}.{args.method} from {args.concurrency} client(s)")
+    print(
+        f"  calls: {report['calls']} in {elapsed:.1f} s, "
+        f"{report['calls_per_second']:.0f} calls/s"
+    )
+    print(
+        f"  errors: {report['errors']} "
+        f"({report['locked_rejections']} rejected with THING_IS_LOCKED)"
+    )
+    print(
+        "  latency: "
+        + ", ".join(
+            f"{name} {value:.2f} ms" for name, value in report["latency_ms"].items()
+        )
+    )
+
+
 def run_cli() -> None:
     parser = argparse.ArgumentParser(description="caniusethat CLI utility")
+    parser.add_argument(
+        "--serializer",
+        action="append",
+        choices=available_serializers(),
+        help="serializer to use, can be repeated to give an order of preference "
+        f"(default: {DEFAULT_SERIALIZER})",
+    )
 
     subparsers = parser.add_subparsers(title="subcommands")
 
@@ -105,7 +346,82 @@ def run_cli() -> None:
     )
     parser_unlock.set_defaults(func=unlock)
 
+    parser_stats = subparsers.add_parser(
+        "stats", help="Show the calls received by the server, for each method."
+    )
+    parser_stats.add_argument(
+        "server_address",
+        type=str,
+        help="address of the server, e.g tcp://127.0.0.1:6555",
+    )
+    parser_stats.add_argument(
+        "--prometheus-file",
+        type=str,
+        help="also write the stats to this file, in the Prometheus text format",
+    )
+    parser_stats.set_defaults(func=print_stats)
+
+    parser_bench = subparsers.add_parser(
+        "bench", help="Call a method of an object under load, and report latencies."
+    )
+    parser_bench.add_argument(
+        "server_address",
+        type=str,
+        help="address of the server, e.g tcp://127.0.0.1:6555",
+    )
+    parser_bench.add_argument(
+        "object_name", type=str, help="name of the object, e.g my_obj"
+    )
+    parser_bench.add_argument("method", type=str, help="name of the method to call")
+    parser_bench.add_argument(
+        "--args",
+        type=str,
+        default="[]",
+        help="positional arguments of the calls, as a JSON list (default: [])",
+    )
+    parser_bench.add_argument(
+        "--kwargs",
+        type=str,
+        default="{}",
+        help="keyword arguments of the calls, as a JSON object (default: {})",
+    )
+    parser_bench.add_argument(
+        "--payload-size",
+        type=_non_negative_int,
+        help="also pass a bytes argument of this size, after the positional ones",
+    )
+    parser_bench.add_argument(
+        "--concurrency",
+        type=_positive_int,
+        default=1,
+        help="number of clients calling at the same time (default: 1)",
+    )
+    parser_bench.add_argument(
+        "--rate",
+        type=_positive_float,
+        help="calls per second of all the clients together (default: as fast as "
+        "they can)",
+    )
+    parser_bench.add_argument(
+        "--duration",
+        type=_positive_float,
+        default=10.0,
+        help="duration of the benchmark in seconds (default: 10)",
+    )
+    parser_bench.add_argument(
+        "--timeout",
+        type=_positive_float,
+        default=10.0,
+        help="time in seconds after which a call counts as an error (default: 10)",
+    )
+    parser_bench.add_argument(
+        "--json", action="store_true", help="print the report as JSON"
+    )
+    parser_bench.set_defaults(func=bench)
+
     args = parser.parse_args()
+    if args.serializer is None:
+        args.serializer = [DEFAULT_SERIALIZER]
     if hasattr(args, "func"):
         args.func(args)
     else:
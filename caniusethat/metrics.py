@@ -0,0 +1,190 @@
+from bisect import bisect_left
+from typing import Any, Dict, List
+
+# The upper bounds, in seconds, of the buckets of the latency histograms.
+LATENCY_BUCKETS = [
+    0.00005,
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    float("inf"),
+]
+
+
+class LatencyHistogram:
+    """Counts durations in buckets with fixed bounds, see `LATENCY_BUCKETS`."""
+
+    def __init__(self) -> None:
+        self.counts = [0] * len(LATENCY_BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "buckets": list(LATENCY_BUCKETS),
+            "counts": list(self.counts),
+            "count": self.count,
+            "sum": self.sum,
+        }
+
+
+class MethodStats:
+    """What the server measured about the calls to a shared method.
+
+    Attributes:
+        calls: The number of calls received.
+        errors: The number of calls that failed, including rejected ones.
+        locked_rejections: The number of calls rejected with THING_IS_LOCKED.
+        expired: The number of calls dropped with DEADLINE_EXCEEDED.
+        busy_rejections: The number of calls rejected with SERVER_BUSY.
+        rate_limited: The number of calls rejected with RATE_LIMITED.
+        bytes_in: The size of the calls received.
+        bytes_out: The size of the replies sent.
+        queue_time: How long the calls waited for the lock of the object, if they
+            could, and for a worker.
+        run_time: How long the method took to run.
+    """
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.errors = 0
+        self.locked_rejections = 0
+        self.expired = 0
+        self.busy_rejections = 0
+        self.rate_limited = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.queue_time = LatencyHistogram()
+        self.run_time = LatencyHistogram()
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "locked_rejections": self.locked_rejections,
+            "expired": self.expired,
+            "busy_rejections": self.busy_rejections,
+            "rate_limited": self.rate_limited,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "queue_time": self.queue_time.as_dict(),
+            "run_time": self.run_time.as_dict(),
+        }
+
+
+def histogram_quantile(histogram: Dict[str, Any], quantile: float) -> float:
+    """Estimates a quantile of a histogram, as the upper bound of its bucket.
+
+    Args:
+        histogram: A histogram, as in the result of `Server.get_stats`.
+        quantile: The quantile, between 0 and 1.
+
+    Returns:
+        The upper bound of the bucket, in seconds, or 0 if the histogram is empty."""
+    rank = quantile * histogram["count"]
+    cumulative = 0
+    for bound, count in zip(histogram["buckets"], histogram["counts"]):
+        cumulative += count
+        if count and cumulative >= rank:
+            return float(bound)
+    return 0.0
+
+
+_COUNTERS = [
+    ("calls", "Calls received."),
+    ("errors", "Calls that failed, including rejected ones."),
+    ("locked_rejections", "Calls rejected because the object was locked."),
+    ("expired", "Calls dropped because their timeout passed before they started."),
+    ("busy_rejections", "Calls rejected because too many calls were waiting."),
+    ("rate_limited", "Calls rejected because their client made too many calls."),
+    ("bytes_in", "Size of the calls received, in bytes."),
+    ("bytes_out", "Size of the replies sent, in bytes."),
+]
+
+_HISTOGRAMS = [
+    ("queue_time", "Time the calls waited for the lock and a worker, in seconds."),
+    ("run_time", "Time the methods took to run, in seconds."),
+]
+
+
+def _format_bound(bound: float) -> str:
+    return "+Inf" if bound == float("inf") else repr(bound)
+
+
+def format_prometheus(stats: Dict[str, Any]) -> str:
+    """Formats the result of `Server.get_stats` in the Prometheus text format.
+
+    Args:
+        stats: The statistics of a server.
+
+    Returns:
+        The text, e.g. to write to a file read by the textfile collector of the
+        Prometheus node exporter."""
+    lines: List[str] = []
+    methods = [
+        (name, method, method_stats)
+        for name, object_methods in sorted(stats["methods"].items())
+        for method, method_stats in sorted(object_methods.items())
+    ]
+
+    for counter, description in _COUNTERS:
+        metric = f"caniusethat_{counter}_total"
+        lines.append(f"# HELP {metric} {description}")
+        lines.append(f"# TYPE {metric} counter")
+        for name, method, method_stats in methods:
+            labels = f'object="{name}",method="{method}"'
+            lines.append(f"{metric}{{{labels}}} {method_stats[counter]}")
+
+    for histogram, description in _HISTOGRAMS:
+        metric = f"caniusethat_{histogram}_seconds"
+        lines.append(f"# HELP {metric} {description}")
+        lines.append(f"# TYPE {metric} histogram")
+        for name, method, method_stats in methods:
+            labels = f'object="{name}",method="{method}"'
+            data = method_stats[histogram]
+            cumulative = 0
+            for bound, count in zip(data["buckets"], data["counts"]):
+                cumulative += count
+                lines.append(
+                    f'{metric}_bucket{{{labels},le="{_format_bound(bound)}"}} {cumulative}'
+                )
+            lines.append(f"{metric}_sum{{{labels}}} {data['sum']}")
+            lines.append(f"{metric}_count{{{labels}}} {data['count']}")
+
+    metric = "caniusethat_queued_calls"
+    lines.append(f"# HELP {metric} Calls waiting for a worker.")
+    lines.append(f"# TYPE {metric} gauge")
+    for name, queue in sorted(stats["queues"].items()):
+        lines.append(f'{metric}{{object="{name}"}} {queue["pending"]}')
+
+    metric = "caniusethat_lock_waiting_calls"
+    lines.append(f"# HELP {metric} Calls waiting for the lock of the object.")
+    lines.append(f"# TYPE {metric} gauge")
+    for name, queue in sorted(stats["queues"].items()):
+        lines.append(f'{metric}{{object="{name}"}} {queue["waiting_for_lock"]}')
+
+    metric = "caniusethat_running_calls"
+    lines.append(f"# HELP {metric} Calls running in a worker.")
+    lines.append(f"# TYPE {metric} gauge")
+    for name, queue in sorted(stats["queues"].items()):
+        lines.append(f'{metric}{{object="{name}"}} {queue["running"]}')
+
+    return "\n".join(lines) + "\n"
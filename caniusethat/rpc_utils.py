@@ -1,25 +1,45 @@
-import pickle
-from typing import Any
+import json
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import zmq
 
 from caniusethat._types import (
-    RemoteProcedureCall,
     RemoteProcedureError,
+    RemoteProcedureFlag,
+    RemoteProcedureHeader,
     RemoteProcedureResponse,
 )
+from caniusethat.serializers import DEFAULT_SERIALIZER, get_serializer
+
+
+def receive_ready_messages(socket: zmq.Socket, limit: int) -> Iterator[List[zmq.Frame]]:
+    """Yields the messages already queued on the socket, up to `limit`, without blocking.
+
+    The frames are not copied out of ZeroMQ, so large buffers can be forwarded as they are.
+    """
+    for _ in range(limit):
+        try:
+            yield socket.recv_multipart(zmq.NOBLOCK, copy=False)
+        except zmq.Again:
+            return
 
 
-def validate_rpc_response(response: bytes) -> Any:
+def validate_rpc_response(
+    response: Sequence[Any], serializer: str = DEFAULT_SERIALIZER
+) -> Any:
     """Validates the response from the server.
 
     Args:
-        response: The response from the server.
+        response: The frames of the reply from the server, starting with the
+            header of the call.
+        serializer: The name of the serializer used for the call.
 
     Returns:
         The result of the RPC call, or raises an exception if the response is invalid.
 
     Raises:
         RuntimeError: If the response is invalid or if the response is an error."""
-    result = pickle.loads(response)
+    result = get_serializer(serializer).loads(response[1:])
     if not isinstance(result, RemoteProcedureResponse):
         raise RuntimeError(f"Received invalid RemoteProcedureResponse: {result}")
     if result.error != RemoteProcedureError.NO_ERROR:
@@ -28,15 +48,251 @@ def validate_rpc_response(response: bytes) -> Any:
         return result.result
 
 
-def prepare_rpc_pickle(name, method, args, kwargs) -> bytes:
-    """Prepares a remote procedure call for pickling.
+def validate_rpc_batch_response(
+    response: Sequence[Any], serializer: str = DEFAULT_SERIALIZER
+) -> List[RemoteProcedureResponse]:
+    """Validates the response from the server to a batch of calls.
+
+    Args:
+        response: The frames of the reply from the server, starting with the
+            header of the batch.
+        serializer: The name of the serializer used for the batch.
+
+    Returns:
+        The RemoteProcedureResponse of each call, in the order of the calls.
+
+    Raises:
+        RuntimeError: If the response is invalid or if the whole batch failed."""
+    try:
+        replies = split_batch_frames(response[1:])
+    except ValueError:
+        # The server rejected the batch as a whole.
+        validate_rpc_response(response, serializer)
+        raise RuntimeError(f"Received invalid batch response: {response}")
+
+    codec = get_serializer(serializer)
+    results = []
+    for reply in replies:
+        result = codec.loads(reply[1:])
+        if not isinstance(result, RemoteProcedureResponse):
+            raise RuntimeError(f"Received invalid RemoteProcedureResponse: {result}")
+        results.append(result)
+    return results
+
+
+def encode_rpc_header(header: RemoteProcedureHeader) -> bytes:
+    """Encodes the header of a remote procedure call.
+
+    Args:
+        header: The header to encode.
+
+    Returns:
+        The header frame."""
+    # The optional fields at the end that are not set are left out.
+    fields = list(header)
+    while fields[-1] is None:
+        fields.pop()
+    return json.dumps(fields, separators=(",", ":")).encode()
+
+
+def _is_optional_number(value: Any) -> bool:
+    return value is None or (
+        isinstance(value, (int, float)) and not isinstance(value, bool)
+    )
+
+
+def decode_rpc_header(frame: bytes) -> RemoteProcedureHeader:
+    """Decodes the header of a remote procedure call.
+
+    Args:
+        frame: The header frame.
+
+    Returns:
+        The RemoteProcedureHeader.
+
+    Raises:
+        ValueError: If the frame is not a valid header."""
+    fields = json.loads(frame)
+    if not isinstance(fields, list):
+        raise ValueError(f"Invalid RemoteProcedureHeader: {fields}")
+    header = RemoteProcedureHeader(*fields)
+    if not (
+        isinstance(header.name, str)
+        and isinstance(header.method, str)
+        and isinstance(header.flags, int)
+        and isinstance(header.serializer, str)
+        and isinstance(header.request_id, int)
+        and (header.hops is None or isinstance(header.hops, dict))
+        and _is_optional_number(header.lock_timeout)
+        and _is_optional_number(header.timeout)
+        and (header.client_id is None or isinstance(header.client_id, str))
+    ):
+        raise ValueError(f"Invalid RemoteProcedureHeader: {header}")
+    return header
+
+
+def reply_request_id(response: Sequence[Any]) -> int:
+    """Returns the request ID of the call that a reply from the server answers.
+
+    Raises:
+        ValueError: If the reply does not start with a valid header."""
+    frame = response[0]
+    return decode_rpc_header(getattr(frame, "bytes", frame)).request_id
+
+
+def prepare_rpc_frames(
+    name,
+    method,
+    args,
+    kwargs,
+    serializer: str = DEFAULT_SERIALIZER,
+    request_id: int = 0,
+    flags: int = RemoteProcedureFlag.NONE,
+    lock_timeout: Optional[float] = None,
+    timeout: Optional[float] = None,
+    client_id: Optional[str] = None,
+) -> List[Any]:
+    """Prepares the frames of a remote procedure call.
 
     Args:
         name: The name of the remote object.
         method: The name of the method to call.
         args: The positional arguments to pass to the method.
         kwargs: The keyword arguments to pass to the method.
+        serializer: The name of the serializer for the arguments and the response.
+        request_id: The number that identifies the call in its reply.
+        flags: A combination of RemoteProcedureFlag options for the call.
+        lock_timeout: How long the call can wait for the lock of the object, in
+            seconds, or None to fail at once if another client holds it.
+        timeout: How long the client waits for the reply, in seconds, or None to
+            wait forever. The server does not start the call after that.
+        client_id: The unique name of a client that can send the call again, so
+            that the server runs it only once.
 
     Returns:
-        The pickled RemoteProcedureCall."""
-    return pickle.dumps(RemoteProcedureCall(name, method, args, kwargs))
+        The header frame, followed by the payload frame with the serialized
+        arguments and by the frames of their large buffers, if any."""
+    if args or kwargs:
+        header = RemoteProcedureHeader(
+            name,
+            method,
+            flags,
+            serializer,
+            request_id,
+            lock_timeout=lock_timeout,
+            timeout=timeout,
+            client_id=client_id,
+        )
+        codec = get_serializer(serializer)
+        payload = codec.dumps(
+            (
+                tuple(codec.out_of_band(arg) for arg in args),
+                {key: codec.out_of_band(value) for key, value in kwargs.items()},
+            )
+        )
+    else:
+        header = RemoteProcedureHeader(
+            name,
+            method,
+            flags | RemoteProcedureFlag.NO_ARGUMENTS,
+            serializer,
+            request_id,
+            lock_timeout=lock_timeout,
+            timeout=timeout,
+            client_id=client_id,
+        )
+        payload = [b""]
+    return [encode_rpc_header(header), *payload]
+
+
+def prepare_batch_frames(calls: Sequence[Sequence[Any]]) -> List[Any]:
+    """Joins the frames of many calls, or of their replies, into one payload.
+
+    Args:
+        calls: The frames of each call, starting with its header.
+
+    Returns:
+        A frame with the number of frames of each call, followed by all of them."""
+    frames: List[Any] = [json.dumps([len(call) for call in calls]).encode()]
+    for call in calls:
+        frames.extend(call)
+    return frames
+
+
+def split_batch_frames(payload: Sequence[Any]) -> List[List[Any]]:
+    """Splits the payload of a batch into the frames of each call, or reply.
+
+    Raises:
+        ValueError: If the payload is not a valid batch."""
+    if not payload:
+        raise ValueError("Invalid batch: missing the frame counts.")
+    counts_frame = payload[0]
+    counts = json.loads(getattr(counts_frame, "bytes", counts_frame))
+    if not (
+        isinstance(counts, list)
+        and all(isinstance(count, int) and count > 0 for count in counts)
+        and sum(counts) == len(payload) - 1
+    ):
+        raise ValueError(f"Invalid batch frame counts: {counts}")
+    calls = []
+    start = 1
+    for count in counts:
+        calls.append(list(payload[start : start + count]))
+        start += count
+    return calls
+
+
+def prepare_rpc_batch_frames(
+    calls: Sequence[Tuple[str, str, Any, Any]],
+    serializer: str = DEFAULT_SERIALIZER,
+    request_id: int = 0,
+) -> List[Any]:
+    """Prepares the frames of a batch of remote procedure calls, sent in one message.
+
+    Args:
+        calls: The name of the remote object, of the method, the positional and the
+            keyword arguments of each call.
+        serializer: The name of the serializer for the arguments and the responses.
+        request_id: The number that identifies the batch in its reply.
+
+    Returns:
+        The header frame of the batch, followed by the frames of its calls."""
+    header = RemoteProcedureHeader(
+        "_server", "batch", serializer=serializer, request_id=request_id
+    )
+    return [
+        encode_rpc_header(header),
+        *prepare_batch_frames(
+            [
+                prepare_rpc_frames(name, method, args, kwargs, serializer, index)
+                for index, (name, method, args, kwargs) in enumerate(calls)
+            ]
+        ),
+    ]
+
+
+def decode_rpc_payload(
+    header: RemoteProcedureHeader, payload: Sequence[Any]
+) -> Tuple[Tuple[Any, ...], Dict[str, Any]]:
+    """Decodes the arguments of a remote procedure call.
+
+    Args:
+        header: The header of the call.
+        payload: The payload frame, followed by the out-of-band buffer frames.
+
+    Returns:
+        The positional and keyword arguments of the call.
+
+    Raises:
+        ValueError: If the payload does not hold valid arguments."""
+    if header.flags & RemoteProcedureFlag.NO_ARGUMENTS:
+        return (), {}
+    arguments = get_serializer(header.serializer).loads(payload)
+    if not (
+        isinstance(arguments, (tuple, list))
+        and len(arguments) == 2
+        and isinstance(arguments[0], (tuple, list))
+        and isinstance(arguments[1], dict)
+    ):
+        raise ValueError(f"Invalid remote procedure call arguments: {arguments}")
+    return tuple(arguments[0]), arguments[1]
@@ -0,0 +1,284 @@
+import builtins
+import pickle
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+from caniusethat._types import (
+    RemoteProcedureError,
+    RemoteProcedureResponse,
+    SharedMethodDescriptor,
+)
+
+DEFAULT_SERIALIZER = "pickle"
+
+# Buffers smaller than this are cheaper to copy into the pickle than to send
+# in a frame of their own.
+OUT_OF_BAND_THRESHOLD = 64 * 1024  # bytes
+
+
+def _frame_buffer(frame: Any) -> Any:
+    return getattr(frame, "buffer", frame)
+
+
+class Serializer(ABC):
+    """The base class of the serializers used to encode calls and responses.
+
+    Subclasses must set a unique `name` and implement `dumps` and `loads`, then
+    be registered with `register_serializer` on both the server and the clients.
+
+    Attributes:
+        name: The name used to negotiate the serializer with the server.
+    """
+
+    name: str = ""
+
+    @abstractmethod
+    def dumps(self, obj: Any) -> List[Any]:
+        """Serializes an object.
+
+        Args:
+            obj: The object to serialize.
+
+        Returns:
+            A list of frames, the first one is never empty."""
+
+    @abstractmethod
+    def loads(self, frames: Sequence[Any]) -> Any:
+        """Deserializes an object.
+
+        Args:
+            frames: The frames returned by `dumps`, either as bytes or as `zmq.Frame`
+                objects received with `copy=False`.
+
+        Returns:
+            The deserialized object."""
+
+    def out_of_band(self, value: Any) -> Any:
+        """Marks an argument or result to be sent in a frame of its own, if the
+        serializer supports it. By default, the value is returned unchanged."""
+        return value
+
+
+def _rebuild_buffer(buffer_type: type, buffer: Any) -> Any:
+    return buffer_type(buffer)
+
+
+class _OutOfBandBuffer:
+    """Wraps a `bytes` or `memoryview` object, so that it is pickled out-of-band.
+
+    Unlike `bytearray` and NumPy arrays, these types do not support out-of-band
+    pickling on their own."""
+
+    __slots__ = ("data",)
+
+    def __init__(self, data: Any) -> None:
+        self.data = data
+
+    def __reduce_ex__(self, protocol):
+        return (_rebuild_buffer, (type(self.data), pickle.PickleBuffer(self.data)))
+
+
+class PickleSerializer(Serializer):
+    """Serializes with `pickle` protocol 5, sending large buffers as separate
+    frames, without copying them. This is the default serializer."""
+
+    name = "pickle"
+
+    def dumps(self, obj: Any) -> List[Any]:
+        frames: List[Any] = [b""]
+
+        def buffer_callback(buffer: pickle.PickleBuffer) -> bool:
+            raw = buffer.raw()
+            if raw.nbytes < OUT_OF_BAND_THRESHOLD:
+                return True  # Keep it in-band.
+            frames.append(raw)
+            return False
+
+        frames[0] = pickle.dumps(obj, protocol=5, buffer_callback=buffer_callback)
+        return frames
+
+    def loads(self, frames: Sequence[Any]) -> Any:
+        buffers = [_frame_buffer(frame) for frame in frames]
+        return pickle.loads(buffers[0], buffers=buffers[1:])
+
+    def out_of_band(self, value: Any) -> Any:
+        if type(value) in (bytes, memoryview):
+            view = memoryview(value)
+            if view.contiguous and view.nbytes >= OUT_OF_BAND_THRESHOLD:
+                return _OutOfBandBuffer(value)
+        return value
+
+
+class MsgpackSerializer(Serializer):
+    """Serializes with `msgpack`, a compact format that is faster than `pickle`
+    for small calls and does not execute code when decoding.
+
+    Only the types known to `msgpack` can be sent, plus tuples, exceptions and
+    the types registered with `register_extension`. Exceptions are rebuilt as
+    the built-in exception with the same name, or as a `RuntimeError`.
+
+    Requires the `msgpack` package, e.g. `pip install caniusethat[msgpack]`.
+    """
+
+    name = "msgpack"
+
+    _TUPLE = 0
+    _RESPONSE = 1
+    _METHOD_DESCRIPTOR = 2
+    _EXCEPTION = 3
+    _FIRST_USER_CODE = 16
+
+    def __init__(self) -> None:
+        import msgpack
+
+        self._msgpack = msgpack
+        self._encoders: Dict[type, Tuple[int, Callable[[Any], Any]]] = {}
+        self._decoders: Dict[int, Callable[[Any], Any]] = {}
+
+        self._add_extension(self._TUPLE, tuple, list, tuple)
+        self._add_extension(
+            self._RESPONSE,
+            RemoteProcedureResponse,
+            lambda response: [response.result, response.error.value],
+            lambda fields: RemoteProcedureResponse(
+                fields[0], RemoteProcedureError(fields[1])
+            ),
+        )
+        self._add_extension(
+            self._METHOD_DESCRIPTOR,
+            SharedMethodDescriptor,
+            list,
+            lambda fields: SharedMethodDescriptor(*fields),
+        )
+        self._decoders[self._EXCEPTION] = self._decode_exception
+
+    def register_extension(
+        self,
+        code: int,
+        cls: type,
+        encode: Callable[[Any], Any],
+        decode: Callable[[Any], Any],
+    ) -> None:
+        """Teaches the serializer how to send instances of a custom type.
+
+        The same extension must be registered on both ends of the connection.
+
+        Args:
+            code: A unique code for the type, between 16 and 127.
+            cls: The type, its subclasses are not included.
+            encode: Converts an instance to something `msgpack` can serialize.
+            decode: Converts the output of `encode` back to an instance.
+
+        Example:
+            >>> get_serializer("msgpack").register_extension(
+            ...     16, complex, lambda c: [c.real, c.imag], lambda v: complex(*v)
+            ... )
+        """
+        if not self._FIRST_USER_CODE <= code <= 127:
+            raise ValueError(f"Extension code {code} is not between 16 and 127.")
+        if code in self._decoders:
+            raise ValueError(f"Extension code {code} is already in use.")
+        self._add_extension(code, cls, encode, decode)
+
+    def _add_extension(
+        self,
+        code: int,
+        cls: type,
+        encode: Callable[[Any], Any],
+        decode: Callable[[Any], Any],
+    ) -> None:
+        self._encoders[cls] = (code, encode)
+        self._decoders[code] = decode
+
+    def _default(self, obj: Any) -> Any:
+        if type(obj) in self._encoders:
+            code, encode = self._encoders[type(obj)]
+            return self._msgpack.ExtType(code, self._pack(encode(obj)))
+        if isinstance(obj, BaseException):
+            fields = [type(obj).__name__, str(obj)]
+            return self._msgpack.ExtType(self._EXCEPTION, self._pack(fields))
+        raise TypeError(f"Cannot serialize object of type {type(obj)} with msgpack")
+
+    def _ext_hook(self, code: int, data: bytes) -> Any:
+        if code not in self._decoders:
+            return self._msgpack.ExtType(code, data)
+        return self._decoders[code](self._unpack(data))
+
+    @staticmethod
+    def _decode_exception(fields: List[str]) -> BaseException:
+        name, message = fields
+        exception_type = getattr(builtins, name, None)
+        if isinstance(exception_type, type) and issubclass(
+            exception_type, BaseException
+        ):
+            return exception_type(message)
+        return RuntimeError(f"{name}: {message}")
+
+    def _pack(self, obj: Any) -> bytes:
+        packed: bytes = self._msgpack.packb(
+            obj, default=self._default, strict_types=True
+        )
+        return packed
+
+    def _unpack(self, data: Any) -> Any:
+        return self._msgpack.unpackb(
+            data, ext_hook=self._ext_hook, raw=False, strict_map_key=False
+        )
+
+    def dumps(self, obj: Any) -> List[Any]:
+        return [self._pack(obj)]
+
+    def loads(self, frames: Sequence[Any]) -> Any:
+        return self._unpack(_frame_buffer(frames[0]))
+
+
+_serializers: Dict[str, Serializer] = {}
+
+
+def register_serializer(serializer: Serializer) -> None:
+    """Makes a serializer available to the server and the clients of this process.
+
+    Args:
+        serializer: The serializer, replacing any other with the same name."""
+    _serializers[serializer.name] = serializer
+
+
+def get_serializer(name: str) -> Serializer:
+    """Returns the registered serializer with the given name.
+
+    Raises:
+        ValueError: If there is no such serializer."""
+    try:
+        return _serializers[name]
+    except KeyError:
+        raise ValueError(f"Unknown serializer: {name}") from None
+
+
+def available_serializers() -> List[str]:
+    """Returns the names of the registered serializers."""
+    return list(_serializers.keys())
+
+
+def choose_serializer(preferred: Sequence[str], supported: Sequence[str]) -> str:
+    """Picks the first of the preferred serializers that is also supported.
+
+    Args:
+        preferred: The serializers wanted by the client, in order of preference.
+        supported: The serializers supported by the server.
+
+    Raises:
+        RuntimeError: If none of the preferred serializers is supported."""
+    for name in preferred:
+        if name in supported and name in _serializers:
+            return name
+    raise RuntimeError(
+        f"None of the serializers {list(preferred)} is supported, "
+        f"the server supports {list(supported)}."
+    )
+
+
+register_serializer(PickleSerializer())
+try:
+    register_serializer(MsgpackSerializer())
+except ImportError:
+    pass
@@ -1,9 +1,30 @@
+import heapq
 import inspect
+import itertools
 import logging
-import pickle
+import math
+import multiprocessing
+import os
+import struct
+import tempfile
+import time
+from collections import OrderedDict, deque
 from functools import wraps
 from threading import Lock
-from typing import Any, Callable, Dict, List
+from typing import (
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    Hashable,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Union,
+)
 
 import zmq
 from zmq.utils.win32 import allow_interrupt
@@ -11,15 +32,42 @@ from zmq.utils.win32 import allow_interrupt
 from caniusethat._logging import getLogger
 from caniusethat._thread import StoppableThread
 from caniusethat._types import (
-    RemoteProcedureCall,
     RemoteProcedureError,
+    RemoteProcedureFlag,
+    RemoteProcedureHeader,
     RemoteProcedureResponse,
     SharedMethodDescriptor,
     SharedObjectDescriptor,
 )
+from caniusethat.metrics import MethodStats
+from caniusethat.rpc_utils import (
+    decode_rpc_header,
+    decode_rpc_payload,
+    encode_rpc_header,
+    prepare_batch_frames,
+    prepare_rpc_frames,
+    receive_ready_messages,
+    split_batch_frames,
+    validate_rpc_response,
+)
+from caniusethat.serializers import (
+    DEFAULT_SERIALIZER,
+    available_serializers,
+    get_serializer,
+)
+from caniusethat.tracing import RingBufferSink, Tracer, start_trace
 
 _logger = getLogger(__name__)
 
+_WORKER_READY = b"READY"
+# Workers send the error code of a call, when it started and how long it ran,
+# ahead of the reply.
+_CALL_STATUS = struct.Struct("<Bdd")
+_STOP_WORKER = b"STOP"
+# Stands for the address of a call in a batch. Addresses of clients never start
+# with a zero byte, except those made up by ZeroMQ, that are shorter.
+_BATCH_SLOT_PREFIX = b"\x00caniusethat_batch_"
+
 
 def _is_shared_method(obj: Any) -> bool:
     return inspect.ismethod(obj) and hasattr(obj, "_you_can_use_this")
@@ -33,8 +81,35 @@ def _is_unlocking_method(obj: Any) -> bool:
     return inspect.ismethod(obj) and hasattr(obj, "_release_lock")
 
 
-def _dealer_address(name: str) -> str:
-    return f"inproc://{name}_worker"
+def _is_lock_access_method(obj: Any) -> bool:
+    return inspect.ismethod(obj) and hasattr(obj, "_lock_access")
+
+
+def _is_concurrent_method(obj: Any) -> bool:
+    return inspect.ismethod(obj) and hasattr(obj, "_run_concurrently")
+
+
+def _is_cacheable_method(obj: Any) -> bool:
+    return inspect.ismethod(obj) and hasattr(obj, "_cacheable")
+
+
+def _is_coalescing_method(obj: Any) -> bool:
+    return inspect.ismethod(obj) and hasattr(obj, "_coalesce_calls")
+
+
+def _backend_address(server_id: int) -> str:
+    return f"inproc://caniusethat_server_{server_id}_workers"
+
+
+def _ipc_backend_address(server_id: int) -> str:
+    path = os.path.join(
+        tempfile.gettempdir(), f"caniusethat_{os.getpid()}_{server_id}.ipc"
+    )
+    return f"ipc://{path}"
+
+
+def _control_address(server_id: int) -> str:
+    return f"inproc://caniusethat_server_{server_id}_control"
 
 
 def _force_remote_server_stop(server_address: str) -> Any:
@@ -42,23 +117,80 @@ def _force_remote_server_stop(server_address: str) -> Any:
     request_socket = context.socket(zmq.REQ)
     request_socket.connect(server_address)
 
-    rpc_pickle = pickle.dumps(RemoteProcedureCall("_server", "stop"))
-    request_socket.send(rpc_pickle)
-    result = pickle.loads(request_socket.recv())
+    request_socket.send_multipart(prepare_rpc_frames("_server", "stop", (), {}))
+    result = validate_rpc_response(request_socket.recv_multipart())
     request_socket.close(linger=10)
     return result
 
 
-def _package_reply(reply: Any, error: RemoteProcedureError) -> bytes:
-    return pickle.dumps(RemoteProcedureResponse(reply, error))
+def _package_reply(
+    reply: Any, error: RemoteProcedureError, serializer: str = DEFAULT_SERIALIZER
+) -> List[Any]:
+    codec = get_serializer(serializer)
+    return codec.dumps(RemoteProcedureResponse(codec.out_of_band(reply), error))
+
+
+def _freeze_mutable_buffers(frames: List[Any]) -> List[Any]:
+    """Copies the frames that point to writable memory, e.g. a `bytearray` or a NumPy
+    array still owned by the shared object. ZeroMQ sends frames asynchronously, so
+    those could change while they are being sent. Read-only buffers, like `bytes`,
+    are still sent without copying."""
+    return [
+        frame
+        if isinstance(frame, bytes) or memoryview(frame).readonly
+        else bytes(frame)
+        for frame in frames
+    ]
+
+
+def _run_remote_procedure(
+    method: Callable, header: RemoteProcedureHeader, payload: List[zmq.Frame]
+) -> List[Any]:
+    """Calls the method with the arguments in the payload, returning the frames of
+    the reply, after a frame with the error code, start and run time for the server."""
+    started_at = time.time()
+    run_time = 0.0
+    try:
+        args, kwargs = decode_rpc_payload(header, payload)
+    except Exception as e:
+        call_result: Any = e
+        call_error = RemoteProcedureError.INVALID_RPC
+    else:
+        start = time.perf_counter()
+        try:
+            call_result = method(*args, **kwargs)
+        except Exception as e:
+            call_result = e
+            call_error = RemoteProcedureError.METHOD_EXCEPTION
+        else:
+            call_error = RemoteProcedureError.NO_ERROR
+        run_time = time.perf_counter() - start
+
+    try:
+        reply = _package_reply(call_result, call_error, header.serializer)
+    except Exception as e:
+        call_error = RemoteProcedureError.METHOD_EXCEPTION
+        reply = _package_reply(
+            RuntimeError(f"Could not serialize the result: {e!r}"),
+            call_error,
+            header.serializer,
+        )
+    return [
+        _CALL_STATUS.pack(call_error.value, started_at, run_time),
+        *_freeze_mutable_buffers(reply),
+    ]
 
 
-def _package_error(error: RemoteProcedureError) -> bytes:
-    return _package_reply(None, error)
+def _package_error(
+    error: RemoteProcedureError, serializer: str = DEFAULT_SERIALIZER
+) -> List[Any]:
+    return _package_reply(None, error, serializer)
 
 
-def _package_success_reply(reply: Any) -> bytes:
-    return _package_reply(reply, RemoteProcedureError.NO_ERROR)
+def _package_success_reply(
+    reply: Any, serializer: str = DEFAULT_SERIALIZER
+) -> List[Any]:
+    return _package_reply(reply, RemoteProcedureError.NO_ERROR, serializer)
 
 
 def you_can_use_this(f: Callable) -> Callable:
@@ -114,6 +246,398 @@ def release_lock(f: Callable) -> Callable:
     return wrapper
 
 
+def lock_access(group: Optional[str] = None, shared: bool = False) -> Callable:
+    """A decorator that declares which lock of the object a method needs, and how.
+
+    By default a lock covers the whole object, and is held by one client: the
+    calls of the other clients fail with THING_IS_LOCKED, or wait. A method in a
+    lock `group` only conflicts with the locks of that group and of the whole
+    object, so a sequence on a group does not block the methods of the others.
+    A `shared` method, e.g. one that only reads, runs even when other clients
+    hold a shared lock on its group. Used with `acquire_lock`, it takes a shared
+    lock, that many clients can hold at the same time, and that blocks the
+    methods that are not shared.
+
+    Args:
+        group: The name of the lock group, or None for the whole object.
+        shared: Whether the method can run alongside shared locks of others.
+
+    Example:
+        >>> @you_can_use_this
+        ... @acquire_lock
+        ... @lock_access(group="stage")
+        ... def start_scan(self) -> None:
+        ...     self._stage.start()
+    """
+
+    def decorator(f: Callable) -> Callable:
+        @wraps(f)
+        def wrapper(*args, **kwds):
+            return f(*args, **kwds)
+
+        wrapper._lock_access = (group, shared)  # type: ignore
+        return wrapper
+
+    return decorator
+
+
+def run_concurrently(f: Callable) -> Callable:
+    """A decorator that lets a method run at the same time as other calls to the
+    object, when the object has more than one worker. The method must be thread-safe.
+
+    Calls to the other methods still run one at a time, and never together
+    with a concurrent one.
+
+    Example:
+        >>> @you_can_use_this
+        ... @run_concurrently
+        ... def read_temperature(self) -> float:
+        ...     return self._sensor.read()
+    """
+
+    @wraps(f)
+    def wrapper(*args, **kwds):
+        return f(*args, **kwds)
+
+    wrapper._run_concurrently = True  # type: ignore
+    return wrapper
+
+
+def cacheable(ttl: Optional[float] = None, maxsize: int = 128) -> Callable:
+    """A decorator that lets the server answer a call with the result of a previous
+    call with the same arguments, without running the method again. Only use it
+    for methods that do not change the object, and whose result only depends on
+    their arguments.
+
+    The results are forgotten after `ttl` seconds, and whenever a method that
+    acquires or releases the lock of the object is called.
+
+    Args:
+        ttl: The time in seconds a result is kept for, or None to keep it until
+            it is one of the `maxsize` least recently used ones.
+        maxsize: The maximum number of results kept.
+
+    Example:
+        >>> @you_can_use_this
+        ... @cacheable(ttl=10)
+        ... def get_configuration(self) -> dict:
+        ...     return self._read_configuration_file()
+    """
+    if maxsize < 1:
+        raise ValueError("The cache needs room for at least one result.")
+
+    def decorator(f: Callable) -> Callable:
+        @wraps(f)
+        def wrapper(*args, **kwds):
+            return f(*args, **kwds)
+
+        wrapper._cacheable = (ttl, maxsize)  # type: ignore
+        return wrapper
+
+    return decorator
+
+
+def coalesce_calls(f: Callable) -> Callable:
+    """A decorator that lets the calls with the same arguments share one run of
+    the method, while it is waiting or running. The later calls get the reply
+    of the first one, instead of running the method again right after it.
+
+    Example:
+        >>> @you_can_use_this
+        ... @coalesce_calls
+        ... def get_status(self) -> dict:
+        ...     return self._query_slow_device()
+    """
+
+    @wraps(f)
+    def wrapper(*args, **kwds):
+        return f(*args, **kwds)
+
+    wrapper._coalesce_calls = True  # type: ignore
+    return wrapper
+
+
+class _ResultCache:
+    """The most recent replies of a method, by serialized arguments."""
+
+    def __init__(self, ttl: Optional[float], maxsize: int) -> None:
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.replies: "OrderedDict[Hashable, Tuple[float, List[bytes]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[List[bytes]]:
+        entry = self.replies.get(key)
+        if entry is not None:
+            expiry, reply = entry
+            if expiry > time.monotonic():
+                self.replies.move_to_end(key)
+                self.hits += 1
+                return reply
+            del self.replies[key]
+        self.misses += 1
+        return None
+
+    def put(self, key: Hashable, reply: List[bytes]) -> None:
+        expiry = float("inf") if self.ttl is None else time.monotonic() + self.ttl
+        self.replies[key] = (expiry, reply)
+        self.replies.move_to_end(key)
+        while len(self.replies) > self.maxsize:
+            self.replies.popitem(last=False)
+
+    def clear(self) -> None:
+        self.replies.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.replies)}
+
+
+class _PendingCall(NamedTuple):
+    serial: bool
+    frames: List[Any]
+    cache: Optional[_ResultCache] = None
+    cache_key: Hashable = None
+    invalidates_cache: bool = False
+    # The address and header of the identical calls that wait for this one.
+    followers: Optional[List[Tuple[bytes, Any]]] = None
+    stats: Optional[MethodStats] = None
+    received_at: float = 0.0
+    # The header and the trace of a traced call.
+    trace: Optional[Tuple[RemoteProcedureHeader, Dict[str, Any]]] = None
+    # The `time.perf_counter()` after which nobody waits for the reply.
+    deadline: Optional[float] = None
+    # Where the reply is kept, if the client can send the call again.
+    dedup: Optional["_DedupEntry"] = None
+    # Who sent the call, for the objects that run the calls of each client in turn.
+    client: bytes = b""
+
+
+class _MethodRoute(NamedTuple):
+    """How the server handles the calls to a shared method, decided once in advance."""
+
+    serial: bool
+    acquires_lock: bool
+    releases_lock: bool
+    # The lock group of the method, None for the whole object, and whether it
+    # only needs shared access.
+    lock_group: Optional[str]
+    shared_access: bool
+    coalescing: bool
+    cache: Optional[_ResultCache]
+    stats: MethodStats
+
+
+class _RoutedCall(NamedTuple):
+    """A call to a shared method that passed the checks of the server."""
+
+    queue: "_CallQueue"
+    route: _MethodRoute
+    rpc: RemoteProcedureHeader
+    address: bytes
+    reply_address: bytes
+    header_frame: Any
+    payload: List[Any]
+    received_at: float
+    trace: Optional[Dict[str, Any]]
+
+
+class _ObjectLock:
+    """A lock on an object, or on a group of its methods.
+
+    An exclusive lock has one owner, a shared one can have many. Each owner has
+    the `time.monotonic()` at which its lease ends, infinite if it never does."""
+
+    def __init__(self, shared: bool) -> None:
+        self.shared = shared
+        self.owners: Dict[bytes, float] = {}
+
+
+class _FairQueue:
+    """The calls waiting for a worker, taken from each client in turn, and in order
+    of arrival from the same client. It stands for the deque of an object."""
+
+    def __init__(self) -> None:
+        # The calls of each client, the next client to take a call from first.
+        self._clients: "OrderedDict[bytes, Deque[_PendingCall]]" = OrderedDict()
+        self._length = 0
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __getitem__(self, index: int) -> _PendingCall:
+        if index != 0 or not self._length:
+            raise IndexError("Only the next call can be read.")
+        return next(iter(self._clients.values()))[0]
+
+    def append(self, call: _PendingCall) -> None:
+        calls = self._clients.get(call.client)
+        if calls is None:
+            calls = self._clients[call.client] = deque()
+        calls.append(call)
+        self._length += 1
+
+    def popleft(self) -> _PendingCall:
+        client, calls = self._clients.popitem(last=False)
+        call = calls.popleft()
+        if calls:
+            # The other clients go first.
+            self._clients[client] = calls
+        self._length -= 1
+        return call
+
+    def clear(self) -> None:
+        self._clients.clear()
+        self._length = 0
+
+
+class _RateLimiter:
+    """Lets each client make `rate` calls per second, in bursts of up to one
+    second of calls, and at least one."""
+
+    # Clients that made no call for the longest are forgotten above this number.
+    _MAX_CLIENTS = 1000
+
+    def __init__(self, rate: float) -> None:
+        self.rate = rate
+        self.burst = max(1.0, rate)
+        # The calls each client can make, and when that was last updated, from the
+        # client that made no call for the longest.
+        self.buckets: "OrderedDict[bytes, Tuple[float, float]]" = OrderedDict()
+
+    def allow(self, client: bytes) -> bool:
+        """Returns whether the client can make a call, counting it if so."""
+        now = time.monotonic()
+        tokens, updated = self.buckets.pop(client, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        allowed = tokens >= 1
+        self.buckets[client] = (tokens - 1 if allowed else tokens, now)
+        while self.buckets:
+            # Those with a full bucket are the same as new clients.
+            oldest_tokens, oldest_updated = next(iter(self.buckets.values()))
+            if (
+                len(self.buckets) <= self._MAX_CLIENTS
+                and oldest_tokens + (now - oldest_updated) * self.rate < self.burst
+            ):
+                break
+            self.buckets.popitem(last=False)
+        return allowed
+
+
+class _DedupEntry:
+    """A call that its client can send again, and its reply once there is one.
+
+    The reply goes to where the call was last sent from, as a client sends it again
+    from a new socket."""
+
+    def __init__(
+        self, key: Tuple[str, int], address: bytes, header_frame: Any, created_at: float
+    ) -> None:
+        self.key = key
+        self.address = address
+        self.header_frame = header_frame
+        self.created_at = created_at
+        self.reply: Optional[List[bytes]] = None
+
+
+class _LockWaiter:
+    """A call that waits for the lock of its object to be released."""
+
+    def __init__(self, call: _RoutedCall) -> None:
+        self.call = call
+        self.waiting = True
+
+
+class _ServerCommandError(Exception):
+    """Raised by a `_server` command that fails with an error code."""
+
+    def __init__(self, error: RemoteProcedureError) -> None:
+        super().__init__(error.name)
+        self.error = error
+
+
+class _WorkerPool:
+    """The workers that run the calls of one or more objects."""
+
+    def __init__(self) -> None:
+        self.workers: List[_ObjectWorker] = []
+        self.idle: Deque[bytes] = deque()
+        # Objects with calls that could start as soon as a worker is idle.
+        self.waiting: Deque[_CallQueue] = deque()
+
+
+class _CallQueue:
+    """The calls to an object that are waiting for a worker, in order of arrival."""
+
+    def __init__(self, descriptor: SharedObjectDescriptor, pool: _WorkerPool) -> None:
+        self.descriptor = descriptor
+        self.pool = pool
+        self.pending: Union[Deque[_PendingCall], _FairQueue] = (
+            _FairQueue() if descriptor.fair_scheduling else deque()
+        )
+        self.rate_limiter = (
+            None
+            if descriptor.rate_limit is None
+            else _RateLimiter(descriptor.rate_limit)
+        )
+        self.running = 0
+        self.exclusive = False
+        self.waiting = False
+        self.caches = {
+            method: _ResultCache(ttl, maxsize)
+            for method, (ttl, maxsize) in descriptor.cacheable_methods.items()
+        }
+        self.routes = {
+            method.name: _MethodRoute(
+                method.name not in descriptor.concurrent_methods,
+                method.name in descriptor.locking_methods,
+                method.name in descriptor.unlocking_methods,
+                *descriptor.lock_access.get(method.name, (None, False)),
+                method.name in descriptor.coalescing_methods,
+                self.caches.get(method.name),
+                MethodStats(),
+            )
+            for method in descriptor.shared_methods
+        }
+        # The followers of the coalescing calls that are waiting or running.
+        self.in_flight: Dict[Hashable, List[Tuple[bytes, Any]]] = {}
+        # The calls that wait for the lock of the object, in order of arrival.
+        self.lock_waiters: Deque[_LockWaiter] = deque()
+        self.dispatching_lock_waiters = False
+        # The most calls that waited for a worker or for the lock at the same time.
+        self.peak = 0
+
+    @property
+    def depth(self) -> int:
+        """The number of calls that wait for a worker or for the lock."""
+        return len(self.pending) + len(self.lock_waiters)
+
+    def clear_caches(self) -> None:
+        for cache in self.caches.values():
+            cache.clear()
+        # The calls after this one must not get a reply computed before it.
+        self.in_flight.clear()
+
+
+class _Batch:
+    """Collects the replies to the calls of a batch, to send them back together."""
+
+    def __init__(self, address: bytes, header_frame: Any, size: int) -> None:
+        self.address = address
+        self.header_frame = header_frame
+        self.replies: List[List[Any]] = [[] for _ in range(size)]
+        self.missing = size
+
+    def add_reply(self, index: int, frames: List[Any]) -> bool:
+        """Stores the reply to a call, returning True once every call has one."""
+        self.replies[index] = frames
+        self.missing -= 1
+        return self.missing == 0
+
+    def reply_frames(self) -> List[Any]:
+        return prepare_batch_frames(self.replies)
+
+
 class Server(StoppableThread):
     """The Server takes care of sharing the objects on the network,
     handling the remote procedure calls from multiple users and their
@@ -121,6 +645,26 @@ class Server(StoppableThread):
 
     Attributes:
         router_address (str): The address that the server will listen on.
+        serializers (Optional[List[str]]): The serializers accepted from the clients,
+            all the registered ones if None. Clients negotiate which one to use.
+        shared_workers (Optional[int]): The number of worker threads shared by the
+            objects that do not ask for their own. If None, every object gets its
+            own worker thread.
+        tracer (Optional[Tracer]): Records the traces of the calls that the clients
+            ask to trace, and of a sample of the other ones. If None, the server only
+            sends back the hops of the calls that the clients ask to trace.
+        lock_ttl (Optional[float]): The time in seconds after which the lock of an
+            object expires, if the client that holds it sends no call or heartbeat.
+            A `Thing` sends heartbeats in the background. If None, the locks never
+            expire.
+        dedup_window (float): The time in seconds for which the server remembers
+            the calls of the clients that can send them again, e.g. a `Thing` with
+            `retries`, so that it runs them only once. At most 10000 calls are
+            remembered.
+        max_queue (Optional[int]): The maximum number of calls to an object that
+            wait for a worker or for the lock, after which the calls fail at once
+            with SERVER_BUSY, for the objects added without their own. If None,
+            there is no limit.
 
     Example:
         >>> server = Server("tcp://127.0.0.1:6555")
@@ -129,23 +673,147 @@ class Server(StoppableThread):
     """
 
     _LINGER_TIME = 1000  # milliseconds
-
-    def __init__(self, router_address: str) -> None:
+    _MAX_MESSAGES_PER_WAKEUP = 1000
+    _DEFAULT_SERIALIZER_METHODS = {"get_serializers", "stop"}
+    _MAX_DEDUP_ENTRIES = 10000
+
+    def __init__(
+        self,
+        router_address: str,
+        serializers: Optional[Sequence[str]] = None,
+        shared_workers: Optional[int] = None,
+        tracer: Optional[Tracer] = None,
+        lock_ttl: Optional[float] = None,
+        dedup_window: float = 60.0,
+        max_queue: Optional[int] = None,
+    ) -> None:
         super().__init__()
         self.router_address = router_address
+        self.tracer = tracer
+        if lock_ttl is not None and lock_ttl <= 0:
+            raise ValueError("The lock TTL must be positive.")
+        self.lock_ttl = lock_ttl
+        self.dedup_window = dedup_window
+        if max_queue is not None and max_queue < 1:
+            raise ValueError("The queues need room for at least one call.")
+        self.max_queue = max_queue
+        if shared_workers is not None and shared_workers < 1:
+            raise ValueError("The shared pool needs at least one worker.")
+        self.shared_workers = shared_workers
+        self.serializers = None if serializers is None else list(serializers)
+        for serializer in self.serializers or []:
+            get_serializer(serializer)  # Fail early on unknown serializers.
         self.shared_objects: Dict[str, SharedObjectDescriptor] = {}
         self.shared_objects_queue: Dict[str, SharedObjectDescriptor] = {}
         self.new_object_lock = Lock()
-        self.dealers: Dict[str, Any] = {}
-        self.workers: Dict[str, _ObjectWorker] = {}
-        self.worker_locks: Dict[str, bytes] = {}
+        self.workers: Dict[str, List[_ObjectWorker]] = {}
+        # The locks of each object, by lock group, None for the whole object.
+        self.worker_locks: Dict[str, Dict[Optional[str], _ObjectLock]] = {}
+        # The objects with a timer set to check whether their locks expired.
+        self._lock_timers: Set[str] = set()
+        # The calls that clients can send again, by client and request ID, oldest first.
+        self._dedup: "OrderedDict[Tuple[str, int], _DedupEntry]" = OrderedDict()
+
+        self._backend_address = _backend_address(id(self))
+        self._ipc_backend_address: Optional[str] = None
+        self.worker_processes: Dict[str, multiprocessing.process.BaseProcess] = {}
+        self._worker_ids = itertools.count()
+        self._worker_pools: Dict[bytes, _WorkerPool] = {}
+        self._call_queues: Dict[str, _CallQueue] = {}
+        self._shared_pool = _WorkerPool()
+        self._started_at = time.monotonic()
+        self._batch_slot_ids = itertools.count()
+        self._batch_slots: Dict[bytes, Tuple[_Batch, int]] = {}
+        self._running_calls: Dict[bytes, Tuple[_CallQueue, _PendingCall]] = {}
+        # The callbacks to run at a given time, e.g. when a wait times out.
+        self._timers: List[Tuple[float, int, Callable[[], None]]] = []
+        self._timer_ids = itertools.count()
+
+        self._server_commands: Dict[str, Callable[..., Any]] = {
+            "get_object_methods": self._get_object_methods_command,
+            "get_serializers": lambda _: self.get_serializers(),
+            "get_object_list": lambda _: self.get_object_list(),
+            "get_cache_stats": lambda _: self.get_cache_stats(),
+            "get_stats": lambda _: self.get_stats(),
+            "get_queue_depths": lambda _: self.get_queue_depths(),
+            "get_traces": lambda _, limit=None: self.get_traces(limit),
+            "stop": lambda _: self.stop(),
+            "release_lock_if_any": self._release_lock_if_any_command,
+            "renew_locks": self._renew_locks_command,
+            "force_release_lock": self._force_release_lock_command,
+        }
 
         self.log_lock = Lock()
 
+        # The server loop blocks until there is work to do. Other threads wake it
+        # up through this socket, which is shared and therefore guarded by a lock.
+        self._control_address = _control_address(id(self))
+        self._wake_lock = Lock()
+        self._wake_socket = zmq.Context.instance().socket(zmq.PUSH)
+        self._wake_socket.connect(self._control_address)
+
+    def stop(self):
+        """Request the server to stop, waking up its loop if it is waiting."""
+        super().stop()
+        self._wake_up()
+
+    def _wake_up(self) -> None:
+        with self._wake_lock:
+            if self._wake_socket.closed:
+                return
+            try:
+                self._wake_socket.send(b"", zmq.NOBLOCK)
+            except zmq.Again:
+                # A wake up is already pending, one is enough.
+                pass
+
     def _safe_log(self, message: str, level: int = logging.INFO) -> None:
         with self.log_lock:
             _logger.log(level, message)
 
+    def _send_to_client(
+        self, address: bytes, header_frame: Any, frames: List[Any]
+    ) -> None:
+        if self._batch_slots and address in self._batch_slots:
+            batch, index = self._batch_slots.pop(address)
+            if batch.add_reply(index, [header_frame, *frames]):
+                self._send_to_client(
+                    batch.address, batch.header_frame, batch.reply_frames()
+                )
+            return
+
+        # Replies start with the header of the call, so clients can match them.
+        self.router_socket.send_multipart(
+            [address, b"", header_frame, *frames], copy=False
+        )
+
+    def _finish_trace(
+        self, rpc: RemoteProcedureHeader, trace: Dict[str, Any]
+    ) -> Optional[bytes]:
+        """Records the trace of a call that is being answered, returning the header
+        of the reply, with the hops, if the client asked for them."""
+        trace["hops"]["router_reply"] = time.time()
+        if self.tracer is not None:
+            self.tracer.record(trace)
+        if rpc.flags & RemoteProcedureFlag.TRACED:
+            return encode_rpc_header(rpc._replace(hops=trace["hops"]))
+        return None
+
+    def _call_at(self, when: float, callback: Callable[[], None]) -> None:
+        """Runs the callback in the server loop at the `time.monotonic()` given."""
+        heapq.heappush(self._timers, (when, next(self._timer_ids), callback))
+
+    def _run_due_timers(self) -> Optional[int]:
+        """Runs the callbacks that are due, returning the time in milliseconds
+        until the next one, or None if there are none."""
+        while self._timers:
+            delay = self._timers[0][0] - time.monotonic()
+            if delay > 0:
+                return math.ceil(delay * 1000)
+            _, _, callback = heapq.heappop(self._timers)
+            callback()
+        return None
+
     def _task_setup(self):
         self._safe_log(
             f"Starting 👀 caniusethat server, listening on {self.router_address}."
@@ -153,165 +821,788 @@ class Server(StoppableThread):
         self.context = zmq.Context.instance()
         self.router_socket = self.context.socket(zmq.ROUTER)
         self.router_socket.bind(self.router_address)
+        self.control_socket = self.context.socket(zmq.PULL)
+        self.control_socket.bind(self._control_address)
+        # Workers ask for calls on this socket, and send back their replies.
+        self.backend_socket = self.context.socket(zmq.ROUTER)
+        self.backend_socket.bind(self._backend_address)
 
         self.poller = zmq.Poller()
         self.poller.register(self.router_socket, zmq.POLLIN)
+        self.poller.register(self.control_socket, zmq.POLLIN)
+        self.poller.register(self.backend_socket, zmq.POLLIN)
+
+        # The shared workers find the objects by the name in the header of the call.
+        for _ in range(self.shared_workers or 0):
+            worker_id = f"worker_{next(self._worker_ids)}".encode()
+            worker = _ObjectWorker(
+                self._backend_address, worker_id, self.shared_objects
+            )
+            worker.start()
+            self._shared_pool.workers.append(worker)
+            self._worker_pools[worker_id] = self._shared_pool
+
+        # Objects added before the server started do not need a wake up.
+        with self.new_object_lock:
+            self._process_new_object_queue()
 
     def _task_cleanup(self):
         self._safe_log("Closing 👀 caniusethat server connections.")
         self.poller.unregister(self.router_socket)
         self.router_socket.close(linger=self._LINGER_TIME)
 
-        for dealer_socket in self.dealers.values():
-            self.poller.unregister(dealer_socket)
-            dealer_socket.close(linger=self._LINGER_TIME)
+        with self._wake_lock:
+            self._wake_socket.close(linger=0)
+        self.poller.unregister(self.control_socket)
+        self.control_socket.close(linger=0)
+
+        # Workers wait for their next call, so they are stopped with a message.
+        # Drain the socket first, so that it knows about every connected worker.
+        for _ in receive_ready_messages(
+            self.backend_socket, self._MAX_MESSAGES_PER_WAKEUP
+        ):
+            pass
+        for worker_id in self._worker_pools:
+            self.backend_socket.send_multipart([worker_id, b"", _STOP_WORKER])
+        self.poller.unregister(self.backend_socket)
+        self.backend_socket.close(linger=self._LINGER_TIME)
 
-        for worker in self.workers.values():
-            worker.stop()
+        for workers in [self._shared_pool.workers, *self.workers.values()]:
+            for worker in workers:
+                worker.stop()
+
+        for process in self.worker_processes.values():
+            process.join(timeout=self._LINGER_TIME / 1000)
+            if process.is_alive():
+                process.terminate()
 
     def _task_cycle(self):
-        # Add any new objects to the shared objects.
         with allow_interrupt(self.stop):
-            with self.new_object_lock:
-                self._process_new_object_queue()
-
-            poll_sockets = dict(self.poller.poll(timeout=10))
+            # Block until there is something to do: `add_object` and `stop`
+            # wake us up through the control socket, timers by the poll timeout.
+            poll_sockets = dict(self.poller.poll(self._run_due_timers()))
+
+            # Add any new objects to the shared objects.
+            if poll_sockets.get(self.control_socket) == zmq.POLLIN:
+                for _ in receive_ready_messages(
+                    self.control_socket, self._MAX_MESSAGES_PER_WAKEUP
+                ):
+                    pass
+                with self.new_object_lock:
+                    self._process_new_object_queue()
 
             # Check if there are new requests.
             if poll_sockets.get(self.router_socket) == zmq.POLLIN:
-                address, _, message = self.router_socket.recv_multipart()
-                self._process_incoming_rpc(address, message)
-
-            # Check if there are any new replies
-            for dealer_socket in self.dealers.values():
-                if poll_sockets.get(dealer_socket) == zmq.POLLIN:
-                    self._safe_log(
-                        f"Received reply from worker {dealer_socket}", logging.DEBUG
-                    )
-                    message = dealer_socket.recv_multipart()
-                    # Send the reply back to the client
-                    self.router_socket.send_multipart(message)
-
-    def _process_incoming_rpc(self, address: bytes, message: bytes) -> None:
-        rpc = pickle.loads(message)
+                for address, _, *frames in receive_ready_messages(
+                    self.router_socket, self._MAX_MESSAGES_PER_WAKEUP
+                ):
+                    self._process_incoming_rpc(address.bytes, frames)
+
+            # Check if there are any new replies, or workers ready for a call.
+            if poll_sockets.get(self.backend_socket) == zmq.POLLIN:
+                for worker_id, _, *message in receive_ready_messages(
+                    self.backend_socket, self._MAX_MESSAGES_PER_WAKEUP
+                ):
+                    self._process_worker_message(worker_id.bytes, message)
+
+    def _process_worker_message(self, worker_id: bytes, message: List[Any]) -> None:
+        pool = self._worker_pools[worker_id]
+        pool.idle.append(worker_id)
+
+        # Other than the first one, every message of a worker is a reply.
+        if len(message) > 1:
+            if _logger.isEnabledFor(logging.DEBUG):
+                self._safe_log(
+                    f"Received reply from worker {worker_id!r}", logging.DEBUG
+                )
+            address_frame, header_frame, status, *reply = message
+            address = address_frame.bytes
+            error, started_at, run_time = _CALL_STATUS.unpack(status.bytes)
+            queue, call = self._running_calls.pop(worker_id)
+            queue.running -= 1
+            if call.serial:
+                queue.exclusive = False
+
+            # Update the caches and stats first, so the client sees them up to date.
+            if call.invalidates_cache:
+                queue.clear_caches()
+            elif (
+                call.cache is not None and error == RemoteProcedureError.NO_ERROR.value
+            ):
+                call.cache.put(call.cache_key, [frame.bytes for frame in reply])
+            if call.stats is not None:
+                replies = 1 + len(call.followers or [])
+                call.stats.run_time.observe(run_time)
+                call.stats.bytes_out += replies * sum(map(len, reply))
+                if error != RemoteProcedureError.NO_ERROR.value:
+                    call.stats.errors += replies
+            if (
+                call.followers is not None
+                and queue.in_flight.get(call.cache_key) is call.followers
+            ):
+                del queue.in_flight[call.cache_key]
+
+            if call.dedup is not None:
+                call.dedup.reply = [frame.bytes for frame in reply]
+                address, header_frame = call.dedup.address, call.dedup.header_frame
+            if call.trace is not None:
+                rpc, trace = call.trace
+                trace["hops"]["worker_start"] = started_at
+                trace["hops"]["worker_end"] = started_at + run_time
+                header_frame = self._finish_trace(rpc, trace) or header_frame
+            self._send_to_client(address, header_frame, reply)
+            for follower_address, follower_header_frame in call.followers or []:
+                self._send_to_client(follower_address, follower_header_frame, reply)
+            self._schedule_calls(queue)
+
+        while pool.idle and pool.waiting:
+            queue = pool.waiting.popleft()
+            queue.waiting = False
+            self._schedule_calls(queue)
+
+    def _schedule_calls(self, queue: _CallQueue) -> None:
+        """Sends the calls of an object to idle workers, in order of arrival.
+
+        A call to a method that is not concurrent waits for the running calls of
+        the object to finish, and the following calls wait for it in turn."""
+        pool = queue.pool
+        while queue.pending:
+            call = queue.pending[0]
+            if call.deadline is not None and call.deadline < time.perf_counter():
+                if self._drop_expired_call(queue, call):
+                    continue
+            if queue.exclusive or (call.serial and queue.running):
+                # The end of a running call schedules the object again.
+                return
+            if not pool.idle:
+                if not queue.waiting:
+                    queue.waiting = True
+                    pool.waiting.append(queue)
+                return
+
+            queue.pending.popleft()
+            if call.stats is not None:
+                call.stats.queue_time.observe(time.perf_counter() - call.received_at)
+            if call.trace is not None:
+                call.trace[1]["hops"]["dispatch"] = time.time()
+            worker_id = pool.idle.popleft()
+            self._running_calls[worker_id] = (queue, call)
+            queue.running += 1
+            queue.exclusive = call.serial
+            self.backend_socket.send_multipart(
+                [worker_id, b"", *call.frames], copy=False
+            )
 
-        # Check if the RPC is properly formatted.
-        if not isinstance(rpc, RemoteProcedureCall):
+    def _drop_expired_call(self, queue: _CallQueue, call: _PendingCall) -> bool:
+        """Answers a call that nobody waits for anymore with DEADLINE_EXCEEDED,
+        instead of running it, returning whether it was dropped."""
+        if call.invalidates_cache or call.followers:
+            # The lock was already taken or released for it, or others wait for it.
+            return False
+        queue.pending.popleft()
+        if call.followers is not None and queue.in_flight.get(call.cache_key) is (
+            call.followers
+        ):
+            del queue.in_flight[call.cache_key]
+        reply_address, header_frame = call.frames[0], call.frames[1]
+        serializer = decode_rpc_header(header_frame.bytes).serializer
+        if call.dedup is not None:
+            # The call did not run, so it can run if it is sent again.
+            self._dedup.pop(call.dedup.key, None)
+            reply_address, header_frame = call.dedup.address, call.dedup.header_frame
+        if call.stats is not None:
+            call.stats.errors += 1
+            call.stats.expired += 1
+        if call.trace is not None:
+            rpc, trace = call.trace
+            header_frame = self._finish_trace(rpc, trace) or header_frame
+        self._safe_log(
+            f"Dropped a call to {queue.descriptor.name}, its timeout passed",
+            logging.DEBUG,
+        )
+        self._send_to_client(
+            reply_address,
+            header_frame,
+            _package_error(RemoteProcedureError.DEADLINE_EXCEEDED, serializer),
+        )
+        return True
+
+    def _process_incoming_rpc(
+        self,
+        address: bytes,
+        frames: List[zmq.Frame],
+        reply_address: Optional[bytes] = None,
+    ) -> None:
+        # The calls of a batch are checked as the client that sent them, but their
+        # replies are collected by the batch.
+        if reply_address is None:
+            reply_address = address
+        # Only the header is decoded here, the arguments are left to the worker.
+        reply_serializer = DEFAULT_SERIALIZER
+        header_frame = frames[0] if frames else b""
+        try:
+            header_frame, *payload = frames
+            rpc = decode_rpc_header(header_frame.bytes)
+            if rpc.serializer in available_serializers():
+                # Reply in a format the client understands, even to invalid calls.
+                reply_serializer = rpc.serializer
+            if not self._accepts_serializer(rpc):
+                raise ValueError(f"Serializer {rpc.serializer} is not accepted.")
+            if rpc.name == "_server" and rpc.method == "batch":
+                if reply_address != address:
+                    raise ValueError("Batches cannot be nested.")
+                calls = split_batch_frames(payload)
+                if not calls:
+                    raise ValueError("A batch needs at least one call.")
+            elif rpc.name == "_server":
+                args, _ = decode_rpc_payload(rpc, payload)
+            else:
+                args = ()
+        except Exception:
             self._safe_log(
-                f"Received invalid RemoteProcedureCall: {rpc}", logging.WARNING
+                f"Received invalid remote procedure call from {address!r}",
+                logging.WARNING,
+            )
+            self._send_to_client(
+                reply_address,
+                header_frame,
+                _package_error(RemoteProcedureError.INVALID_RPC, reply_serializer),
             )
-            message = _package_error(RemoteProcedureError.INVALID_RPC)
-            self.router_socket.send_multipart([address, b"", message])
             return
 
-        self._safe_log(f"Received RPC: {rpc}", logging.DEBUG)
-
-        # Check if the RPC is asking for the list of shared methods.
-        if rpc.name == "_server" and rpc.method == "get_object_methods":
-            if rpc.args[0] not in self.shared_objects:
-                self._safe_log(f"No such object: {rpc.args[0]}", logging.WARNING)
-                message = _package_error(RemoteProcedureError.NO_SUCH_THING)
-                self.router_socket.send_multipart([address, b"", message])
-            else:
-                message = _package_success_reply(
-                    self.shared_objects[rpc.args[0]].shared_methods
+        # Formatting the debug messages of every call is not free, skip it if unused.
+        debug = _logger.isEnabledFor(logging.DEBUG)
+        if debug:
+            self._safe_log(f"Received RPC: {rpc}", logging.DEBUG)
+
+        # Check if the RPC is a batch of calls, each one is handled on its own.
+        if rpc.name == "_server" and rpc.method == "batch":
+            batch = _Batch(address, header_frame, len(calls))
+            for index, call_frames in enumerate(calls):
+                slot_address = _BATCH_SLOT_PREFIX + next(self._batch_slot_ids).to_bytes(
+                    8, "big"
                 )
-                self.router_socket.send_multipart([address, b"", message])
+                self._batch_slots[slot_address] = (batch, index)
+                self._process_incoming_rpc(address, call_frames, slot_address)
             return
 
-        # Check if the RPC is asking for the list of shared list.
-        if rpc.name == "_server" and rpc.method == "get_object_list":
-            message = _package_success_reply(list(self.shared_objects.keys()))
-            self.router_socket.send_multipart([address, b"", message])
-            return
-
-        # Check if the RPC is asking for the server to terminate (useful in testing).
-        if rpc.name == "_server" and rpc.method == "stop":
-            message = _package_success_reply(None)
-            self.router_socket.send_multipart([address, b"", message])
-            self.stop()
-            return
+        # A client that sends calls again from a new socket keeps who it is.
+        if rpc.client_id is not None:
+            address = rpc.client_id.encode()
 
-        # Check if the RPC is asking for the server to release a lock.
-        if rpc.name == "_server" and rpc.method == "release_lock_if_any":
-            if self.worker_locks.get(rpc.args[0]) == address:
-                self.worker_locks.pop(rpc.args[0])
-                self._safe_log(f"Released lock for {rpc.args[0]}", logging.DEBUG)
-
-            message = _package_success_reply(None)
-            self.router_socket.send_multipart([address, b"", message])
-            return
-
-        # Check if the RPC is asking for the server to release a lock forcefully.
-        if rpc.name == "_server" and rpc.method == "force_release_lock":
-            if rpc.args[0] in self.worker_locks:
-                self.worker_locks.pop(rpc.args[0])
-                self._safe_log(
-                    f"Forcefully released lock for {rpc.args[0]}", logging.WARNING
+        # Check if the RPC is a command for the server itself.
+        if rpc.name == "_server":
+            command = self._server_commands.get(rpc.method)
+            if command is not None:
+                self._run_server_command(
+                    command, address, reply_address, header_frame, rpc, args
                 )
-
-            message = _package_success_reply(None)
-            self.router_socket.send_multipart([address, b"", message])
-            return
+                return
 
         # Check if the RPC object is in the server.
-        if rpc.name not in self.shared_objects:
+        queue = self._call_queues.get(rpc.name)
+        if queue is None:
             self._safe_log(
                 f"Received RPC for unknown object: {rpc.name}", logging.WARNING
             )
-            message = _package_error(RemoteProcedureError.NO_SUCH_THING)
-            self.router_socket.send_multipart([address, b"", message])
+            self._send_to_client(
+                reply_address,
+                header_frame,
+                _package_error(RemoteProcedureError.NO_SUCH_THING, rpc.serializer),
+            )
             return
 
         # Check if the RPC method is not one of the shared ones.
-        if rpc.method not in [
-            method.name for method in self.shared_objects[rpc.name].shared_methods
-        ]:
+        route = queue.routes.get(rpc.method)
+        if route is None:
             self._safe_log(
                 f"Received RPC for unknown method: {rpc.name}.{rpc.method}",
                 logging.WARNING,
             )
-            message = _package_error(RemoteProcedureError.NO_SUCH_METHOD)
-            self.router_socket.send_multipart([address, b"", message])
+            self._send_to_client(
+                reply_address,
+                header_frame,
+                _package_error(RemoteProcedureError.NO_SUCH_METHOD, rpc.serializer),
+            )
+            return
+
+        stats = route.stats
+        stats.calls += 1
+        stats.bytes_in += sum(map(len, frames))
+
+        # Trace the call if the client asks for it, or if it is sampled.
+        trace = None
+        if rpc.flags & RemoteProcedureFlag.TRACED or (
+            self.tracer is not None and self.tracer.sample()
+        ):
+            trace = start_trace(
+                rpc.name,
+                rpc.method,
+                rpc.request_id,
+                "router_receive",
+                client=address.hex(),
+            )
+
+        call = _RoutedCall(
+            queue,
+            route,
+            rpc,
+            address,
+            reply_address,
+            header_frame,
+            payload,
+            time.perf_counter(),
+            trace,
+        )
+
+        # Check if the call was already received, from a client that sent it again.
+        if rpc.client_id is not None and self._answer_duplicate(call):
+            return
+
+        # Check if the client made too many calls.
+        if queue.rate_limiter is not None and not queue.rate_limiter.allow(address):
+            call.route.stats.rate_limited += 1
+            self._reject_busy_call(call, RemoteProcedureError.RATE_LIMITED)
             return
 
         # Check if the worker has a lock.
-        if (rpc.name in self.worker_locks) and (self.worker_locks[rpc.name] != address):
-            self._safe_log(
-                f"Worker {rpc.name} is already locked by {str(self.worker_locks[rpc.name])}",
-                logging.WARNING,
+        locks = self.worker_locks.get(rpc.name)
+        if locks:
+            if self.lock_ttl is not None:
+                # A call from the owner of a lock renews its lease.
+                self._renew_locks(address, locks)
+            lock_owner = self._lock_conflict(locks, address, route)
+        else:
+            lock_owner = None
+        if lock_owner is not None:
+            if rpc.lock_timeout is not None and rpc.lock_timeout > 0:
+                if self._queue_is_full(call):
+                    return
+                # Wait for the lock, after the calls that are already waiting.
+                waiter = _LockWaiter(call)
+                queue.lock_waiters.append(waiter)
+                queue.peak = max(queue.peak, queue.depth)
+                self._call_at(
+                    time.monotonic() + rpc.lock_timeout,
+                    lambda: self._expire_lock_waiter(waiter),
+                )
+                return
+            self._reject_locked_call(call, lock_owner)
+            return
+
+        self._dispatch_call(call)
+
+    def _queue_is_full(self, call: _RoutedCall) -> bool:
+        """Rejects the call with SERVER_BUSY if too many calls to its object are
+        waiting already, returning whether it did."""
+        max_queue = call.queue.descriptor.max_queue
+        if max_queue is None or call.queue.depth < max_queue:
+            return False
+        call.route.stats.busy_rejections += 1
+        self._reject_busy_call(call, RemoteProcedureError.SERVER_BUSY)
+        return True
+
+    def _reject_busy_call(self, call: _RoutedCall, error: RemoteProcedureError) -> None:
+        rpc, header_frame = call.rpc, call.header_frame
+        call.route.stats.errors += 1
+        self._safe_log(
+            f"Rejected a call to {rpc.name}.{rpc.method} with {error.name}",
+            logging.WARNING,
+        )
+        if call.trace is not None:
+            header_frame = self._finish_trace(rpc, call.trace) or header_frame
+        self._send_to_client(
+            call.reply_address,
+            header_frame,
+            _package_error(error, rpc.serializer),
+        )
+
+    def _reject_locked_call(self, call: _RoutedCall, lock_owner: bytes) -> None:
+        rpc, header_frame = call.rpc, call.header_frame
+        call.route.stats.errors += 1
+        call.route.stats.locked_rejections += 1
+        self._safe_log(
+            f"Worker {rpc.name} is already locked by {str(lock_owner)}",
+            logging.WARNING,
+        )
+        if call.trace is not None:
+            header_frame = self._finish_trace(rpc, call.trace) or header_frame
+        self._send_to_client(
+            call.reply_address,
+            header_frame,
+            _package_error(RemoteProcedureError.THING_IS_LOCKED, rpc.serializer),
+        )
+
+    def _expire_lock_waiter(self, waiter: _LockWaiter) -> None:
+        if not waiter.waiting:
+            return
+        waiter.waiting = False
+        call = waiter.call
+        call.queue.lock_waiters.remove(waiter)
+        lock_owner = self._lock_conflict(
+            self.worker_locks.get(call.rpc.name, {}), call.address, call.route
+        )
+        self._reject_locked_call(call, lock_owner or b"")
+
+    @staticmethod
+    def _lock_conflict(
+        locks: Dict[Optional[str], _ObjectLock], address: bytes, route: _MethodRoute
+    ) -> Optional[bytes]:
+        """Returns the owner of a lock that the call must wait for, if any.
+
+        The locks of a group only block the methods of that group, and those
+        without one. Shared locks do not block the shared methods."""
+        for group, lock in locks.items():
+            if group is not None and route.lock_group not in (None, group):
+                continue
+            if lock.shared and route.shared_access:
+                continue
+            for owner in lock.owners:
+                if owner != address:
+                    return owner
+        return None
+
+    def _dispatch_lock_waiters(self, queue: _CallQueue) -> None:
+        """Dispatches the calls that wait for the lock of the object, in order of
+        arrival, until the object is locked by another client than the next one."""
+        if queue.dispatching_lock_waiters:
+            # A call that releases the lock is dispatched by the loop below.
+            return
+        queue.dispatching_lock_waiters = True
+        try:
+            name = queue.descriptor.name
+            while queue.lock_waiters:
+                waiter = queue.lock_waiters[0]
+                locks = self.worker_locks.get(name)
+                if locks and self._lock_conflict(
+                    locks, waiter.call.address, waiter.call.route
+                ):
+                    return
+                queue.lock_waiters.popleft()
+                waiter.waiting = False
+                if waiter.call.rpc.client_id is not None and self._answer_duplicate(
+                    waiter.call
+                ):
+                    continue
+                self._dispatch_call(waiter.call)
+        finally:
+            queue.dispatching_lock_waiters = False
+
+    def _answer_duplicate(self, call: _RoutedCall) -> bool:
+        """Answers a call that was already received with the reply of the first one,
+        or once it has one, returning whether the call is a duplicate."""
+        client_id = call.rpc.client_id
+        assert client_id is not None
+        entry = self._dedup.get((client_id, call.rpc.request_id))
+        if entry is None:
+            return False
+        self._safe_log(
+            f"Received {call.rpc.name}.{call.rpc.method} again from {client_id}",
+            logging.DEBUG,
+        )
+        if entry.reply is None:
+            entry.address, entry.header_frame = call.reply_address, call.header_frame
+        else:
+            self._send_to_client(call.reply_address, call.header_frame, entry.reply)
+        return True
+
+    def _remember_call(self, call: _RoutedCall) -> _DedupEntry:
+        """Remembers a call that its client can send again, forgetting the old ones."""
+        now = time.monotonic()
+        while self._dedup:
+            oldest = next(iter(self._dedup.values()))
+            if (
+                len(self._dedup) < self._MAX_DEDUP_ENTRIES
+                and oldest.created_at + self.dedup_window > now
+            ):
+                break
+            self._dedup.popitem(last=False)
+        client_id = call.rpc.client_id
+        assert client_id is not None
+        key = (client_id, call.rpc.request_id)
+        entry = self._dedup[key] = _DedupEntry(
+            key, call.reply_address, call.header_frame, now
+        )
+        return entry
+
+    def _dispatch_call(self, call: _RoutedCall) -> None:
+        queue, route, rpc, address = call.queue, call.route, call.rpc, call.address
+        reply_address, header_frame, payload = (
+            call.reply_address,
+            call.header_frame,
+            call.payload,
+        )
+        stats, trace = route.stats, call.trace
+        debug = _logger.isEnabledFor(logging.DEBUG)
+
+        # Check if the result of the same call is in the cache.
+        cache = route.cache
+        cache_key = None
+        if cache is not None or route.coalescing:
+            cache_key = (
+                rpc.method,
+                rpc.serializer,
+                tuple(frame.bytes for frame in payload),
             )
-            message = _package_error(RemoteProcedureError.THING_IS_LOCKED)
-            self.router_socket.send_multipart([address, b"", message])
+        if cache is not None:
+            cached_reply = cache.get(cache_key)
+            if cached_reply is not None:
+                if debug:
+                    self._safe_log(
+                        f"Cache hit for {rpc.name}.{rpc.method}", logging.DEBUG
+                    )
+                stats.bytes_out += sum(map(len, cached_reply))
+                if trace is not None:
+                    header_frame = self._finish_trace(rpc, trace) or header_frame
+                self._send_to_client(reply_address, header_frame, cached_reply)
+                return
+
+        # Check if the same call is already waiting or running, to share its reply.
+        if route.coalescing and cache_key in queue.in_flight:
+            if debug:
+                self._safe_log(
+                    f"Coalescing call to {rpc.name}.{rpc.method}", logging.DEBUG
+                )
+            queue.in_flight[cache_key].append((reply_address, header_frame))
+            return
+
+        # Check if too many calls are waiting already, as the call needs a worker.
+        if self._queue_is_full(call):
             return
 
         # Check if the worker needs to be locked.
-        if (rpc.name not in self.worker_locks) and (
-            rpc.method in self.shared_objects[rpc.name].locking_methods
-        ):
-            self._safe_log(
-                f"Locking worker {rpc.name} to {str(address)}", logging.DEBUG
-            )
-            self.worker_locks[rpc.name] = address
+        if route.acquires_lock:
+            self._acquire_lock(rpc.name, route, address)
+
+        followers = None
+        if route.coalescing:
+            followers = queue.in_flight[cache_key] = []
+
+        invalidates_cache = route.acquires_lock or route.releases_lock
+        if invalidates_cache:
+            # Also cleared when the call ends, to drop results computed meanwhile.
+            queue.clear_caches()
 
         # Everything looks good so far, dispatch the RPC to the correct worker.
-        self._safe_log(f"Dispatching RPC to worker {rpc.name}", logging.DEBUG)
-        self.dealers[rpc.name].send_multipart([address, b"", message])
+        if debug:
+            self._safe_log(f"Dispatching RPC to worker {rpc.name}", logging.DEBUG)
+        queue.pending.append(
+            _PendingCall(
+                route.serial,
+                [reply_address, header_frame, *payload],
+                cache,
+                cache_key,
+                invalidates_cache,
+                followers,
+                stats,
+                call.received_at,
+                None if trace is None else (rpc, trace),
+                None if rpc.timeout is None else call.received_at + rpc.timeout,
+                None if rpc.client_id is None else self._remember_call(call),
+                address,
+            )
+        )
+        queue.peak = max(queue.peak, queue.depth)
+        self._schedule_calls(queue)
 
         # Check if the worker needs to be unlocked.
-        if (rpc.name in self.worker_locks) and (
-            rpc.method in self.shared_objects[rpc.name].unlocking_methods
-        ):
-            self._safe_log(f"Unlocking worker {rpc.name}", logging.DEBUG)
-            self.worker_locks.pop(rpc.name)
+        if route.releases_lock:
+            self._release_lock(rpc.name, route.lock_group, address)
+
+    def _acquire_lock(self, name: str, route: _MethodRoute, address: bytes) -> None:
+        locks = self.worker_locks.setdefault(name, {})
+        lock = locks.get(route.lock_group)
+        if lock is None:
+            lock = locks[route.lock_group] = _ObjectLock(route.shared_access)
+        elif address in lock.owners:
+            if lock.shared and not route.shared_access:
+                # Its only owner, as the others would conflict with the call, makes
+                # the shared lock exclusive.
+                self._safe_log(
+                    f"Making the lock of {name} ({route.lock_group}) exclusive",
+                    logging.DEBUG,
+                )
+                lock.shared = False
+            return
+        elif not lock.shared:
+            return
+        self._safe_log(
+            f"Locking worker {name} ({route.lock_group}) to {str(address)}",
+            logging.DEBUG,
+        )
+        if self.lock_ttl is None:
+            lock.owners[address] = float("inf")
+            return
+        expiry = lock.owners[address] = time.monotonic() + self.lock_ttl
+        if name not in self._lock_timers:
+            self._lock_timers.add(name)
+            self._call_at(expiry, lambda: self._expire_locks(name))
+
+    def _release_lock(
+        self,
+        name: str,
+        group: Optional[str],
+        address: Optional[bytes] = None,
+    ) -> None:
+        """Releases a lock of the object held by the client, or by anyone if the
+        address is None, letting the calls waiting for it run."""
+        locks = self.worker_locks.get(name, {})
+        lock = locks.get(group)
+        if lock is None:
+            return
+        if address is None:
+            lock.owners.clear()
+        elif lock.owners.pop(address, None) is None:
+            return
+        self._safe_log(f"Unlocking worker {name} ({group})", logging.DEBUG)
+        if not lock.owners:
+            del locks[group]
+        if not locks:
+            self.worker_locks.pop(name, None)
+        self._dispatch_lock_waiters(self._call_queues[name])
+
+    def _renew_locks(
+        self, address: bytes, locks: Dict[Optional[str], _ObjectLock]
+    ) -> None:
+        assert self.lock_ttl is not None
+        expiry = time.monotonic() + self.lock_ttl
+        for lock in locks.values():
+            if address in lock.owners:
+                lock.owners[address] = expiry
+
+    def _expire_locks(self, name: str) -> None:
+        """Releases the locks of the object whose lease ended, and checks again
+        when the next one ends."""
+        self._lock_timers.discard(name)
+        now = time.monotonic()
+        expired = [
+            (group, owner)
+            for group, lock in self.worker_locks.get(name, {}).items()
+            for owner, expiry in lock.owners.items()
+            if expiry <= now
+        ]
+        for group, owner in expired:
+            self._safe_log(
+                f"The lock of {name} ({group}) held by {str(owner)} expired",
+                logging.WARNING,
+            )
+            self._release_lock(name, group, owner)
+        locks = self.worker_locks.get(name)
+        if locks and name not in self._lock_timers:
+            self._lock_timers.add(name)
+            self._call_at(
+                min(min(lock.owners.values()) for lock in locks.values()),
+                lambda: self._expire_locks(name),
+            )
+
+    def _run_server_command(
+        self,
+        command: Callable[..., Any],
+        address: bytes,
+        reply_address: bytes,
+        header_frame: Any,
+        rpc: RemoteProcedureHeader,
+        args: Sequence[Any],
+    ) -> None:
+        try:
+            result = command(address, *args)
+        except _ServerCommandError as e:
+            reply = _package_error(e.error, rpc.serializer)
+        except Exception:
+            self._safe_log(
+                f"Received invalid arguments for _server.{rpc.method}: {args!r}",
+                logging.WARNING,
+            )
+            reply = _package_error(RemoteProcedureError.INVALID_RPC, rpc.serializer)
+        else:
+            reply = _package_success_reply(result, rpc.serializer)
+        self._send_to_client(reply_address, header_frame, reply)
+
+    def _get_object_methods_command(
+        self, address: bytes, name: str
+    ) -> List[SharedMethodDescriptor]:
+        if name not in self.shared_objects:
+            self._safe_log(f"No such object: {name}", logging.WARNING)
+            raise _ServerCommandError(RemoteProcedureError.NO_SUCH_THING)
+        return self.get_object_methods(name)
+
+    def _release_lock_if_any_command(self, address: bytes, name: str) -> None:
+        for group, lock in list(self.worker_locks.get(name, {}).items()):
+            if address in lock.owners:
+                self._release_lock(name, group, address)
+                self._safe_log(f"Released lock for {name} ({group})", logging.DEBUG)
+
+    def _force_release_lock_command(self, address: bytes, name: str) -> None:
+        for group in list(self.worker_locks.get(name, {})):
+            self._release_lock(name, group)
+            self._safe_log(
+                f"Forcefully released lock for {name} ({group})", logging.WARNING
+            )
+
+    def _renew_locks_command(self, address: bytes) -> Optional[float]:
+        """Renews the leases of the locks held by the client, returning their TTL."""
+        if self.lock_ttl is not None:
+            for locks in self.worker_locks.values():
+                self._renew_locks(address, locks)
+        return self.lock_ttl
+
+    def _accepts_serializer(self, rpc: RemoteProcedureHeader) -> bool:
+        if rpc.serializer in self.get_serializers():
+            return True
+        # The negotiation itself, and stopping the server, always work with the
+        # default serializer. These calls have no arguments to deserialize.
+        return (
+            rpc.name == "_server"
+            and rpc.method in self._DEFAULT_SERIALIZER_METHODS
+            and rpc.serializer == DEFAULT_SERIALIZER
+            and bool(rpc.flags & RemoteProcedureFlag.NO_ARGUMENTS)
+        )
 
-    def add_object(self, name: str, obj: Any):
+    def add_object(
+        self,
+        name: str,
+        obj: Any,
+        workers: Optional[int] = None,
+        separate_process: bool = False,
+        max_queue: Optional[int] = None,
+        fair_scheduling: bool = False,
+        rate_limit: Optional[float] = None,
+    ):
         """Add an object to the server.
 
         Args:
             name: A unique name that will be used to refer to the object.
             obj: The object to add to the server.
+            workers: The number of threads that run the calls to the object. Only
+                the methods marked with `run_concurrently` run at the same time.
+                If None, the object uses the shared workers of the server if it
+                has any, otherwise a thread of its own.
+            separate_process: Run the workers in a child process, so that the calls
+                do not compete for the GIL with the server and the other objects.
+                The object is pickled and sent to the child process, from then on
+                the calls change the copy in the child process, not `obj`.
+            max_queue: The maximum number of calls to the object that wait for a
+                worker or for the lock, after which the calls fail at once with
+                SERVER_BUSY. If None, the `max_queue` of the server.
+            fair_scheduling: Run the waiting calls of each client in turn, instead
+                of in order of arrival, so that a client that makes many calls does
+                not hold up the others. The calls of each client still run in order.
+            rate_limit: The number of calls per second that each client can make
+                to the object, in bursts of up to one second of calls, after which
+                the calls fail at once with RATE_LIMITED. If None, there is no limit.
         """
+        if workers is None:
+            use_shared_pool = self.shared_workers is not None and not separate_process
+            workers = 0 if use_shared_pool else 1
+        elif workers < 1:
+            raise ValueError(f"An object needs at least one worker, not {workers}.")
+        if max_queue is None:
+            max_queue = self.max_queue
+        elif max_queue < 1:
+            raise ValueError("The queue needs room for at least one call.")
+        if rate_limit is not None and rate_limit <= 0:
+            raise ValueError("The rate limit must be positive.")
+
         # Build the SharedObjectDescriptor
         shared_methods = []
         for method_name, method in inspect.getmembers(obj, _is_shared_method):
@@ -334,23 +1625,82 @@ class Server(StoppableThread):
         for method_name, method in inspect.getmembers(obj, _is_unlocking_method):
             unlocking_methods.append(method_name)
 
-        if (locking_methods) and (not unlocking_methods):
+        lock_access = {}
+        for method_name, method in inspect.getmembers(obj, _is_lock_access_method):
+            lock_access[method_name] = method._lock_access
+
+        # Every lock group that can be locked must also be unlockable.
+        locking_groups = {
+            lock_access.get(method_name, (None, False))[0]
+            for method_name in locking_methods
+        }
+        unlocking_groups = {
+            lock_access.get(method_name, (None, False))[0]
+            for method_name in unlocking_methods
+        }
+        for group in locking_groups - unlocking_groups:
             raise RuntimeError(
-                f"Locking methods found in {obj:!r} but no unlocking methods."
+                f"Locking methods found in {obj!r} but no unlocking methods"
+                + ("." if group is None else f" in lock group {group}.")
             )
 
-        if (unlocking_methods) and (not locking_methods):
+        for group in unlocking_groups - locking_groups:
             raise RuntimeError(
-                f"Unlocking methods found in {obj:!r} but no locking methods."
+                f"Unlocking methods found in {obj!r} but no locking methods"
+                + ("." if group is None else f" in lock group {group}.")
+            )
+
+        concurrent_methods = []
+        for method_name, method in inspect.getmembers(obj, _is_concurrent_method):
+            if method_name in locking_methods or method_name in unlocking_methods:
+                raise RuntimeError(
+                    f"Method {method_name} of {obj!r} acquires or releases the lock, it cannot run concurrently."
+                )
+            concurrent_methods.append(method_name)
+
+        cacheable_methods = {}
+        for method_name, method in inspect.getmembers(obj, _is_cacheable_method):
+            if method_name in locking_methods or method_name in unlocking_methods:
+                raise RuntimeError(
+                    f"Method {method_name} of {obj!r} acquires or releases the lock, its results cannot be cached."
+                )
+            cacheable_methods[method_name] = method._cacheable
+
+        coalescing_methods = []
+        for method_name, method in inspect.getmembers(obj, _is_coalescing_method):
+            if method_name in locking_methods or method_name in unlocking_methods:
+                raise RuntimeError(
+                    f"Method {method_name} of {obj!r} acquires or releases the lock, its calls cannot be coalesced."
+                )
+            coalescing_methods.append(method_name)
+
+        if workers > 1 and not concurrent_methods:
+            self._safe_log(
+                f"Object {name} has {workers} workers but no concurrent methods.",
+                logging.WARNING,
             )
 
         descriptor = SharedObjectDescriptor(
-            name, obj, shared_methods, locking_methods, unlocking_methods
+            name,
+            obj,
+            shared_methods,
+            locking_methods,
+            unlocking_methods,
+            concurrent_methods,
+            cacheable_methods,
+            coalescing_methods,
+            lock_access,
+            workers,
+            separate_process,
+            max_queue,
+            fair_scheduling,
+            rate_limit,
         )
 
         self._safe_log(f"Adding object {name} to server")
         with self.new_object_lock:
             self.shared_objects_queue[name] = descriptor
+        self._wake_up()
 
     def get_object_methods(self, name: str) -> List[SharedMethodDescriptor]:
         """Returns a list of methods of the object with the given name.
@@ -370,6 +1720,79 @@ class Server(StoppableThread):
         """
         return list(self.shared_objects.keys())
 
+    def get_stats(self) -> Dict[str, Any]:
+        """Returns what the server measured about the calls it received.
+
+        Returns:
+            A dictionary with the `uptime` of the server in seconds, the `methods`
+            with the stats of each method by object name, see
+            `caniusethat.metrics.MethodStats`, and the `queues` of each object,
+            see `get_queue_depths`."""
+        call_queues = list(self._call_queues.items())
+        return {
+            "uptime": time.monotonic() - self._started_at,
+            "methods": {
+                name: {
+                    method: route.stats.as_dict()
+                    for method, route in queue.routes.items()
+                }
+                for name, queue in call_queues
+            },
+            "queues": self.get_queue_depths(),
+        }
+
+    def get_queue_depths(self) -> Dict[str, Dict[str, Any]]:
+        """Returns how many calls to each object are waiting and running.
+
+        Returns:
+            A dictionary with, by object name, the number of calls `pending` for a
+            worker, `waiting_for_lock` and `running`, the `peak` number of calls
+            that waited at the same time, and the `limit` on them, or None."""
+        return {
+            name: {
+                "pending": len(queue.pending),
+                "waiting_for_lock": len(queue.lock_waiters),
+                "running": queue.running,
+                "peak": queue.peak,
+                "limit": queue.descriptor.max_queue,
+            }
+            for name, queue in list(self._call_queues.items())
+        }
+
+    def get_traces(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Returns the last traces recorded by the server, oldest first.
+
+        Args:
+            limit: The number of traces to return, or None for all of them.
+
+        Returns:
+            The traces kept by the `RingBufferSink` of the tracer of the server,
+            or an empty list if the server does not keep them in memory."""
+        if self.tracer is None or not isinstance(self.tracer.sink, RingBufferSink):
+            return []
+        return self.tracer.sink.recent(limit)
+
+    def get_cache_stats(self) -> Dict[str, Dict[str, Dict[str, int]]]:
+        """Returns the hits, misses and size of the cache of each cacheable method.
+
+        Returns:
+            A dictionary by object name, then by method name."""
+        return {
+            name: {method: cache.stats() for method, cache in queue.caches.items()}
+            for name, queue in list(self._call_queues.items())
+            if queue.caches
+        }
+
+    def get_serializers(self) -> List[str]:
+        """Returns the names of the serializers accepted by the server.
+
+        Returns:
+            A list of strings.
+        """
+        if self.serializers is None:
+            return available_serializers()
+        return list(self.serializers)
+
     def _process_new_object_queue(self):
         # First obtain a list of the names, we don't want to change the
         # dictionary while we're iterating over it.
@@ -385,58 +1808,120 @@ class Server(StoppableThread):
 
             self.shared_objects[name] = descriptor
 
-            dealer_socket = self.context.socket(zmq.DEALER)
-            dealer_socket.bind(_dealer_address(name))
-            self.poller.register(dealer_socket, zmq.POLLIN)
-            self.dealers[name] = dealer_socket
-
-            worker = _ObjectWorker(name, descriptor)
-            worker.start()
-            self.workers[name] = worker
+            if descriptor.workers == 0:
+                # Nothing to start, the object costs nothing until it is called.
+                self._call_queues[name] = _CallQueue(descriptor, self._shared_pool)
+                continue
+
+            pool = _WorkerPool()
+            worker_ids = [
+                f"worker_{next(self._worker_ids)}".encode()
+                for _ in range(descriptor.workers)
+            ]
+            for worker_id in worker_ids:
+                self._worker_pools[worker_id] = pool
+            self._call_queues[name] = _CallQueue(descriptor, pool)
+
+            if descriptor.separate_process:
+                self.worker_processes[name] = self._start_worker_process(
+                    worker_ids, descriptor
+                )
+            else:
+                for worker_id in worker_ids:
+                    worker = _ObjectWorker(
+                        self._backend_address, worker_id, {name: descriptor}
+                    )
+                    worker.start()
+                    pool.workers.append(worker)
+                self.workers[name] = pool.workers
+
+    def _start_worker_process(
+        self, worker_ids: List[bytes], descriptor: SharedObjectDescriptor
+    ) -> multiprocessing.process.BaseProcess:
+        # Child processes cannot reach inproc sockets, the backend listens on ipc too.
+        if self._ipc_backend_address is None:
+            self._ipc_backend_address = _ipc_backend_address(id(self))
+            self.backend_socket.bind(self._ipc_backend_address)
+
+        # Spawn a fresh interpreter, forking a process that uses ZeroMQ is not safe.
+        process = multiprocessing.get_context("spawn").Process(
+            target=_run_worker_process,
+            args=(self._ipc_backend_address, worker_ids, descriptor),
+            name=f"caniusethat_{descriptor.name}",
+            daemon=True,
+        )
+        process.start()
+        return process
 
 
 class _ObjectWorker(StoppableThread):
+    """Runs the calls that the server sends it, one at a time.
+
+    The worker announces itself when it starts, and every reply tells the server
+    that it is ready for the next call, so it only gets calls when it is idle."""
+
     _LINGER_TIME = 1000  # milliseconds
 
-    def __init__(self, worker_name: str, shared_object: SharedObjectDescriptor) -> None:
+    def __init__(
+        self,
+        backend_address: str,
+        worker_id: bytes,
+        shared_objects: Dict[str, SharedObjectDescriptor],
+    ) -> None:
         super().__init__()
-        self.worker_name = worker_name
-        self.shared_object = shared_object
-
-    def reply_address(self) -> str:
-        return _dealer_address(self.worker_name)
+        # The server stops its workers, this is a fallback if it could not.
+        self.daemon = True
+        self.backend_address = backend_address
+        self.worker_id = worker_id
+        self.shared_objects = shared_objects
+        self._bound_methods: Dict[Tuple[str, str], Callable] = {}
+
+    def _find_method(self, header: RemoteProcedureHeader) -> Callable:
+        # The server only sends calls to shared methods, bind them only once.
+        key = (header.name, header.method)
+        method = self._bound_methods.get(key)
+        if method is None:
+            method = getattr(self.shared_objects[header.name].obj, header.method)
+            self._bound_methods[key] = method
+        return method
 
     def _task_setup(self):
         self.context = zmq.Context.instance()
-        self.reply_socket = self.context.socket(zmq.REP)
-        self.reply_socket.connect(self.reply_address())
-
-        self.poller = zmq.Poller()
-        self.poller.register(self.reply_socket, zmq.POLLIN)
+        self.worker_socket = self.context.socket(zmq.DEALER)
+        self.worker_socket.setsockopt(zmq.ROUTING_ID, self.worker_id)
+        self.worker_socket.connect(self.backend_address)
+        self.worker_socket.send_multipart([b"", _WORKER_READY])
 
     def _task_cleanup(self):
-        self.reply_socket.close(linger=self._LINGER_TIME)
+        self.worker_socket.close(linger=self._LINGER_TIME)
 
     def _task_cycle(self):
         with allow_interrupt(self.stop):
-            # Wait for a request
-            poll_sockets = dict(self.poller.poll(timeout=10))
+            # Wait for a call, the server sends one only when we are idle.
+            _, *message = self.worker_socket.recv_multipart(copy=False)
+            if len(message) == 1:
+                self.stop()
+                return
+            address, header_frame, *payload = message
+            header = decode_rpc_header(header_frame.bytes)
+
+            reply = _run_remote_procedure(self._find_method(header), header, payload)
+
+            # Send the result back to the client, through the server.
+            self.worker_socket.send_multipart(
+                [b"", address, header_frame, *reply], copy=False
+            )
 
-            # Check if there are new requests
-            if poll_sockets.get(self.reply_socket) == zmq.POLLIN:
-                message = self.reply_socket.recv()
-                rpc: RemoteProcedureCall = pickle.loads(message)
 
-                try:
-                    call_result = self.shared_object.obj.__getattribute__(rpc.method)(
-                        *rpc.args, **rpc.kwargs
-                    )
-                except Exception as e:
-                    call_result = e
-                    call_error = RemoteProcedureError.METHOD_EXCEPTION
-                else:
-                    call_error = RemoteProcedureError.NO_ERROR
-
-                response = RemoteProcedureResponse(call_result, call_error)
-                # Send the result back to the client
-                self.reply_socket.send(pickle.dumps(response))
+def _run_worker_process(
+    backend_address: str, worker_ids: List[bytes], descriptor: SharedObjectDescriptor
+) -> None:
+    """Runs the workers of an object in a child process, until the server stops them."""
+    workers = [
+        _ObjectWorker(backend_address, worker_id, {descriptor.name: descriptor})
+        for worker_id in worker_ids
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
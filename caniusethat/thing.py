@@ -1,16 +1,615 @@
+import itertools
+import time
 import types
-from threading import Condition
-from typing import Any, Callable, List
+import uuid
+from concurrent.futures import Future, InvalidStateError
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from threading import Lock
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
 
 import zmq
 from zmq.utils.win32 import allow_interrupt
 
 from caniusethat._logging import getLogger
-from caniusethat._types import SharedMethodDescriptor
-from caniusethat.rpc_utils import prepare_rpc_pickle, validate_rpc_response
+from caniusethat._thread import StoppableThread
+from caniusethat._types import (
+    RemoteProcedureError,
+    RemoteProcedureFlag,
+    RemoteProcedureResponse,
+    SharedMethodDescriptor,
+)
+from caniusethat.rpc_utils import (
+    decode_rpc_header,
+    prepare_rpc_batch_frames,
+    prepare_rpc_frames,
+    receive_ready_messages,
+    reply_request_id,
+    validate_rpc_batch_response,
+    validate_rpc_response,
+)
+from caniusethat.serializers import DEFAULT_SERIALIZER, choose_serializer
+from caniusethat.tracing import Tracer, start_trace
 
 _logger = getLogger(__name__)
 
+# How many heartbeats renew the locks held by a client within their TTL, so that
+# a late heartbeat does not let them expire.
+HEARTBEATS_PER_LOCK_TTL = 3
+
+
+def _resolve_future(future: Future, setter: Callable, value: Any) -> None:
+    try:
+        setter(value)
+    except InvalidStateError:
+        # The future was cancelled by the caller in the meantime.
+        pass
+
+
+def _validate_object_description(
+    object_description: Any,
+) -> List[SharedMethodDescriptor]:
+    """Checks that the server answered with a list of method descriptors."""
+    if not isinstance(object_description, list):
+        raise RuntimeError(
+            f"Received invalid RemoteProcedureResponse: {object_description}"
+        )
+    for method_descriptor in object_description:
+        if not isinstance(method_descriptor, SharedMethodDescriptor):
+            raise RuntimeError(
+                f"Received invalid RemoteProcedureResponse: {object_description}"
+            )
+    return object_description
+
+
+def _finish_trace(tracer: Tracer, trace: Dict[str, Any], reply: Sequence[Any]) -> None:
+    """Records the trace of a call, with the hops that the server sent back."""
+    received_at = time.time()
+    header_frame = reply[0]
+    hops = decode_rpc_header(getattr(header_frame, "bytes", header_frame)).hops
+    trace["hops"].update(hops or {})
+    trace["hops"]["thing_receive"] = received_at
+    tracer.record(trace)
+
+
+def _check_method_name(name: str, reserved_names: Sequence[str]) -> None:
+    if name in reserved_names:
+        raise RuntimeError(
+            f"Method name `{name}` is reserved for internal use, please change it in the remote class."
+        )
+
+
+class _PendingReply(NamedTuple):
+    """A call sent by a `Thing` that waits for its reply."""
+
+    future: Future
+    serializer: str
+    validate: Callable
+    trace: Optional[Dict[str, Any]]
+    # The frames of the call and how many times they can be sent again, if the
+    # connection is lost.
+    frames: Optional[List[Any]] = None
+    retries: int = 0
+
+
+def _no_reply_error(timeout: Optional[float]) -> TimeoutError:
+    return TimeoutError(f"No reply from the 👀 caniusethat server within {timeout} s.")
+
+
+class _ThingConnection(StoppableThread):
+    """Owns the DEALER socket of a `Thing`.
+
+    Until the thread is started, the calls that wait for their reply use the
+    socket directly, from the thread that makes them, one at a time. The first
+    asynchronous call, or the heartbeat, starts the thread, which owns the socket
+    from then on, so that the server still sees one client.
+
+    Once started, calls are handed over to this thread through an inproc socket,
+    so that any thread can make them. Replies resolve the future of their call,
+    matched by request ID, so many calls can be in flight at the same time. The
+    heartbeat renews the leases of the locks held on the server, and finds out
+    when the connection is lost. The socket is then made again, and the calls
+    waiting for a reply are sent again, or fail if they have no retries left.
+    """
+
+    _LINGER_TIME = 1000  # ms
+    _MAX_MESSAGES_PER_WAKEUP = 1000
+    # The connection is lost after this many heartbeats without any reply.
+    _HEARTBEAT_LIVENESS = 3
+    _MAX_RETRY_BACKOFF = 10.0  # s
+
+    def __init__(
+        self,
+        server_address: str,
+        tracer: Optional[Tracer] = None,
+        retries: int = 0,
+        retry_backoff: float = 0.1,
+    ) -> None:
+        super().__init__()
+        self.daemon = True
+        self.server_address = server_address
+        self.tracer = tracer
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        # Calls that can be sent again tell the server who sent them, so that it
+        # runs them only once, whichever socket they come from.
+        self.client_id = uuid.uuid4().hex if retries else None
+        self._pending: Dict[int, _PendingReply] = {}
+        self._pending_lock = Lock()
+        self._request_ids = itertools.count(1)
+        # The interval of the heartbeat and its serializer, if it is started.
+        self._heartbeat: Optional[Tuple[float, str]] = None
+        self._next_heartbeat = 0.0
+        self._last_reply = 0.0
+        # How much longer than usual to wait for a reply after a reconnection.
+        self._backoff = 0.0
+
+        self._pipe_address = f"inproc://caniusethat_thing_{id(self)}"
+        self._send_lock = Lock()
+        self._send_socket = zmq.Context.instance().socket(zmq.PUSH)
+        self._send_socket.connect(self._pipe_address)
+
+        # Whether the socket is used directly, as the thread is not started yet.
+        self._direct = True
+        self._direct_lock = Lock()
+        self.poller = zmq.Poller()
+        self._connect()
+
+    def call(
+        self,
+        name: str,
+        method: str,
+        args,
+        kwargs,
+        serializer: str,
+        lock_timeout: Optional[float] = None,
+        timeout: Optional[float] = None,
+        sends: int = 1,
+    ) -> Any:
+        """Makes a call to the server and waits for its result, raising
+        `TimeoutError` if it does not come within `timeout` seconds. It is sent
+        again, with the same request ID, up to `sends` times in all."""
+        request_id, frames, trace = self._prepare_call(
+            name, method, args, kwargs, serializer, lock_timeout, timeout
+        )
+        return self._call_frames(
+            request_id,
+            frames,
+            serializer,
+            validate_rpc_response,
+            trace,
+            timeout,
+            sends,
+        )
+
+    def call_batch(
+        self,
+        calls: Sequence[Tuple[str, str, Any, Any]],
+        serializer: str,
+        timeout: Optional[float] = None,
+    ) -> List[RemoteProcedureResponse]:
+        """Makes many calls to the server in one message, and waits for the list
+        of their responses."""
+        request_id = next(self._request_ids)
+        frames = prepare_rpc_batch_frames(calls, serializer, request_id)
+        responses: List[RemoteProcedureResponse] = self._call_frames(
+            request_id, frames, serializer, validate_rpc_batch_response, None, timeout
+        )
+        return responses
+
+    def submit(
+        self,
+        name: str,
+        method: str,
+        args,
+        kwargs,
+        serializer: str,
+        lock_timeout: Optional[float] = None,
+        timeout: Optional[float] = None,
+    ) -> "Future[Any]":
+        """Sends a call to the server, returning the future of its result."""
+        self._hand_over()
+        request_id, frames, trace = self._prepare_call(
+            name, method, args, kwargs, serializer, lock_timeout, timeout
+        )
+        return self._submit_frames(
+            request_id, frames, serializer, validate_rpc_response, trace
+        )
+
+    def _wait_for_reply(
+        self, request_id: int, future: "Future[Any]", timeout: Optional[float]
+    ) -> Any:
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            # A late reply is dropped, and the call is not sent again.
+            future.cancel()
+            with self._pending_lock:
+                self._pending.pop(request_id, None)
+            raise _no_reply_error(timeout) from None
+
+    def _prepare_call(
+        self,
+        name: str,
+        method: str,
+        args,
+        kwargs,
+        serializer: str,
+        lock_timeout: Optional[float],
+        timeout: Optional[float],
+    ) -> Tuple[int, List[Any], Optional[Dict[str, Any]]]:
+        request_id = next(self._request_ids)
+        flags = RemoteProcedureFlag.NONE
+        trace = None
+        if self.tracer is not None and self.tracer.sample():
+            flags = RemoteProcedureFlag.TRACED
+            trace = start_trace(name, method, request_id, "thing_send")
+        frames = prepare_rpc_frames(
+            name,
+            method,
+            args,
+            kwargs,
+            serializer,
+            request_id,
+            flags,
+            lock_timeout,
+            timeout,
+            self.client_id,
+        )
+        return request_id, frames, trace
+
+    def _call_frames(
+        self,
+        request_id: int,
+        frames: List[Any],
+        serializer: str,
+        validate: Callable,
+        trace: Optional[Dict[str, Any]],
+        timeout: Optional[float],
+        sends: int = 1,
+    ) -> Any:
+        with self._direct_lock:
+            if self._direct:
+                reply = self._send_and_receive(request_id, frames, timeout, sends)
+                return self._validate_reply(reply, serializer, validate, trace)
+        future = self._submit_frames(request_id, frames, serializer, validate, trace)
+        for _ in range(sends - 1):
+            try:
+                return future.result(timeout)
+            except FutureTimeoutError:
+                self._send_frames(frames)
+        return self._wait_for_reply(request_id, future, timeout)
+
+    def _send_and_receive(
+        self,
+        request_id: int,
+        frames: List[Any],
+        timeout: Optional[float],
+        sends: int = 1,
+    ) -> List[zmq.Frame]:
+        """Sends a call on the socket, and receives replies until its own one,
+        sending it again each time `timeout` passes. The late replies of the
+        calls that timed out are dropped."""
+        if self.dealer_socket.closed:
+            raise RuntimeError("Connection to 👀 caniusethat server is closed.")
+        for _ in range(sends):
+            deadline = None if timeout is None else time.monotonic() + timeout
+            # The empty frame mimics the envelope of a REQ socket.
+            self.dealer_socket.send_multipart([b"", *frames], copy=False)
+            while True:
+                poll_timeout = None
+                if deadline is not None:
+                    poll_timeout = max(0.0, deadline - time.monotonic()) * 1000
+                if not self.dealer_socket.poll(poll_timeout):
+                    break
+                message: List[zmq.Frame] = self.dealer_socket.recv_multipart(copy=False)
+                reply = message[1:]
+                try:
+                    if reply_request_id(reply) == request_id:
+                        return reply
+                except Exception:
+                    _logger.warning("Received a reply that does not match any call.")
+        raise _no_reply_error(timeout)
+
+    def _validate_reply(
+        self,
+        reply: List[zmq.Frame],
+        serializer: str,
+        validate: Callable,
+        trace: Optional[Dict[str, Any]],
+    ) -> Any:
+        if trace is not None and self.tracer is not None:
+            try:
+                _finish_trace(self.tracer, trace, reply)
+            except Exception:
+                _logger.exception("Could not record the trace of a call.")
+        return validate(reply, serializer)
+
+    def _hand_over(self) -> None:
+        """Starts the thread, which owns the socket from then on."""
+        with self._direct_lock:
+            if self._direct:
+                if self.dealer_socket.closed:
+                    raise RuntimeError("Connection to 👀 caniusethat server is closed.")
+                self._direct = False
+                self.start()
+
+    def _submit_frames(
+        self,
+        request_id: int,
+        frames: List[Any],
+        serializer: str,
+        validate: Callable,
+        trace: Optional[Dict[str, Any]] = None,
+    ) -> "Future[Any]":
+        future: "Future[Any]" = Future()
+        entry = _PendingReply(future, serializer, validate, trace)
+        if self.retries:
+            entry = entry._replace(frames=frames, retries=self.retries)
+        with self._pending_lock:
+            self._pending[request_id] = entry
+        try:
+            self._send_frames(frames)
+        except RuntimeError:
+            with self._pending_lock:
+                self._pending.pop(request_id)
+            raise
+        return future
+
+    def _send_frames(self, frames: List[Any]) -> None:
+        """Hands a call over to the thread, which sends it."""
+        with self._send_lock:
+            if self._send_socket.closed:
+                raise RuntimeError("Connection to 👀 caniusethat server is closed.")
+            self._send_socket.send_multipart(frames, copy=False)
+
+    def start_heartbeat(self, interval: float, serializer: str) -> None:
+        """Sends a heartbeat every `interval` seconds, which renews the leases of the
+        locks held on the server, and checks that the server is still there."""
+        self._next_heartbeat = time.monotonic() + interval
+        self._heartbeat = (interval, serializer)
+        self._hand_over()
+        self._wake_up()
+
+    def stop(self):
+        """Request the connection to stop, waking up its loop if it is waiting."""
+        super().stop()
+        self._wake_up()
+
+    def close(self) -> None:
+        """Closes the connection, stopping the thread if it was started."""
+        with self._direct_lock:
+            if self._direct:
+                with self._send_lock:
+                    self._send_socket.close(linger=0)
+                self.dealer_socket.close(linger=self._LINGER_TIME)
+                return
+        self.stop()
+        self.join()
+
+    def _wake_up(self) -> None:
+        with self._send_lock:
+            if not self._send_socket.closed:
+                self._send_socket.send(b"")
+
+    def _task_setup(self):
+        context = zmq.Context.instance()
+        self.pipe_socket = context.socket(zmq.PULL)
+        self.pipe_socket.bind(self._pipe_address)
+        self.poller.register(self.pipe_socket, zmq.POLLIN)
+        self._last_reply = time.monotonic()
+
+    def _connect(self) -> None:
+        self.dealer_socket = zmq.Context.instance().socket(zmq.DEALER)
+        self.dealer_socket.connect(self.server_address)
+        self.poller.register(self.dealer_socket, zmq.POLLIN)
+        self._last_reply = time.monotonic()
+
+    def _reconnect(self) -> None:
+        """Makes the socket again, sending again the calls that have retries left,
+        and failing the other ones."""
+        _logger.warning(
+            f"Lost the connection to 👀 caniusethat server at {self.server_address}, "
+            "reconnecting..."
+        )
+        self.poller.unregister(self.dealer_socket)
+        self.dealer_socket.close(linger=0)
+        self._connect()
+        self._backoff = min(
+            max(2 * self._backoff, self.retry_backoff), self._MAX_RETRY_BACKOFF
+        )
+
+        # The calls still in the pipe were not sent yet, they go out only once.
+        unsent = set()
+        for frames in receive_ready_messages(
+            self.pipe_socket, self._MAX_MESSAGES_PER_WAKEUP
+        ):
+            if len(frames) > 1:
+                unsent.add(reply_request_id(frames))
+                self.dealer_socket.send_multipart([b"", *frames], copy=False)
+
+        failed = []
+        with self._pending_lock:
+            for request_id, entry in list(self._pending.items()):
+                if request_id in unsent:
+                    continue
+                if entry.future.done():
+                    # Nobody waits for its reply anymore.
+                    del self._pending[request_id]
+                    continue
+                if entry.frames is None or entry.retries < 1:
+                    failed.append(self._pending.pop(request_id).future)
+                    continue
+                self._pending[request_id] = entry._replace(retries=entry.retries - 1)
+                self.dealer_socket.send_multipart([b"", *entry.frames], copy=False)
+        for future in failed:
+            _resolve_future(
+                future,
+                future.set_exception,
+                ConnectionError("Lost the connection to 👀 caniusethat server."),
+            )
+
+    def _task_cleanup(self):
+        with self._send_lock:
+            self._send_socket.close(linger=0)
+        self.poller.unregister(self.pipe_socket)
+        self.pipe_socket.close(linger=0)
+        self.poller.unregister(self.dealer_socket)
+        self.dealer_socket.close(linger=self._LINGER_TIME)
+
+        with self._pending_lock:
+            pending = list(self._pending.values())
+            self._pending.clear()
+        for future, *_ in pending:
+            _resolve_future(
+                future,
+                future.set_exception,
+                RuntimeError("Connection to 👀 caniusethat server was closed."),
+            )
+
+    def _task_cycle(self):
+        timeout = None
+        if self._heartbeat is not None:
+            timeout = max(0.0, self._next_heartbeat - time.monotonic()) * 1000
+        poll_sockets = dict(self.poller.poll(timeout))
+
+        if poll_sockets.get(self.pipe_socket) == zmq.POLLIN:
+            for frames in receive_ready_messages(
+                self.pipe_socket, self._MAX_MESSAGES_PER_WAKEUP
+            ):
+                if len(frames) > 1:  # A single frame only wakes us up.
+                    # The empty frame mimics the envelope of a REQ socket.
+                    self.dealer_socket.send_multipart([b"", *frames], copy=False)
+
+        if poll_sockets.get(self.dealer_socket) == zmq.POLLIN:
+            self._last_reply = time.monotonic()
+            self._backoff = 0.0
+            for _, *reply in receive_ready_messages(
+                self.dealer_socket, self._MAX_MESSAGES_PER_WAKEUP
+            ):
+                self._process_reply(reply)
+
+        if self._heartbeat is not None and time.monotonic() >= self._next_heartbeat:
+            interval, serializer = self._heartbeat
+            now = time.monotonic()
+            self._next_heartbeat = now + interval
+            # The server answers the heartbeats at once, if it is still there.
+            if (
+                now - self._last_reply
+                > self._HEARTBEAT_LIVENESS * interval + self._backoff
+            ):
+                self._reconnect()
+            self._send_heartbeat(serializer)
+
+    def _send_heartbeat(self, serializer: str) -> None:
+        request_id = next(self._request_ids)
+        frames = prepare_rpc_frames(
+            "_server",
+            "renew_locks",
+            (),
+            {},
+            serializer,
+            request_id,
+            client_id=self.client_id,
+        )
+        # Nobody waits for the reply, the future only matches it to this call.
+        with self._pending_lock:
+            self._pending[request_id] = _PendingReply(
+                Future(), serializer, validate_rpc_response, None
+            )
+        self.dealer_socket.send_multipart([b"", *frames], copy=False)
+
+    def _process_reply(self, reply: List[zmq.Frame]) -> None:
+        try:
+            request_id = reply_request_id(reply)
+        except Exception:
+            _logger.warning("Received a reply that does not match any call.")
+            return
+
+        with self._pending_lock:
+            entry = self._pending.pop(request_id, None)
+        if entry is None:
+            return
+        future, serializer, validate, trace, _, _ = entry
+        try:
+            result = self._validate_reply(reply, serializer, validate, trace)
+        except Exception as e:
+            _resolve_future(future, future.set_exception, e)
+        else:
+            _resolve_future(future, future.set_result, result)
+
+
+class ThingBatch:
+    """Many calls to remote objects, sent to the server in one message.
+
+    Use `Thing.batch` to make one. The calls are sent when the `with` block ends,
+    which waits for their replies. Each call returns a future with its result.
+
+    Example:
+        >>> with my_thing.batch() as batch:
+        ...     first = batch.call("add", 2, 3)
+        ...     second = batch.call_object("other_calculator", "add", 4, 5)
+        >>> first.result(), second.result()
+        (5, 9)
+    """
+
+    def __init__(self, thing: "Thing") -> None:
+        self._thing = thing
+        self._calls: List[Tuple[str, str, Any, Any]] = []
+        self._futures: List["Future[Any]"] = []
+
+    def call(self, method: str, *args, **kwargs) -> "Future[Any]":
+        """Adds a call to a method of the remote object of the `Thing`."""
+        return self.call_object(self._thing.name, method, *args, **kwargs)
+
+    def call_object(self, name: str, method: str, *args, **kwargs) -> "Future[Any]":
+        """Adds a call to a method of any remote object on the same server."""
+        future: "Future[Any]" = Future()
+        self._calls.append((name, method, args, kwargs))
+        self._futures.append(future)
+        return future
+
+    def __enter__(self) -> "ThingBatch":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is not None:
+            for future in self._futures:
+                future.cancel()
+            return
+        self.send()
+
+    def send(self) -> None:
+        """Sends the calls added so far, and waits for their replies.
+
+        If the batch fails as a whole, e.g. on timeout, its error is raised, and
+        also set on the future of each call."""
+        calls, futures = self._calls, self._futures
+        self._calls, self._futures = [], []
+        if not calls:
+            return
+
+        try:
+            with allow_interrupt(self._thing.close_this_thing):
+                responses = self._thing._connection.call_batch(
+                    calls, self._thing._serializer, self._thing.timeout
+                )
+            if len(responses) != len(calls):
+                raise RuntimeError(
+                    f"Received {len(responses)} responses to a batch of "
+                    f"{len(calls)} calls."
+                )
+        except BaseException as e:
+            for future in futures:
+                _resolve_future(future, future.set_exception, e)
+            raise
+        for future, response in zip(futures, responses):
+            if response.error == RemoteProcedureError.NO_ERROR:
+                future.set_result(response.result)
+            else:
+                future.set_exception(
+                    RuntimeError(f"Remote procedure error: {response}")
+                )
+
 
 class Thing:
     """A representation of a remote object, or `thing`, that has methods that can be called.
@@ -18,83 +617,214 @@ class Thing:
     Attributes:
         name: The unique name of the remote object.
         server_address: The address of the server that is hosting the remote object.
+        serializers: The serializers to use for the calls, in order of preference.
+            The first one that the server accepts is chosen when connecting.
+        tracer: Records the hops of a sample of the calls, see `caniusethat.tracing`.
+        lock_timeout: How long, in seconds, a call to an object locked by another
+            client waits for the lock to be released, in order of arrival, before
+            failing with THING_IS_LOCKED. If None, it fails at once.
+        timeout: How long, in seconds, a call waits for its reply before raising
+            `TimeoutError`, or None to wait forever. The server does not start the
+            calls that nobody waits for anymore.
+        heartbeat_interval: How often, in seconds, to check that the server is
+            still there. After three heartbeats without a reply, the connection is
+            made again, e.g. to a restarted server. If None, there are heartbeats
+            only if the locks of the server expire.
+        retries: How many times a call that waits for its reply is sent again when
+            the connection is made again, instead of failing with `ConnectionError`.
+            The server runs it only once, if it is sent again within the
+            `dedup_window` of the server, and the `Thing` keeps its locks.
+        retry_backoff: How much longer, in seconds, to wait for a reply after the
+            first reconnection. It doubles after each one, up to 10 seconds, until
+            the server replies again.
+
+    If the locks of the server expire, see `Server`, a heartbeat renews the locks
+    held by the `Thing` in the background, until it is closed.
 
     Example:
         >>> from caniusethat import thing
         >>> my_thing = thing.Thing("remote_calculator", "tcp://127.0.0.1:6555")
         >>> my_thing.add(2, 3)
         5
+        >>> my_thing.call_async("add", 2, 3).result()
+        5
     """
 
-    _RESERVED_NAMES = ["available_methods", "close_this_thing"]
-    _LINGER_TIME = 1000  # ms
+    _RESERVED_NAMES = [
+        "available_methods",
+        "batch",
+        "call_async",
+        "call_with_retries",
+        "call_with_timeout",
+        "close_this_thing",
+    ]
 
-    def __init__(self, name: str, server_address: str) -> None:
+    def __init__(
+        self,
+        name: str,
+        server_address: str,
+        serializers: Sequence[str] = (DEFAULT_SERIALIZER,),
+        tracer: Optional[Tracer] = None,
+        lock_timeout: Optional[float] = None,
+        timeout: Optional[float] = None,
+        heartbeat_interval: Optional[float] = None,
+        retries: int = 0,
+        retry_backoff: float = 0.1,
+    ) -> None:
+        if heartbeat_interval is not None and heartbeat_interval <= 0:
+            raise ValueError("The heartbeat interval must be positive.")
         self.name = name
-        self._rpc_condition = Condition()
+        self.lock_timeout = lock_timeout
+        self.timeout = timeout
+        self._serializer = DEFAULT_SERIALIZER
+        self._closed = False
 
         _logger.info(f"Connecting to 👀 caniusethat server at {server_address}...")
-        context = zmq.Context.instance()
-        self.request_socket: zmq.Socket = context.socket(zmq.REQ)
-        self.request_socket.connect(server_address)
-        self.poller = zmq.Poller()
-        self.poller.register(self.request_socket, zmq.POLLIN)
-
-        self._methods = self._get_object_description_from_server()
-        self._populate_methods_from_description()
+        self._connection = _ThingConnection(
+            server_address, tracer, retries, retry_backoff
+        )
 
-        self._closed = False
+        try:
+            self._serializer = self._negotiate_serializer(serializers)
+            self._methods = self._get_object_description_from_server()
+            self._populate_methods_from_description()
+            lock_ttl = self._make_rpc_and_validate_response("_server", "renew_locks")
+            intervals = [] if heartbeat_interval is None else [heartbeat_interval]
+            if lock_ttl is not None:
+                intervals.append(lock_ttl / HEARTBEATS_PER_LOCK_TTL)
+            if intervals:
+                self._connection.start_heartbeat(min(intervals), self._serializer)
+        except BaseException:
+            self._connection.close()
+            self._closed = True
+            raise
 
     def _make_method_fn(self, name: str) -> Callable:
         return lambda _self, *args, **kwargs: self._make_rpc_and_validate_response(
             _self.name, name, *args, **kwargs
         )
 
-    def _socket_receive(self) -> bytes:
-        """Receives a message from the server."""
-        with allow_interrupt(self.close_this_thing):
-            socks = dict(self.poller.poll())
-            if not (
-                self.request_socket in socks
-                and socks[self.request_socket] == zmq.POLLIN
-            ):
-                raise RuntimeError(
-                    f"Poller returned incorrect socket or event: {socks}"
-                )
-            return self.request_socket.recv()
-
     def _make_rpc_and_validate_response(
         self, name: str, method: str, *args, **kwargs
     ) -> Any:
-        rpc_pickle = prepare_rpc_pickle(name, method, args, kwargs)
-        with self._rpc_condition:
-            self.request_socket.send(rpc_pickle)
-            socket_response = self._socket_receive()
-        return validate_rpc_response(socket_response)
+        return self._make_rpc(name, method, args, kwargs, self.timeout)
+
+    def _make_rpc(
+        self, name: str, method: str, args, kwargs, timeout: Optional[float]
+    ) -> Any:
+        with allow_interrupt(self.close_this_thing):
+            return self._connection.call(
+                name,
+                method,
+                args,
+                kwargs,
+                self._serializer,
+                self.lock_timeout,
+                timeout,
+            )
+
+    def batch(self) -> ThingBatch:
+        """Returns a batch of calls, that are sent to the server in one message.
+
+        Returns:
+            A `ThingBatch`, to use in a `with` block."""
+        return ThingBatch(self)
+
+    def call_with_timeout(
+        self, timeout: Optional[float], method: str, *args, **kwargs
+    ) -> Any:
+        """Calls a method of the remote object, waiting at most `timeout` seconds
+        for the reply, instead of the `timeout` of the `Thing`.
+
+        Args:
+            timeout: How long to wait for the reply, in seconds, or None to wait
+                forever. The server does not start the call after that.
+            method: The name of the method to call.
+            *args: The positional arguments to pass to the method.
+            **kwargs: The keyword arguments to pass to the method.
+
+        Returns:
+            The result of the call. It raises a `RuntimeError` if the remote
+            procedure failed, or `TimeoutError` if the reply did not come in time."""
+        return self._make_rpc(self.name, method, args, kwargs, timeout)
+
+    def call_with_retries(self, timeout: float, method: str, *args, **kwargs) -> Any:
+        """Calls a method of the remote object, sending the call again each time its
+        reply does not come within `timeout` seconds, up to `retries` times.
+
+        The call keeps its request ID, so the server runs it only once, within its
+        `dedup_window`, and answers the last one sent with its reply. Without
+        `retries`, it is the same as `call_with_timeout`.
+
+        Args:
+            timeout: How long to wait for each reply, in seconds.
+            method: The name of the method to call.
+            *args: The positional arguments to pass to the method.
+            **kwargs: The keyword arguments to pass to the method.
+
+        Returns:
+            The result of the call. It raises a `RuntimeError` if the remote
+            procedure failed, or `TimeoutError` if no reply came in time."""
+        with allow_interrupt(self.close_this_thing):
+            return self._connection.call(
+                self.name,
+                method,
+                args,
+                kwargs,
+                self._serializer,
+                self.lock_timeout,
+                timeout,
+                self._connection.retries + 1,
+            )
+
+    def call_async(self, method: str, *args, **kwargs) -> "Future[Any]":
+        """Calls a method of the remote object without waiting for the reply.
+
+        Many calls can be in flight at the same time, the replies are matched to
+        their calls by the server. Buffer arguments, like a `bytearray`, are sent
+        without being copied, so they must not be modified until the call is done.
+
+        Args:
+            method: The name of the method to call.
+            *args: The positional arguments to pass to the method.
+            **kwargs: The keyword arguments to pass to the method.
+
+        The server does not start the call after the `timeout` of the `Thing`,
+        but the future does not time out on its own, pass a timeout to its
+        `result` instead.
+
+        Returns:
+            A `concurrent.futures.Future` with the result of the call. It raises a
+            `RuntimeError` if the remote procedure failed."""
+        return self._connection.submit(
+            self.name,
+            method,
+            args,
+            kwargs,
+            self._serializer,
+            self.lock_timeout,
+            self.timeout,
+        )
+
+    def _negotiate_serializer(self, serializers: Sequence[str]) -> str:
+        """Chooses the first of the serializers that the server accepts."""
+        if list(serializers) == [DEFAULT_SERIALIZER]:
+            return DEFAULT_SERIALIZER
+        supported = self._make_rpc_and_validate_response("_server", "get_serializers")
+        return choose_serializer(serializers, supported)
 
     def _get_object_description_from_server(self) -> List[SharedMethodDescriptor]:
         """Gets the description of the remote object from the server."""
-        object_description = self._make_rpc_and_validate_response(
-            "_server", "get_object_methods", self.name
-        )
-        if not isinstance(object_description, list):
-            raise RuntimeError(
-                f"Received invalid RemoteProcedureResponse: {object_description}"
+        return _validate_object_description(
+            self._make_rpc_and_validate_response(
+                "_server", "get_object_methods", self.name
             )
-        for method_descriptor in object_description:
-            if not isinstance(method_descriptor, SharedMethodDescriptor):
-                raise RuntimeError(
-                    f"Received invalid RemoteProcedureResponse: {object_description}"
-                )
-        return object_description
+        )
 
     def _populate_methods_from_description(self) -> None:
         """Populates the methods of this object from the description of the remote object."""
         for name, signature, docstring in self._methods:
-            if name in self._RESERVED_NAMES:
-                raise RuntimeError(
-                    f"Method name `{name}` is reserved for internal use, please change it in the remote class."
-                )
+            _check_method_name(name, self._RESERVED_NAMES)
             _logger.debug(f"Adding method {name}({signature})")
             method_fn = self._make_method_fn(name)
             method_fn.__name__ = name
@@ -111,6 +841,7 @@ class Thing:
         any locks if any are still held."""
         if not self._closed:
             _logger.info("Closing connection to 👀 caniusethat server")
+            self._closed = True
             try:
                 _ = self._make_rpc_and_validate_response(
                     "_server", "release_lock_if_any", self.name
@@ -120,8 +851,6 @@ class Thing:
                     "There was an error when trying to remove locks on the Thing."
                 )
 
-            self.poller.unregister(self.request_socket)
-            self.request_socket.close(linger=self._LINGER_TIME)
-            self._closed = True
+            self._connection.close()
         else:
             RuntimeError("Connection to 👀 caniusethat server already closed.")
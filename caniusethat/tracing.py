@@ -0,0 +1,138 @@
+import json
+import random
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from threading import Lock
+from typing import Any, Deque, Dict, List, Optional
+
+# The hops of a traced call, in the order it goes through them. Each one is
+# recorded as a timestamp from `time.time()`, so that hops recorded by different
+# processes on the same host can be compared.
+HOPS = [
+    "thing_send",
+    "router_receive",
+    "dispatch",
+    "worker_start",
+    "worker_end",
+    "router_reply",
+    "thing_receive",
+]
+
+
+class TraceSink(ABC):
+    """Where a `Tracer` sends the traces of the calls.
+
+    Subclasses implement `record`, which can be called from many threads."""
+
+    @abstractmethod
+    def record(self, trace: Dict[str, Any]) -> None:
+        """Records the trace of a call.
+
+        Args:
+            trace: The trace, as returned by `start_trace`, with all its hops."""
+
+    def close(self) -> None:
+        pass
+
+
+class RingBufferSink(TraceSink):
+    """Keeps the last traces in memory. A `Server` with this sink returns them
+    with `get_traces`, also through the `_server.get_traces` call.
+
+    Attributes:
+        size: The number of traces kept, the oldest ones are dropped first.
+    """
+
+    def __init__(self, size: int = 1000) -> None:
+        self.size = size
+        self._traces: Deque[Dict[str, Any]] = deque(maxlen=size)
+
+    def record(self, trace: Dict[str, Any]) -> None:
+        self._traces.append(trace)
+
+    def recent(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Returns the last `limit` traces, or all of them, oldest first."""
+        traces = list(self._traces)
+        if limit is None:
+            return traces
+        return traces[-limit:] if limit > 0 else []
+
+
+class JsonlFileSink(TraceSink):
+    """Appends the traces to a file, one JSON object per line.
+
+    Attributes:
+        path: The path of the file.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = Lock()
+        self._file = open(path, "a", buffering=1)
+
+    def record(self, trace: Dict[str, Any]) -> None:
+        line = json.dumps(trace, separators=(",", ":")) + "\n"
+        with self._lock:
+            if not self._file.closed:
+                self._file.write(line)
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+def start_trace(
+    name: str, method: str, request_id: int, hop: str, **fields: Any
+) -> Dict[str, Any]:
+    """Returns a new trace of a call, with the timestamp of its first hop.
+
+    Args:
+        name: The name of the remote object.
+        method: The name of the method.
+        request_id: The request ID of the call.
+        hop: The first hop, one of `HOPS`.
+        **fields: Other fields to record in the trace.
+
+    Returns:
+        The trace, with the timestamps of the hops in `trace["hops"]`."""
+    return {
+        "name": name,
+        "method": method,
+        "request_id": request_id,
+        **fields,
+        "hops": {hop: time.time()},
+    }
+
+
+class Tracer:
+    """Records the hops of a sample of the calls into a sink.
+
+    A `Thing` with a tracer asks the server to trace the sampled calls, and records
+    them from the moment they are sent until their reply is received, including the
+    hops of the server. A `Server` with a tracer records the calls that clients ask
+    to trace, and also samples the other ones on its own.
+
+    Attributes:
+        sink: Where the traces are recorded.
+        sample_rate: The fraction of the calls to trace, between 0 and 1.
+
+    Example:
+        >>> tracer = Tracer(JsonlFileSink("traces.jsonl"), sample_rate=0.01)
+        >>> my_thing = Thing("remote_calculator", "tcp://127.0.0.1:6555", tracer=tracer)
+    """
+
+    def __init__(self, sink: TraceSink, sample_rate: float = 1.0) -> None:
+        if not 0 <= sample_rate <= 1:
+            raise ValueError("The sample rate must be between 0 and 1.")
+        self.sink = sink
+        self.sample_rate = sample_rate
+
+    def sample(self) -> bool:
+        """Returns whether to trace the next call."""
+        if self.sample_rate >= 1:
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def record(self, trace: Dict[str, Any]) -> None:
+        self.sink.record(trace)
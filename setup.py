@@ -32,6 +32,7 @@ setup(
     long_description=readme,
     long_description_content_type="text/markdown",
     install_requires=requirements,
+    extras_require={"msgpack": ["msgpack>=1.0"]},
     test_suite="tests",
     tests_require=test_requirements,
     package_data={
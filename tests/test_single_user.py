@@ -1,16 +1,39 @@
+import asyncio
+import json
+import os
 import re
+import threading
 import time
+from typing import Callable
 
 import pytest
+import zmq
 
+from caniusethat._types import RemoteProcedureHeader
+from caniusethat.async_thing import AsyncThing
+from caniusethat.cli import run_cli
+from caniusethat.metrics import format_prometheus, histogram_quantile
+from caniusethat.rpc_utils import (
+    encode_rpc_header,
+    prepare_rpc_frames,
+    validate_rpc_response,
+)
+from caniusethat.serializers import OUT_OF_BAND_THRESHOLD, get_serializer
 from caniusethat.shareable import (
     Server,
     _force_remote_server_stop,
+    _freeze_mutable_buffers,
+    _RateLimiter,
     acquire_lock,
+    cacheable,
+    coalesce_calls,
+    lock_access,
     release_lock,
+    run_concurrently,
     you_can_use_this,
 )
 from caniusethat.thing import Thing
+from caniusethat.tracing import HOPS, JsonlFileSink, RingBufferSink, Tracer
 
 SERVER_ADDRESS = "tcp://127.0.0.1:6555"
 
@@ -59,6 +82,161 @@ class ClassWithLocks:
         return secret
 
 
+class ClassWithLockGroups:
+    def __init__(self) -> None:
+        self._position = 0
+
+    @you_can_use_this
+    @acquire_lock
+    @lock_access(group="stage")
+    def start_scan(self) -> None:
+        """Take the stage for a scan."""
+
+    @you_can_use_this
+    @release_lock
+    @lock_access(group="stage")
+    def stop_scan(self) -> None:
+        """Give the stage back."""
+
+    @you_can_use_this
+    @acquire_lock
+    @lock_access(group="readout", shared=True)
+    def start_reading(self) -> None:
+        """Keep the readout from being changed."""
+
+    @you_can_use_this
+    @release_lock
+    @lock_access(group="readout", shared=True)
+    def stop_reading(self) -> None:
+        """Let the readout be changed again."""
+
+    @you_can_use_this
+    @acquire_lock
+    @lock_access(group="readout")
+    def start_writing(self) -> None:
+        """Keep the readout for this client only."""
+
+    @you_can_use_this
+    @lock_access(group="readout", shared=True)
+    def read(self) -> int:
+        """Read the position."""
+        return self._position
+
+    @you_can_use_this
+    @lock_access(group="readout")
+    def calibrate(self) -> None:
+        """Change the readout."""
+
+    @you_can_use_this
+    def reset(self) -> None:
+        """Change the whole object."""
+        self._position = 0
+
+
+class ClassWithBuffers:
+    @you_can_use_this
+    def echo(self, data):
+        """Return the data unchanged."""
+        return data
+
+
+class ClassWithSlowMethod:
+    @you_can_use_this
+    def wait(self, seconds: float) -> float:
+        """Wait for some time and return it."""
+        time.sleep(seconds)
+        return seconds
+
+
+class ClassWithCallLog:
+    def __init__(self) -> None:
+        self.calls = []
+
+    @you_can_use_this
+    def log(self, tag: str) -> int:
+        """Log a call, and return how many were logged."""
+        time.sleep(0.05)
+        self.calls.append(tag)
+        return len(self.calls)
+
+
+class ClassWithConcurrentMethods:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._running = 0
+        self.max_running = {"serial": 0, "concurrent": 0}
+
+    def _run(self, kind: str, seconds: float) -> None:
+        with self._lock:
+            self._running += 1
+            self.max_running[kind] = max(self.max_running[kind], self._running)
+        time.sleep(seconds)
+        with self._lock:
+            self._running -= 1
+
+    @you_can_use_this
+    @run_concurrently
+    def read(self, seconds: float) -> None:
+        """Can run together with other reads."""
+        self._run("concurrent", seconds)
+
+    @you_can_use_this
+    def write(self, seconds: float) -> None:
+        """Always runs alone."""
+        self._run("serial", seconds)
+
+
+class ClassInAProcess:
+    def __init__(self) -> None:
+        self.calls = 0
+
+    @you_can_use_this
+    def where_am_i(self) -> int:
+        """Return the ID of the process that runs the call."""
+        self.calls += 1
+        return os.getpid()
+
+    @you_can_use_this
+    def count_calls(self) -> int:
+        return self.calls
+
+
+class ClassWithCache:
+    def __init__(self) -> None:
+        self.runs = 0
+        self._value = 1
+
+    @you_can_use_this
+    @cacheable(ttl=0.5, maxsize=2)
+    def read(self, scale: int) -> int:
+        """A slow read that gives the same result for the same arguments."""
+        self.runs += 1
+        return self._value * scale
+
+    @you_can_use_this
+    @acquire_lock
+    def start_writing(self, value: int) -> None:
+        self._value = value
+
+    @you_can_use_this
+    @release_lock
+    def stop_writing(self) -> None:
+        pass
+
+
+class ClassWithSlowStatus:
+    def __init__(self) -> None:
+        self.runs = 0
+
+    @you_can_use_this
+    @coalesce_calls
+    def get_status(self, device: str) -> str:
+        """Takes a while, and gives a different status every time."""
+        self.runs += 1
+        time.sleep(0.2)
+        return f"{device} status {self.runs}"
+
+
 class ClassWithReservedName:
     @you_can_use_this
     def close_this_thing(self) -> None:
@@ -66,12 +244,28 @@ class ClassWithReservedName:
         pass
 
 
+def _refuse_to_unpickle():
+    raise RuntimeError("This payload should not have been unpickled.")
+
+
+class UnpicklableArgument:
+    def __reduce__(self):
+        return (_refuse_to_unpickle, ())
+
+
 @pytest.fixture(autouse=True)
 def wait_for_context_cleanup():
     yield
     time.sleep(0.5)
 
 
+def _wait_until(condition: Callable[[], bool], timeout: float = 5) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "Timed out waiting for the condition."
+        time.sleep(0.005)
+
+
 def test_local_server_shutdown():
     my_obj = ClassWithoutLocks()
 
@@ -151,6 +345,238 @@ def test_locked_shared_thing():
     my_server.join()
 
 
+def test_calls_wait_for_the_lock_in_order():
+    my_server = Server(SERVER_ADDRESS)
+    my_server.start()
+    my_server.add_object("my_obj", ClassWithLocks())
+    time.sleep(0.5)
+
+    try:
+        owner = Thing("my_obj", SERVER_ADDRESS)
+        first = Thing("my_obj", SERVER_ADDRESS, lock_timeout=5)
+        second = Thing("my_obj", SERVER_ADDRESS, lock_timeout=5)
+        impatient = Thing("my_obj", SERVER_ADDRESS, lock_timeout=0.2)
+        my_thing = Thing("my_obj", SERVER_ADDRESS)
+
+        owner.write_secret("owner")
+        first_write = first.call_async("write_secret", "first")
+        # The calls come from different sockets, send the second once the first
+        # waits for the lock, so that they arrive in order.
+        _wait_until(lambda: len(my_server._call_queues["my_obj"].lock_waiters) == 1)
+        second_write = second.call_async("write_secret", "second")
+        # Without a lock timeout the call fails at once, with one when it expires.
+        with pytest.raises(RuntimeError, match="THING_IS_LOCKED"):
+            my_thing.read_secret()
+        start = time.monotonic()
+        with pytest.raises(RuntimeError, match="THING_IS_LOCKED"):
+            impatient.read_secret()
+        assert 0.15 < time.monotonic() - start < 2
+
+        # Releasing the lock lets the waiting calls take it, in order of arrival.
+        assert owner.read_secret() == "owner"
+        first_write.result(timeout=5)
+        assert not second_write.done()
+        # Also when the lock is released by closing the Thing.
+        first.close_this_thing()
+        second_write.result(timeout=5)
+        assert second.read_secret() == "second"
+
+        for thing in [owner, second, impatient, my_thing]:
+            thing.close_this_thing()
+    finally:
+        _force_remote_server_stop(SERVER_ADDRESS)
+        my_server.join()
+
+
+def test_locks_expire_without_heartbeats():
+    my_server = Server(SERVER_ADDRESS, lock_ttl=0.5)
+    my_server.start()
+    my_server.add_object("my_obj", ClassWithLocks())
+    time.sleep(0.5)
+
+    try:
+        owner = Thing("my_obj", SERVER_ADDRESS)
+        waiting = Thing("my_obj", SERVER_ADDRESS, lock_timeout=5)
+        my_thing = Thing("my_obj", SERVER_ADDRESS)
+
+        # The heartbeat keeps the lock of a live Thing after its TTL.
+        owner.write_secret("owner")
+        time.sleep(1)
+        with pytest.raises(RuntimeError, match="THING_IS_LOCKED"):
+            my_thing.read_secret()
+        assert owner.read_secret() == "owner"
+
+        # Without heartbeats the lock expires, and the waiting calls take it.
+        owner.write_secret("stale")
+        owner._connection._heartbeat = None
+        start = time.monotonic()
+        waiting.write_secret("waiting")
+        assert 0.3 < time.monotonic() - start < 2
+        with pytest.raises(RuntimeError, match="THING_IS_LOCKED"):
+            owner.read_secret()
+        assert waiting.read_secret() == "waiting"
+
+        for thing in [owner, waiting, my_thing]:
+            thing.close_this_thing()
+    finally:
+        _force_remote_server_stop(SERVER_ADDRESS)
+        my_server.join()
+
+
+def test_lock_groups_and_shared_locks():
+    my_server = Server(SERVER_ADDRESS)
+    my_server.start()
+    my_server.add_object("my_obj", ClassWithLockGroups())
+    time.sleep(0.5)
+
+    try:
+        first = Thing("my_obj", SERVER_ADDRESS)
+        second = Thing("my_obj", SERVER_ADDRESS)
+        third = Thing("my_obj", SERVER_ADDRESS)
+
+        # A lock on a group only blocks the methods of that group, and those
+        # without one.
+        first.start_scan()
+        assert second.read() == 0
+        second.calibrate()
+        for method in [second.start_scan, second.reset]:
+            with pytest.raises(RuntimeError, match="THING_IS_LOCKED"):
+                method()
+
+        # Many clients hold a shared lock, that only lets the shared methods run.
+        first.start_reading()
+        second.start_reading()
+        assert third.read() == 0
+        with pytest.raises(RuntimeError, match="THING_IS_LOCKED"):
+            third.calibrate()
+        first.stop_reading()
+        with pytest.raises(RuntimeError, match="THING_IS_LOCKED"):
+            third.calibrate()
+        second.stop_reading()
+        third.calibrate()
+
+        # The only owner of a shared lock can make it exclusive.
+        first.start_reading()
+        second.start_reading()
+        with pytest.raises(RuntimeError, match="THING_IS_LOCKED"):
+            first.start_writing()
+        second.stop_reading()
+        first.start_writing()
+        for method in [third.read, third.start_reading]:
+            with pytest.raises(RuntimeError, match="THING_IS_LOCKED"):
+                method()
+        assert first.read() == 0
+        first.stop_reading()
+        assert third.read() == 0
+
+        first.stop_scan()
+        second.reset()
+
+        for thing in [first, second, third]:
+            thing.close_this_thing()
+    finally:
+        _force_remote_server_stop(SERVER_ADDRESS)
+        my_server.join()
+
+
+def test_thing_reconnects_to_a_restarted_server():
+    my_server = Server(SERVER_ADDRESS)
+    my_server.start()
+    my_server.add_object("my_obj", ClassWithoutLocks())
+    time.sleep(0.5)
+    restarted_server = Server(SERVER_ADDRESS)
+
+    try:
+        my_thing = Thing("my_obj", SERVER_ADDRESS, heartbeat_interval=0.05, retries=5)
+        other_thing = Thing("my_obj", SERVER_ADDRESS, heartbeat_interval=0.05)
+        assert my_thing.deposit(5) == 5
+
+        my_server.stop()
+        my_server.join()
+        # The calls that the caller gave up on are not sent again.
+        with pytest.raises(TimeoutError):
+            my_thing.call_with_timeout(0.02, "deposit", 100)
+        # The heartbeats find out that the server is gone, and the calls without
+        # retries left fail.
+        retried = my_thing.call_async("deposit", 1)
+        with pytest.raises(ConnectionError):
+            other_thing.call_async("deposit", 1).result(timeout=5)
+
+        restarted_server.start()
+        restarted_server.add_object("my_obj", ClassWithoutLocks())
+        assert retried.result(timeout=5) == 1
+        assert other_thing.deposit(2) == 3
+        assert my_thing.deposit(0) == 3
+
+        my_thing.close_this_thing()
+        other_thing.close_this_thing()
+    finally:
+        _force_remote_server_stop(SERVER_ADDRESS)
+        restarted_server.join()
+
+
+def test_calls_sent_again_run_once():
+    my_server = Server(SERVER_ADDRESS)
+    my_server.start()
+    my_server.add_object("my_obj", ClassWithoutLocks())
+    my_server.add_object("slow_obj", ClassWithSlowMethod())
+    my_server.add_object("log_obj", ClassWithCallLog())
+    time.sleep(0.5)
+
+    context = zmq.Context.instance()
+    # A client that sends a call again does it from a new socket.
+    first_socket = context.socket(zmq.DEALER)
+    second_socket = context.socket(zmq.DEALER)
+
+    def send(socket, name, method, args, request_id, client_id="my_client"):
+        frames = prepare_rpc_frames(
+            name, method, args, {}, request_id=request_id, client_id=client_id
+        )
+        socket.send_multipart([b"", *frames])
+
+    def receive(socket):
+        assert socket.poll(5000)
+        _, *reply = socket.recv_multipart()
+        return validate_rpc_response(reply)
+
+    try:
+        for socket in [first_socket, second_socket]:
+            socket.connect(SERVER_ADDRESS)
+
+        # A call sent again after its reply gets the same reply.
+        send(first_socket, "my_obj", "deposit", (5,), 1)
+        assert receive(first_socket) == 5
+        send(second_socket, "my_obj", "deposit", (5,), 1)
+        assert receive(second_socket) == 5
+        # The request IDs of other clients are not the same calls.
+        send(second_socket, "my_obj", "deposit", (5,), 1, "other_client")
+        assert receive(second_socket) == 10
+
+        # A call sent again while it runs gets its reply where it was sent last.
+        send(first_socket, "slow_obj", "wait", (0.5,), 2)
+        time.sleep(0.1)
+        send(second_socket, "slow_obj", "wait", (0.5,), 2)
+        assert receive(second_socket) == 0.5
+        assert not first_socket.poll(200)
+        wait_stats = my_server.get_stats()["methods"]["slow_obj"]["wait"]
+        assert wait_stats["run_time"]["count"] == 1
+
+        # A Thing with retries sends a call again with its request ID, on timeout.
+        log_thing = Thing("log_obj", SERVER_ADDRESS, retries=3)
+        assert log_thing.call_with_retries(0.02, "log", "first") == 1
+        assert log_thing.call_async("log", "second").result(timeout=5) == 2
+        assert log_thing.call_with_retries(0.02, "log", "third") == 3
+        log_stats = my_server.get_stats()["methods"]["log_obj"]["log"]
+        assert log_stats["calls"] > 3
+        assert log_stats["run_time"]["count"] == 3
+        log_thing.close_this_thing()
+    finally:
+        first_socket.close(linger=0)
+        second_socket.close(linger=0)
+        _force_remote_server_stop(SERVER_ADDRESS)
+        my_server.join()
+
+
 def test_reserved_name():
     my_obj = ClassWithReservedName()
 
@@ -168,3 +594,760 @@ def test_reserved_name():
     _force_remote_server_stop(SERVER_ADDRESS)
 
     my_server.join()
+
+
+def test_idle_server_wakes_up_for_new_objects_and_stop():
+    my_server = Server(SERVER_ADDRESS)
+    my_server.start()
+    time.sleep(0.5)
+
+    # The server is now blocked waiting for work, adding an object must wake it up.
+    my_server.add_object("my_obj", ClassWithoutLocks())
+    my_thing = Thing("my_obj", SERVER_ADDRESS)
+    assert my_thing.deposit(5) == 5
+    my_thing.close_this_thing()
+
+    my_server.stop()
+    my_server.join(timeout=1)
+    assert not my_server.is_alive()
+
+
+def test_pipelined_calls():
+    my_server = Server(SERVER_ADDRESS)
+    my_server.start()
+    my_server.add_object("my_obj", ClassWithoutLocks())
+    time.sleep(0.5)
+
+    try:
+        my_thing = Thing("my_obj", SERVER_ADDRESS)
+        # The calls that wait for their reply use the socket directly.
+        assert my_thing.deposit(0) == 0
+        assert not my_thing._connection.is_alive()
+        futures = [my_thing.call_async("deposit", 1) for _ in range(100)]
+        # Each future gets the reply to its own call.
+        assert [future.result(timeout=5) for future in futures] == list(range(1, 101))
+        with pytest.raises(RuntimeError, match="Insufficient funds"):
+            my_thing.call_async("withdraw", 1000).result(timeout=5)
+        # The other calls go through the connection, which owns the socket now.
+        assert my_thing._connection.is_alive()
+        assert my_thing.deposit(1) == 101
+        my_thing.close_this_thing()
+    finally:
+        _force_remote_server_stop(SERVER_ADDRESS)
+        my_server.join()
+
+
+def test_async_thing():
+    my_server = Server(SERVER_ADDRESS)
+    my_server.start()
+    my_server.add_object("my_obj", ClassWithoutLocks())
+    my_server.add_object("slow_obj", ClassWithSlowMethod())
+    time.sleep(0.5)
+
+    async def use_things():
+        async with AsyncThing("my_obj", SERVER_ADDRESS) as my_thing:
+            results = await asyncio.gather(*(my_thing.deposit(1) for _ in range(100)))
+            assert sorted(results) == list(range(1, 101))
+            with pytest.raises(RuntimeError, match="Insufficient funds"):
+                await my_thing.withdraw(1000)
+
+        async with AsyncThing("slow_obj", SERVER_ADDRESS, timeout=0.1) as slow_thing:
+            with pytest.raises(asyncio.TimeoutError):
+                await slow_thing.wait(0.5)
+            task = asyncio.ensure_future(slow_thing.call("wait", 0.5))
+            await asyncio.sleep(0.05)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            # The late replies of the calls above are dropped.
+            slow_thing.timeout = None
+            assert await slow_thing.wait(0) == 0
+
+    try:
+        asyncio.run(use_things())
+    finally:
+        _force_remote_server_stop(SERVER_ADDRESS)
+        my_server.join()
+
+
+def test_async_thing_heartbeats():
+    my_server = Server(SERVER_ADDRESS, lock_ttl=0.5)
+    my_server.start()
+    my_server.add_object("my_obj", ClassWithLocks())
+    time.sleep(0.5)
+    restarted_server = Server(SERVER_ADDRESS, lock_ttl=0.5)
+
+    async def use_things():
+        async with AsyncThing("my_obj", SERVER_ADDRESS) as owner:
+            # A heartbeat that fails does not stop the next ones.
+            call_with_timeout = owner._call_with_timeout
+            failures = []
+
+            async def fail_once(timeout, name, method, args, kwargs):
+                if method == "renew_locks" and not failures:
+                    failures.append(method)
+                    raise ValueError("Invalid reply")
+                return await call_with_timeout(timeout, name, method, args, kwargs)
+
+            owner._call_with_timeout = fail_once
+            await owner.write_secret("owner")
+            await asyncio.sleep(1)
+            assert failures
+            async with AsyncThing("my_obj", SERVER_ADDRESS) as other:
+                with pytest.raises(RuntimeError, match="THING_IS_LOCKED"):
+                    await other.read_secret()
+            assert await owner.read_secret() == "owner"
+
+            # Without replies, the socket is made again, e.g. for a restarted server.
+            my_server.stop()
+            my_server.join()
+            with pytest.raises(ConnectionError):
+                await owner.read_secret()
+            restarted_server.start()
+            restarted_server.add_object("my_obj", ClassWithLocks())
+            await owner.write_secret("restarted")
+            assert await owner.read_secret() == "restarted"
+
+    try:
+        asyncio.run(use_things())
+    finally:
+        _force_remote_server_stop(SERVER_ADDRESS)
+        restarted_server.join()
+
+
+def test_concurrent_methods_run_in_a_worker_pool():
+    my_obj = ClassWithConcurrentMethods()
+
+    my_server = Server(SERVER_ADDRESS)
+    my_server.start()
+    my_server.add_object("my_obj", my_obj, workers=4)
+    time.sleep(0.5)
+
+    try:
+        my_thing = Thing("my_obj", SERVER_ADDRESS)
+        start = time.perf_counter()
+        futures = [my_thing.call_async("read", 0.3) for _ in range(4)]
+        for future in futures:
+            future.result(timeout=5)
+        assert time.perf_counter() - start < 1.0
+        assert my_obj.max_running["concurrent"] == 4
+
+        # Serial calls never overlap with any other call.
+        futures = [
+            my_thing.call_async(method, 0.05)
+            for method in ["read", "write", "read", "read", "write", "write"]
+        ]
+        for future in futures:
+            future.result(timeout=5)
+        assert my_obj.max_running["serial"] == 1
+        my_thing.close_this_thing()
+    finally:
+        _force_remote_server_stop(SERVER_ADDRESS)
+        my_server.join()
+
+    with pytest.raises(RuntimeError, match="cannot run concurrently"):
+
+        class ConcurrentLock(ClassWithLocks):
+            @you_can_use_this
+            @run_concurrently
+            @acquire_lock
+            def write_secret(self, secret: str) -> None:
+                pass
+
+        Server(SERVER_ADDRESS).add_object("my_obj", ConcurrentLock())
+
+
+def test_object_in_a_separate_process():
+    my_obj = ClassInAProcess()
+
+    my_server = Server(SERVER_ADDRESS)
+    my_server.start()
+    my_server.add_object("my_obj", my_obj, separate_process=True)
+    time.sleep(0.5)
+
+    try:
+        my_thing = Thing("my_obj", SERVER_ADDRESS)
+        assert my_thing.where_am_i() != os.getpid()
+        assert my_thing.count_calls() == 1
+        # The calls change the copy of the object in the child process.
+        assert my_obj.calls == 0
+        my_thing.close_this_thing()
+    finally:
+        _force_remote_server_stop(SERVER_ADDRESS)
+        my_server.join()
+    assert not my_server.worker_processes["my_obj"].is_alive()
+
+
+def test_calls_time_out_and_expired_calls_are_dropped():
+    my_server = Server(SERVER_ADDRESS)
+    my_server.start()
+    my_server.add_object("slow_obj", ClassWithSlowMethod())
+    time.sleep(0.5)
+
+    try:
+        my_thing = Thing("slow_obj", SERVER_ADDRESS, timeout=0.2)
+        with pytest.raises(TimeoutError):
+            my_thing.wait(0.6)
+        # This call waits behind the running one until its timeout passed, so the
+        # server drops it instead of keeping the worker busy for 5 seconds.
+        with pytest.raises(TimeoutError):
+            my_thing.call_with_timeout(0.1, "wait", 5)
+        assert my_thing.call_with_timeout(2, "wait", 0) == 0
+
+        # The calls that are still waited for get a DEADLINE_EXCEEDED reply.
+        running = my_thing.call_async("wait", 0.5)
+        dropped = my_thing.call_async("wait", 0)
+        assert running.result(timeout=5) == 0.5
+        with pytest.raises(RuntimeError, match="DEADLINE_EXCEEDED"):
+            dropped.result(timeout=5)
+
+        assert my_server.get_stats()["methods"]["slow_obj"]["wait"]["expired"] == 2
+        my_thing.close_this_thing()
+    finally:
+        _force_remote_server_stop(SERVER_ADDRESS)
+        my_server.join()
+
+
+def test_busy_objects_reject_calls():
+    my_server = Server(SERVER_ADDRESS, max_queue=100)
+    my_server.start()
+    my_server.add_object("slow_obj", ClassWithSlowMethod(), max_queue=2)
+    time.sleep(0.5)
+
+    try:
+        my_thing = Thing("slow_obj", SERVER_ADDRESS)
+        running = my_thing.call_async("wait", 0.5)
+        time.sleep(0.1)
+        # The running call does not count, the waiting ones do.
+        waiting = [my_thing.call_async("wait", 0) for _ in range(2)]
+        with pytest.raises(RuntimeError, match="SERVER_BUSY"):
+            my_thing.wait(0)
+
+        depths = my_thing._make_rpc_and_validate_response("_server", "get_queue_depths")
+        assert depths["slow_obj"] == {
+            "pending": 2,
+            "waiting_for_lock": 0,
+            "running": 1,
+            "peak": 2,
+            "limit": 2,
+        }
+        assert [future.result(timeout=5) for future in [running, *waiting]] == [
+            0.5,
+            0,
+            0,
+        ]
+        assert my_thing.wait(0) == 0
+        wait_stats = my_server.get_stats()["methods"]["slow_obj"]["wait"]
+        assert wait_stats["busy_rejections"] == 1
+        my_thing.close_this_thing()
+    finally:
+        _force_remote_server_stop(SERVER_ADDRESS)
+        my_server.join()
+
+
+def test_fair_scheduling_and_rate_limits():
+    my_server = Server(SERVER_ADDRESS)
+    my_server.start()
+    fair_obj = ClassWithCallLog()
+    my_server.add_object("fair_obj", fair_obj, fair_scheduling=True)
+    my_server.add_object("limited_obj", ClassWithCallLog(), rate_limit=2)
+    time.sleep(0.5)
+
+    try:
+        greedy_thing = Thing("fair_obj", SERVER_ADDRESS)
+        other_thing = Thing("fair_obj", SERVER_ADDRESS)
+        greedy_calls = [greedy_thing.call_async("log", "greedy") for _ in range(5)]
+        time.sleep(0.02)
+        # In order of arrival, it would run after all the greedy calls.
+        assert other_thing.log("other") <= 3
+        for future in greedy_calls:
+            future.result(timeout=5)
+        assert fair_obj.calls.count("greedy") == 5
+
+        limited_thing = Thing("limited_obj", SERVER_ADDRESS)
+        other_limited_thing = Thing("limited_obj", SERVER_ADDRESS)
+        limited_thing.log("first")
+        limited_thing.log("second")
+        with pytest.raises(RuntimeError, match="RATE_LIMITED"):
+            limited_thing.log("third")
+        # The limit is for each client.
+        other_limited_thing.log("other")
+        time.sleep(0.5)
+        limited_thing.log("third")
+        log_stats = my_server.get_stats()["methods"]["limited_obj"]["log"]
+        assert log_stats["rate_limited"] == 1
+
+        for thing in [greedy_thing, other_thing, limited_thing, other_limited_thing]:
+            thing.close_this_thing()
+    finally:
+        _force_remote_server_stop(SERVER_ADDRESS)
+        my_server.join()
+
+
+def test_objects_share_a_worker_pool():
+    my_server = Server(SERVER_ADDRESS, shared_workers=2)
+    my_server.start()
+    time.sleep(0.5)
+
+    try:
+        threads = threading.active_count()
+        for index in range(1000):
+            my_server.add_object(f"my_obj_{index}", ClassWithoutLocks())
+        my_server.add_object("slow_obj", ClassWithSlowMethod(), workers=1)
+        time.sleep(0.5)
+        # Only the object that asked for its own worker started a thread.
+        assert threading.active_count() == threads + 1
+
+        my_thing = Thing("my_obj_999", SERVER_ADDRESS)
+        other_thing = Thing("my_obj_0", SERVER_ADDRESS)
+        futures = [my_thing.call_async("deposit", 1) for _ in range(10)]
+        assert other_thing.deposit(5) == 5
+        assert [future.result(timeout=5) for future in futures] == list(range(1, 11))
+        my_thing.close_this_thing()
+        other_thing.close_this_thing()
+    finally:
+        _force_remote_server_stop(SERVER_ADDRESS)
+        my_server.join()
+
+
+def test_batch_of_calls():
+    my_server = Server(SERVER_ADDRESS)
+    my_server.start()
+    my_server.add_object("my_obj", ClassWithoutLocks())
+    my_server.add_object("locked_obj", ClassWithLocks())
+    my_server.add_object("slow_obj", ClassWithSlowMethod())
+    time.sleep(0.5)
+
+    try:
+        my_thing = Thing("my_obj", SERVER_ADDRESS)
+        locked_thing = Thing("locked_obj", SERVER_ADDRESS)
+        slow_thing = Thing("slow_obj", SERVER_ADDRESS, timeout=0.1)
+        locked_thing.write_secret("This is a secret")
+
+        with my_thing.batch() as batch:
+            deposits = [batch.call("deposit", 1) for _ in range(5)]
+            withdrawal = batch.call("withdraw", 100)
+            no_method = batch.call("free_cash")
+            locked = batch.call_object("locked_obj", "read_secret")
+        assert [deposit.result() for deposit in deposits] == [1, 2, 3, 4, 5]
+        with pytest.raises(RuntimeError, match="Insufficient funds"):
+            withdrawal.result()
+        with pytest.raises(RuntimeError, match="NO_SUCH_METHOD"):
+            no_method.result()
+        # The lock is checked for each call in the batch.
+        with pytest.raises(RuntimeError, match="THING_IS_LOCKED"):
+            locked.result()
+
+        with locked_thing.batch() as batch:
+            secret = batch.call("read_secret")
+        assert secret.result() == "This is a secret"
+
+        # When the whole batch fails, so does each call.
+        with pytest.raises(TimeoutError):
+            with slow_thing.batch() as batch:
+                waits = [batch.call("wait", 0.5) for _ in range(2)]
+        assert all(wait.done() for wait in waits)
+        assert all(isinstance(wait.exception(), TimeoutError) for wait in waits)
+
+        my_thing.close_this_thing()
+        locked_thing.close_this_thing()
+        slow_thing.close_this_thing()
+    finally:
+        _force_remote_server_stop(SERVER_ADDRESS)
+        my_server.join()
+
+
+def test_cached_results():
+    my_obj = ClassWithCache()
+
+    my_server = Server(SERVER_ADDRESS)
+    my_server.start()
+    my_server.add_object("my_obj", my_obj)
+    time.sleep(0.5)
+
+    try:
+        my_thing = Thing("my_obj", SERVER_ADDRESS)
+        assert [my_thing.read(2) for _ in range(3)] == [2, 2, 2]
+        assert my_thing.read(3) == 3
+        assert my_obj.runs == 2
+        assert my_server.get_cache_stats() == {
+            "my_obj": {"read": {"hits": 2, "misses": 2, "size": 2}}
+        }
+
+        # Locking methods invalidate the cache.
+        my_thing.start_writing(10)
+        my_thing.stop_writing()
+        assert my_thing.read(2) == 20
+        assert my_obj.runs == 3
+
+        # The results expire.
+        time.sleep(0.6)
+        assert my_thing.read(2) == 20
+        assert my_obj.runs == 4
+        my_thing.close_this_thing()
+    finally:
+        _force_remote_server_stop(SERVER_ADDRESS)
+        my_server.join()
+
+
+def test_coalesced_calls():
+    my_obj = ClassWithSlowStatus()
+
+    my_server = Server(SERVER_ADDRESS)
+    my_server.start()
+    my_server.add_object("my_obj", my_obj, max_queue=1)
+    time.sleep(0.5)
+
+    try:
+        my_thing = Thing("my_obj", SERVER_ADDRESS)
+        other_thing = Thing("my_obj", SERVER_ADDRESS)
+        futures = [
+            thing.call_async("get_status", "laser")
+            for thing in [my_thing, other_thing] * 5
+        ]
+        other_device = my_thing.call_async("get_status", "camera")
+        # The queue is full, but identical calls do not need a worker.
+        futures.append(other_thing.call_async("get_status", "laser"))
+        with pytest.raises(RuntimeError, match="SERVER_BUSY"):
+            other_thing.get_status("microscope")
+        # Identical calls share the reply of the first one.
+        assert {future.result(timeout=5) for future in futures} == {"laser status 1"}
+        assert other_device.result(timeout=5) == "camera status 2"
+        # Once the reply is sent, the next call runs the method again.
+        assert my_thing.get_status("laser") == "laser status 3"
+        assert my_obj.runs == 3
+        my_thing.close_this_thing()
+        other_thing.close_this_thing()
+    finally:
+        _force_remote_server_stop(SERVER_ADDRESS)
+        my_server.join()
+
+
+def test_server_commands_with_invalid_arguments():
+    my_server = Server(SERVER_ADDRESS)
+    my_server.start()
+    my_server.add_object("my_obj", ClassWithoutLocks())
+    time.sleep(0.5)
+
+    try:
+        my_thing = Thing("my_obj", SERVER_ADDRESS)
+        with pytest.raises(RuntimeError, match="INVALID_RPC"):
+            my_thing._make_rpc_and_validate_response("_server", "get_object_methods")
+        with pytest.raises(RuntimeError, match="NO_SUCH_THING"):
+            my_thing._make_rpc_and_validate_response(
+                "_server", "get_object_methods", "free_cash"
+            )
+        # The server is still running.
+        assert my_thing.deposit(1) == 1
+        my_thing.close_this_thing()
+    finally:
+        _force_remote_server_stop(SERVER_ADDRESS)
+        my_server.join()
+
+
+def test_server_stats():
+    my_server = Server(SERVER_ADDRESS)
+    my_server.start()
+    my_server.add_object("wallet", ClassWithoutLocks())
+    my_server.add_object("secret", ClassWithLocks())
+    time.sleep(0.5)
+
+    try:
+        wallet = Thing("wallet", SERVER_ADDRESS)
+        wallet.deposit(10)
+        with pytest.raises(RuntimeError, match="Insufficient funds"):
+            wallet.withdraw(20)
+        writer = Thing("secret", SERVER_ADDRESS)
+        reader = Thing("secret", SERVER_ADDRESS)
+        writer.write_secret("hello")
+        with pytest.raises(RuntimeError, match="THING_IS_LOCKED"):
+            reader.read_secret()
+
+        stats = wallet._make_rpc_and_validate_response("_server", "get_stats")
+        assert stats["uptime"] > 0
+        idle = {"pending": 0, "waiting_for_lock": 0, "running": 0, "limit": None}
+        assert stats["queues"] == {
+            "wallet": {**idle, "peak": 1},
+            "secret": {**idle, "peak": 1},
+        }
+        deposit = stats["methods"]["wallet"]["deposit"]
+        assert (deposit["calls"], deposit["errors"]) == (1, 0)
+        assert deposit["bytes_in"] > 0 and deposit["bytes_out"] > 0
+        assert deposit["run_time"]["count"] == deposit["queue_time"]["count"] == 1
+        assert histogram_quantile(deposit["run_time"], 0.99) > 0
+        assert stats["methods"]["wallet"]["withdraw"]["errors"] == 1
+        read_secret = stats["methods"]["secret"]["read_secret"]
+        assert (read_secret["calls"], read_secret["locked_rejections"]) == (1, 1)
+        assert read_secret["run_time"]["count"] == 0
+
+        prometheus = format_prometheus(stats)
+        assert 'caniusethat_calls_total{object="wallet",method="deposit"} 1' in (
+            prometheus
+        )
+        assert 'caniusethat_locked_rejections_total{object="secret",' in prometheus
+        assert '_bucket{object="wallet",method="deposit",le="+Inf"} 1' in prometheus
+
+        writer.read_secret()
+        for thing in [wallet, writer, reader]:
+            thing.close_this_thing()
+    finally:
+        _force_remote_server_stop(SERVER_ADDRESS)
+        my_server.join()
+
+
+def test_bench_cli(capsys, monkeypatch):
+    my_server = Server(SERVER_ADDRESS)
+    my_server.start()
+    my_server.add_object("my_obj", ClassWithoutLocks())
+    time.sleep(0.5)
+
+    def bench(*options):
+        monkeypatch.setattr(
+            "sys.argv",
+            ["caniusethat", "bench", SERVER_ADDRESS, "my_obj", "deposit", *options],
+        )
+        run_cli()
+
+    try:
+        bench("--args", "[1]", "--concurrency", "2", "--duration", "0.3", "--json")
+        report = json.loads(capsys.readouterr().out)
+        assert report["concurrency"] == 2
+        assert report["calls"] > 0
+        assert report["errors"] == 0
+        assert my_server.get_stats()["methods"]["my_obj"]["deposit"]["calls"] == (
+            report["calls"]
+        )
+
+        for option, value in [
+            ("--concurrency", "0"),
+            ("--rate", "-1"),
+            ("--duration", "0"),
+            ("--payload-size", "-1"),
+        ]:
+            with pytest.raises(SystemExit):
+                bench(option, value)
+            assert "not a" in capsys.readouterr().err
+    finally:
+        _force_remote_server_stop(SERVER_ADDRESS)
+        my_server.join()
+
+
+def test_traced_calls(tmp_path):
+    server_tracer = Tracer(RingBufferSink(size=2), sample_rate=0)
+    my_server = Server(SERVER_ADDRESS, tracer=server_tracer)
+    my_server.start()
+    my_server.add_object("my_obj", ClassWithoutLocks())
+    time.sleep(0.5)
+
+    try:
+        thing_tracer = Tracer(JsonlFileSink(str(tmp_path / "traces.jsonl")))
+        traced_thing = Thing("my_obj", SERVER_ADDRESS, tracer=thing_tracer)
+        my_thing = Thing("my_obj", SERVER_ADDRESS)
+        assert traced_thing.deposit(10) == 10
+        assert my_thing.deposit(5) == 15
+        thing_tracer.sink.close()
+
+        # The client records every hop of its call, in order.
+        with open(tmp_path / "traces.jsonl") as traces_file:
+            traces = [json.loads(line) for line in traces_file]
+        deposit = [trace for trace in traces if trace["method"] == "deposit"]
+        assert len(deposit) == 1
+        assert list(deposit[0]["hops"]) == [
+            "thing_send",
+            "router_receive",
+            "dispatch",
+            "worker_start",
+            "worker_end",
+            "router_reply",
+            "thing_receive",
+        ]
+        timestamps = [deposit[0]["hops"][hop] for hop in HOPS]
+        assert timestamps == sorted(timestamps)
+
+        # The server only records the calls that are traced, or that it samples.
+        server_traces = my_thing._make_rpc_and_validate_response(
+            "_server", "get_traces"
+        )
+        assert [trace["request_id"] for trace in server_traces] == [
+            deposit[0]["request_id"]
+        ]
+        server_tracer.sample_rate = 1
+        my_thing.deposit(1)
+        my_thing.deposit(1)
+        my_thing.deposit(1)
+        assert len(my_server.get_traces()) == 2
+        assert len(my_server.get_traces(limit=1)) == 1
+        assert "thing_send" not in my_server.get_traces()[0]["hops"]
+
+        traced_thing.close_this_thing()
+        my_thing.close_this_thing()
+    finally:
+        _force_remote_server_stop(SERVER_ADDRESS)
+        my_server.join()
+
+
+def test_ring_buffer_sink_recent():
+    sink = RingBufferSink(size=5)
+    for request_id in range(3):
+        sink.record({"request_id": request_id})
+
+    def request_ids(traces):
+        return [trace["request_id"] for trace in traces]
+
+    assert request_ids(sink.recent()) == [0, 1, 2]
+    assert request_ids(sink.recent(2)) == [1, 2]
+    assert request_ids(sink.recent(5)) == [0, 1, 2]
+    assert sink.recent(0) == []
+
+
+def test_rate_limiter_forgets_idle_clients(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    monkeypatch.setattr(_RateLimiter, "_MAX_CLIENTS", 3)
+    limiter = _RateLimiter(rate=2)
+
+    assert [limiter.allow(b"a") for _ in range(3)] == [True, True, False]
+    now[0] = 0.5
+    assert limiter.allow(b"b") and limiter.allow(b"b")
+    assert list(limiter.buckets) == [b"a", b"b"]
+
+    # Once refilled, the bucket of an idle client is dropped, the others are kept.
+    now[0] = 1.1
+    assert limiter.allow(b"c")
+    assert list(limiter.buckets) == [b"b", b"c"]
+
+    # Above the limit, the clients that made no call for the longest are dropped.
+    for client in [b"d", b"e"]:
+        assert limiter.allow(client)
+    assert list(limiter.buckets) == [b"c", b"d", b"e"]
+    assert limiter.allow(b"b")
+    assert list(limiter.buckets) == [b"d", b"e", b"b"]
+
+
+def test_router_does_not_unpickle_payload():
+    my_server = Server(SERVER_ADDRESS)
+    my_server.start()
+    my_server.add_object("my_obj", ClassWithoutLocks())
+    time.sleep(0.5)
+
+    my_thing = Thing("my_obj", SERVER_ADDRESS)
+    # The router rejects the call by looking at the header alone.
+    with pytest.raises(RuntimeError, match="NO_SUCH_METHOD"):
+        my_thing._make_rpc_and_validate_response(
+            "my_obj", "free_cash", UnpicklableArgument()
+        )
+    # The worker is the one that unpickles the arguments.
+    with pytest.raises(RuntimeError, match="INVALID_RPC"):
+        my_thing.deposit(UnpicklableArgument())
+    assert my_thing.deposit(3) == 3
+    my_thing.close_this_thing()
+
+    _force_remote_server_stop(SERVER_ADDRESS)
+
+    my_server.join()
+
+
+def test_large_buffers_are_sent_out_of_band():
+    data = b"x" * OUT_OF_BAND_THRESHOLD
+    frames = prepare_rpc_frames("my_obj", "echo", (data,), {})
+    # Header, pickle and the buffer itself, which is not copied.
+    assert len(frames) == 3
+    assert frames[2].obj is data
+
+    my_server = Server(SERVER_ADDRESS)
+    my_server.start()
+    my_server.add_object("my_obj", ClassWithBuffers())
+    time.sleep(0.5)
+
+    my_thing = Thing("my_obj", SERVER_ADDRESS)
+    size = 10 * OUT_OF_BAND_THRESHOLD
+    for value in (bytes(size), bytearray(b"y" * size), memoryview(b"z" * size)):
+        echoed = my_thing.echo(value)
+        assert type(echoed) is type(value)
+        assert echoed == value
+    my_thing.close_this_thing()
+
+    _force_remote_server_stop(SERVER_ADDRESS)
+
+    my_server.join()
+
+
+def test_replies_do_not_share_writable_buffers():
+    data = b"x" * OUT_OF_BAND_THRESHOLD
+    live = bytearray(OUT_OF_BAND_THRESHOLD)
+    frozen = _freeze_mutable_buffers([memoryview(data), memoryview(live)])
+    # Read-only buffers are sent as they are, writable ones are copied.
+    assert frozen[0].obj is data
+    live[0] = 1
+    assert frozen[1][0] == 0
+
+
+def test_numpy_arrays_are_sent_out_of_band():
+    np = pytest.importorskip("numpy")
+
+    my_server = Server(SERVER_ADDRESS)
+    my_server.start()
+    my_server.add_object("my_obj", ClassWithBuffers())
+    time.sleep(0.5)
+
+    my_thing = Thing("my_obj", SERVER_ADDRESS)
+    array = np.arange(1_000_000, dtype=np.float64)
+    assert np.array_equal(my_thing.echo(array), array)
+    my_thing.close_this_thing()
+
+    _force_remote_server_stop(SERVER_ADDRESS)
+
+    my_server.join()
+
+
+def test_msgpack_serializer_negotiation():
+    pytest.importorskip("msgpack")
+
+    my_server = Server(SERVER_ADDRESS, serializers=["msgpack"])
+    my_server.start()
+    my_server.add_object("my_obj", ClassWithBuffers())
+    time.sleep(0.5)
+
+    try:
+        # Pickle is not accepted by this server, so the negotiation picks msgpack.
+        my_thing = Thing("my_obj", SERVER_ADDRESS, serializers=["pickle", "msgpack"])
+        assert my_thing._serializer == "msgpack"
+        value = {"numbers": [1, 2.5], "pair": (3, "four"), 5: b"six", "none": None}
+        assert my_thing.echo(value) == value
+        assert type(my_thing.echo((1, 2))) is tuple
+        with pytest.raises(TypeError, match="Cannot serialize"):
+            my_thing.echo(object())
+        my_thing.close_this_thing()
+
+        with pytest.raises(RuntimeError, match="INVALID_RPC"):
+            Thing("my_obj", SERVER_ADDRESS)
+
+        # Invalid calls are answered with the serializer named in their header.
+        socket = zmq.Context.instance().socket(zmq.REQ)
+        socket.connect(SERVER_ADDRESS)
+        header = encode_rpc_header(
+            RemoteProcedureHeader("_server", "get_object_methods", 0, "msgpack")
+        )
+        socket.send_multipart([header, b"not msgpack"])
+        with pytest.raises(RuntimeError, match="INVALID_RPC"):
+            validate_rpc_response(socket.recv_multipart(), "msgpack")
+        socket.close(linger=0)
+    finally:
+        # Stopping the server is allowed with the default serializer.
+        _force_remote_server_stop(SERVER_ADDRESS)
+        my_server.join()
+
+
+def test_msgpack_extensions():
+    pytest.importorskip("msgpack")
+
+    serializer = get_serializer("msgpack")
+    serializer.register_extension(
+        16, complex, lambda c: [c.real, c.imag], lambda v: complex(*v)
+    )
+    assert serializer.loads(serializer.dumps([1 + 2j])) == [1 + 2j]
+    with pytest.raises(ValueError, match="already in use"):
+        serializer.register_extension(16, set, list, set)
+
+    error = serializer.loads(serializer.dumps(TypeError("bad type")))
+    assert type(error) is TypeError and str(error) == "bad type"